@@ -8,76 +8,186 @@ import pandas as pd
 import numpy as np
 import os
 import re
+import sys
 import datetime
 from datetime import datetime
 
-def read_raw_data(filepath):
-    """Lee los datos crudos desde el archivo CSV"""
+from deduplication import remove_duplicates
+from hospital_linkage import link_hospital, link_hospitals
+from validation import validate_raw_data
+
+# Módulos que viven junto a los datos limpios (cohorte particionada)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '3.cleaned_data'))
+from partitioned_cohort import write_partitioned  # noqa: E402
+from run_outputs import atomic_write, finish_run, prune_runs, start_run, write_text_atomic  # noqa: E402
+from quantile_sketch import build_sketch_set, query_split, query_summary, rank_error  # noqa: E402
+
+# Esquema de columnas del export crudo -> nombres internos del pipeline
+COLUMN_MAPPING = {
+    'NUM INFORME': 'n_informe',
+    'FECHA_LLAMADA': 'fecha',
+    'EDAD': 'edad',
+    'SEXO': 'sexo',
+    'RCP_TRANSTELEFONICA': 'rcp_transtelefonica',
+    'DESA_EXTERNO': 'desa_externo',
+    'RCP_TESTIGOS': 'rcp_testigos',
+    'C0_C1': 'tiempo_c0_c1',
+    'C1_C2': 'tiempo_c1_c2',
+    'C2_C3': 'tiempo_c2_c3',
+    'C3_C4': 'tiempo_rcp',
+    'RITMO INICIAL': 'ritmo_inicial',
+    'ROSC': 'rosc',
+    '7 DIAS': 'supervivencia_7dias',
+    'CPC': 'cpc',
+    'Tipo de Unidad': 'tipo_unidad',
+    'CONSULTA': 'consulta',
+    'ANTECEDENTES': 'antecedentes',
+    'TECNICAS': 'tecnicas',
+    'EVOLUCION': 'evolucion',
+    'HOSPITAL': 'hospital',
+    '6 HORAS': '6_horas',
+    '24 HORAS': '24_horas',
+    '7 DIAS': '7_dias'
+}
+
+# Columnas de texto libre que se pasan a minúsculas para facilitar búsquedas
+TEXT_COLUMNS = ['consulta', 'antecedentes', 'tecnicas', 'evolucion', 'hospital', '6_horas', '24_horas', '7_dias']
+
+# Columnas booleanas que se estandarizan a 1/0
+BOOLEAN_COLUMNS = ['rcp_transtelefonica', 'desa_externo', 'rcp_testigos', 'rosc']
+
+# Palabras clave de las reglas clínicas (ver Reglas_exclusion.md)
+TRAUMATIC_KEYWORDS = [
+    'ahogamiento', 'herida', 'precipitad', 'arma', 'trauma', 'accident', 
+    'colision', 'choque', 'atropell', 'caida', 'casual', 'autolisis', 
+    'autolit', 'suicid', 'defenestr', 'ahorcad', 'sumersion', 'quemad', 
+    'incendio', 'moto', 'motocicle', 'trafico'
+]
+BOMBERO_KEYWORDS = ['bombero', '080', 'beta']
+POLICIA_KEYWORDS = ['092', '091', '062', 'agente', 'municipal', 'nacional', 'policia']
+SANITARIO_KEYWORDS = ['tes', 'svb', 'basica', 'upr', 'basico', 'sanitario', 'personal hospital', 
+                      'socorrista', 'enfermera', 'medico', 'doctor', 'enfermero', 'facultativo']
+ROSC_KEYWORDS = ['rosc', 'recupera', 'recuperación', 'circulación espontánea', 'pulso', 'ritmo']
+EXITUS_KEYWORDS = ['exitus', 'fallec', 'éxitus', 'exito', 'muerte', 'muerto', 'fallido']
+
+# Listas de palabras clave por nombre; las funciones de reglas aceptan un dict
+# con el mismo formato para sustituir alguna lista (análisis "what-if")
+KEYWORD_LISTS = {
+    'trauma': TRAUMATIC_KEYWORDS,
+    'bombero': BOMBERO_KEYWORDS,
+    'policia': POLICIA_KEYWORDS,
+    'sanitario': SANITARIO_KEYWORDS,
+    'rosc': ROSC_KEYWORDS,
+    'exitus': EXITUS_KEYWORDS,
+}
+
+# Decisiones metodológicas de la limpieza; merge_svb_sva, process_data y
+# clean_record aceptan un dict con el mismo formato para sustituir alguna
+# (análisis de sensibilidad, rcp_analysis.sensitivity)
+CLEANING_RULES = {
+    # Ventana de emparejamiento SVA/SVB (horas antes y después del SVA)
+    'ventana_svb_sva_horas': 2,
+    # Tipo asignado a la RCP de testigos cuyo respondiente no se identifica
+    'respondiente_desconocido': 'lego',
+    # CPC de un superviviente a 7 días sin CPC explícito en el texto
+    'cpc_superviviente_sin_dato': np.nan,
+}
+
+def _rule(rules, name):
+    """Valor de una regla: el del dict rules si lo sustituye, si no el de CLEANING_RULES"""
+    return (rules or {}).get(name, CLEANING_RULES[name])
+
+# Columnas finales (y su orden) del dataset procesado
+FINAL_COLUMNS = [
+    'n_informe', 'fecha', 'edad', 'sexo', 'rcp_transtelefonica', 'tipo_respondiente',
+    'tiempo_llegada', 'desa_externo', 'ritmo_desfibrilable', 'tiempo_rcp',
+    'rosc', 'supervivencia_7dias', 'cpc', 'hospital_codigo'
+]
+
+# Campos principales del informe de anomalías (sin hospital_codigo, que
+# queda vacío en todos los casos sin traslado)
+MAIN_COLUMNS = [
+    'n_informe', 'fecha', 'edad', 'sexo', 'rcp_transtelefonica', 'tipo_respondiente',
+    'tiempo_llegada', 'desa_externo', 'ritmo_desfibrilable', 'tiempo_rcp',
+    'rosc', 'supervivencia_7dias', 'cpc'
+]
+
+def read_raw_data(filepath, validation_dir=None):
+    """
+    Lee los datos crudos desde el archivo CSV y los valida (validation.py).
+    Las filas con errores se apartan; si se indica validation_dir se guardan
+    ahí la cuarentena y el resumen de la validación.
+    """
     print(f"📂 Leyendo datos desde: {filepath}")
     data = pd.read_csv(filepath, delimiter=';')
     
     # Renombrar columnas para facilitar el procesamiento
-    column_mapping = {
-        'NUM INFORME': 'n_informe',
-        'FECHA_LLAMADA': 'fecha',
-        'EDAD': 'edad',
-        'SEXO': 'sexo',
-        'RCP_TRANSTELEFONICA': 'rcp_transtelefonica',
-        'DESA_EXTERNO': 'desa_externo',
-        'RCP_TESTIGOS': 'rcp_testigos',
-        'C0_C1': 'tiempo_c0_c1',
-        'C1_C2': 'tiempo_c1_c2',
-        'C2_C3': 'tiempo_c2_c3',
-        'C3_C4': 'tiempo_rcp',
-        'RITMO INICIAL': 'ritmo_inicial',
-        'ROSC': 'rosc',
-        '7 DIAS': 'supervivencia_7dias',
-        'CPC': 'cpc',
-        'Tipo de Unidad': 'tipo_unidad',
-        'CONSULTA': 'consulta',
-        'ANTECEDENTES': 'antecedentes',
-        'TECNICAS': 'tecnicas',
-        'EVOLUCION': 'evolucion',
-        'HOSPITAL': 'hospital',
-        '6 HORAS': '6_horas',
-        '24 HORAS': '24_horas',
-        '7 DIAS': '7_dias'
-    }
-    
-    data = data.rename(columns=column_mapping)
+    data = data.rename(columns=COLUMN_MAPPING)
+    
+    # Validar tipos, rangos, valores y fechas antes de tocar nada
+    quarantine_path = os.path.join(validation_dir, 'cuarentena_registros.csv') if validation_dir else None
+    total_export = len(data)
+    data, resumen_validacion = validate_raw_data(data, quarantine_path=quarantine_path)
+    # Recuentos del export original para el resumen de exclusión
+    data.attrs['total_export'] = total_export
+    data.attrs['en_cuarentena'] = total_export - len(data)
+    if validation_dir:
+        resumen_validacion.to_csv(os.path.join(validation_dir, 'validacion_export.csv'), index=False)
     
     # Convertir columnas de texto a minúsculas para facilitar búsquedas
-    text_columns = ['consulta', 'antecedentes', 'tecnicas', 'evolucion', 'hospital', '6_horas', '24_horas', '7_dias']
-    for col in text_columns:
+    for col in TEXT_COLUMNS:
         if col in data.columns:
             data[col] = data[col].astype(str).str.lower()
     
-    print(f"✅ Datos cargados: {len(data)} registros iniciales")
+    print(f"✅ Datos cargados: {len(data)} registros iniciales ({data.attrs['en_cuarentena']} en cuarentena)")
     return data
 
+def normalize_raw_record(raw):
+    """
+    Equivalente de read_raw_data para un único registro (dict con las
+    columnas del export crudo). Igual que al leer el CSV, los valores vacíos
+    se tratan como NaN y los textos numéricos se convierten a número; la
+    fecha se convierte a datetime.
+    """
+    record = {}
+    for col, value in raw.items():
+        name = COLUMN_MAPPING.get(col, col)
+        if value is None or (isinstance(value, str) and value.strip() == ''):
+            value = np.nan
+        elif isinstance(value, str) and name not in TEXT_COLUMNS:
+            for cast in (int, float):
+                try:
+                    value = cast(value)
+                    break
+                except ValueError:
+                    continue
+        record[name] = value
+    
+    for col in TEXT_COLUMNS:
+        if col in record:
+            record[col] = str(record[col]).lower()
+    
+    record['fecha'] = pd.to_datetime(record.get('fecha', np.nan), errors='coerce')
+    return pd.Series(record, dtype=object)
+
+def parse_boolean(value):
+    """Convierte un valor booleano del export ('verdadero', 'true', 1...) a 1/0"""
+    return 1 if (pd.notna(value) and str(value).lower() in ['verdadero', 'true', '1', '1.0']) else 0
+
 def process_boolean_columns(data):
     """Procesa columnas booleanas para estandarizarlas a 1/0"""
-    boolean_columns = ['rcp_transtelefonica', 'desa_externo', 'rcp_testigos', 'rosc']
-    
-    for col in boolean_columns:
+    for col in BOOLEAN_COLUMNS:
         if col in data.columns:
             # Primero reemplazamos valores de texto conocidos
-            data[col] = data[col].apply(
-                lambda x: 1 if (pd.notna(x) and str(x).lower() in ['verdadero', 'true', '1', '1.0']) else 0
-            )
+            data[col] = data[col].apply(parse_boolean)
             # Aseguramos que son enteros
             data[col] = data[col].astype(int)
     
     return data
 
-def is_traumatic(row):
+def is_traumatic(row, keywords=None):
     """Determina si un caso es de origen traumático"""
-    traumatic_keywords = [
-        'ahogamiento', 'herida', 'precipitad', 'arma', 'trauma', 'accident', 
-        'colision', 'choque', 'atropell', 'caida', 'casual', 'autolisis', 
-        'autolit', 'suicid', 'defenestr', 'ahorcad', 'sumersion', 'quemad', 
-        'incendio', 'moto', 'motocicle', 'trafico'
-    ]
+    traumatic_keywords = (keywords or {}).get('trauma', TRAUMATIC_KEYWORDS)
     
     # Buscar palabras clave en consulta
     consulta = str(row.get('consulta', '')).lower()
@@ -88,7 +198,7 @@ def is_traumatic(row):
     
     return False
 
-def identify_responder_type(row):
+def identify_responder_type(row, keywords=None, rules=None):
     """Identifica el tipo de respondiente de RCP"""
     if row['rcp_testigos'] == 0:
         return ''
@@ -102,10 +212,10 @@ def identify_responder_type(row):
         return 'lego'
     
     # Palabras clave para identificar tipo de respondiente
-    bombero_keywords = ['bombero', '080', 'beta']
-    policia_keywords = ['092', '091', '062', 'agente', 'municipal', 'nacional', 'policia']
-    sanitario_keywords = ['tes', 'svb', 'basica', 'upr', 'basico', 'sanitario', 'personal hospital', 
-                         'socorrista', 'enfermera', 'medico', 'doctor', 'enfermero', 'facultativo']
+    keywords = keywords or {}
+    bombero_keywords = keywords.get('bombero', BOMBERO_KEYWORDS)
+    policia_keywords = keywords.get('policia', POLICIA_KEYWORDS)
+    sanitario_keywords = keywords.get('sanitario', SANITARIO_KEYWORDS)
     
     # Comprobar por tipo de respondiente
     for keyword in bombero_keywords:
@@ -121,14 +231,17 @@ def identify_responder_type(row):
             return 'sanitario'
     
     # Si hay RCP por testigos pero no se identifica el tipo, asumimos lego
-    return 'lego'
+    # (regla 'respondiente_desconocido')
+    return _rule(rules, 'respondiente_desconocido')
 
 def classify_initial_rhythm(rhythm_str):
     """Clasifica el ritmo inicial como desfibrilable (1) o no desfibrilable (0)"""
-    if pd.isna(rhythm_str) or rhythm_str == '' or rhythm_str.lower() == 'nan':
+    if pd.isna(rhythm_str):
         return np.nan
     
-    rhythm_str = str(rhythm_str).lower()
+    rhythm_str = str(rhythm_str).strip().lower()
+    if rhythm_str in ('', 'nan'):
+        return np.nan
     desfibrilable = [
         'fv', 'tv', 'fibrilacion ventricular', 'taquicardia ventricular',
         'fibrilación', 'fibrila', 'tv sin pulso', 'ventricular'
@@ -140,7 +253,7 @@ def classify_initial_rhythm(rhythm_str):
     
     return 0
 
-def determine_rosc_and_rcp_time(row):
+def determine_rosc_and_rcp_time(row, keywords=None):
     """
     Determina ROSC y tiempo de RCP según las nuevas reglas:
     - Si hay hospital entonces el ROSC es 1
@@ -166,8 +279,8 @@ def determine_rosc_and_rcp_time(row):
     combined_text = tecnicas_text + " " + evolucion_text
     
     # Palabras clave que indican ROSC
-    rosc_keywords = ['rosc', 'recupera', 'recuperación', 'circulación espontánea', 'pulso', 'ritmo']
-    exitus_keywords = ['exitus', 'fallec', 'éxitus', 'exito', 'muerte', 'muerto', 'fallido']
+    rosc_keywords = (keywords or {}).get('rosc', ROSC_KEYWORDS)
+    exitus_keywords = (keywords or {}).get('exitus', EXITUS_KEYWORDS)
     
     # Buscar si hay palabras clave que indiquen ROSC
     for keyword in rosc_keywords:
@@ -222,7 +335,7 @@ def determine_rosc_and_rcp_time(row):
     
     return rosc, tiempo_rcp
 
-def determine_survival_and_cpc(row):
+def determine_survival_and_cpc(row, rules=None):
     """Determina supervivencia y CPC basado en los campos disponibles"""
     supervivencia = 0
     cpc = 5
@@ -258,17 +371,19 @@ def determine_survival_and_cpc(row):
                     cpc = int(match.group(1))
                     break
         
-        # Si CPC es 5 pero el paciente sobrevivió, ajustamos a valores entre 1-4
-        if cpc == 5:
-            cpc = np.nan
+        # Superviviente sin CPC explícito (regla 'cpc_superviviente_sin_dato', NaN por defecto)
+        if cpc == 5 or pd.isna(cpc):
+            cpc = _rule(rules, 'cpc_superviviente_sin_dato')
     
     return supervivencia, cpc
 
 def calculate_arrival_time(row):
-    """Calcula el tiempo total de llegada sumando los tiempos parciales"""
+    """
+    Calcula el tiempo total de llegada sumando los tiempos parciales.
+    Un parcial vacío cuenta como 0; uno no numérico deja el total en NaN.
+    """
     time_cols = ['tiempo_c0_c1', 'tiempo_c1_c2', 'tiempo_c2_c3']
     
-    # Convertir posibles valores no numéricos a NaN
     times = []
     for col in time_cols:
         if col in row:
@@ -276,11 +391,40 @@ def calculate_arrival_time(row):
                 val = float(row[col]) if not pd.isna(row[col]) else 0
                 times.append(val)
             except (ValueError, TypeError):
-                times.append(0)
+                return np.nan
     
     return sum(times)
 
-def merge_svb_sva(data):
+def merge_svb_into_sva(sva_row, svb_row):
+    """
+    Fusiona un registro SVB emparejado sobre su registro SVA:
+    - Si el SVB tiene RCP transtelefónica, prima esa
+    - El resto de campos prioriza SVA, usando SVB solo si SVA está vacío
+    """
+    merged_row = sva_row.copy()
+    
+    # Fusionar datos dando preferencia a SVA, excepto rcp_transtelefonica
+    if svb_row['rcp_transtelefonica'] == 1:
+        merged_row['rcp_transtelefonica'] = 1
+    
+    # Para campos vacíos en SVA, usar datos de SVB
+    for col in merged_row.index:
+        if col in svb_row and pd.isna(merged_row[col]) and not pd.isna(svb_row[col]):
+            merged_row[col] = svb_row[col]
+    
+    # Asegurar que valores booleanos son enteros
+    for col in BOOLEAN_COLUMNS:
+        if col in merged_row and pd.notna(merged_row[col]):
+            if isinstance(merged_row[col], str):
+                # Convertir string a booleano y luego a entero
+                merged_row[col] = parse_boolean(merged_row[col])
+            else:
+                # Si no es string, convertir directamente a entero
+                merged_row[col] = int(float(merged_row[col]))
+    
+    return merged_row
+
+def merge_svb_sva(data, rules=None):
     """Fusiona registros SVB y SVA basados en fecha/hora"""
     print("\n🔄 FUSIÓN DE REGISTROS SVB Y SVA")
     
@@ -305,8 +449,8 @@ def merge_svb_sva(data):
     print(f"   • Registros SVB: {len(svb_records)}")
     print(f"   • Otros tipos: {len(otros_records)}")
     
-    # Crear ventanas de tiempo para matching (2 horas antes y después)
-    time_window = pd.Timedelta(hours=2)
+    # Crear ventanas de tiempo para matching (2 horas antes y después por defecto)
+    time_window = pd.Timedelta(hours=_rule(rules, 'ventana_svb_sva_horas'))
     
     # Resultados de la fusión
     merged_records = []
@@ -336,29 +480,9 @@ def merge_svb_sva(data):
             
             # Si la diferencia es menor a 2 horas, considerar como match
             if best_match['time_diff'] <= time_window:
-                merged_row = sva_row.copy()
+                merged_row = merge_svb_into_sva(sva_row, best_match)
                 svb_id = best_match['n_informe']
                 
-                # Fusionar datos dando preferencia a SVA, excepto rcp_transtelefonica
-                if best_match['rcp_transtelefonica'] == 1:
-                    merged_row['rcp_transtelefonica'] = 1
-                
-                # Para campos vacíos en SVA, usar datos de SVB
-                for col in merged_row.index:
-                    if pd.isna(merged_row[col]) and not pd.isna(best_match[col]):
-                        merged_row[col] = best_match[col]
-                
-                # Asegurar que valores booleanos son enteros
-                boolean_columns = ['rcp_transtelefonica', 'desa_externo', 'rcp_testigos', 'rosc']
-                for col in boolean_columns:
-                    if col in merged_row and pd.notna(merged_row[col]):
-                        if isinstance(merged_row[col], str):
-                            # Convertir string a booleano y luego a entero
-                            merged_row[col] = 1 if merged_row[col].lower() in ['verdadero', 'true', '1', '1.0'] else 0
-                        else:
-                            # Si no es string, convertir directamente a entero
-                            merged_row[col] = int(float(merged_row[col]))
-                
                 merged_records.append(merged_row.to_dict())
                 matched_svb_ids.add(svb_id)
             else:
@@ -388,8 +512,12 @@ def merge_svb_sva(data):
     
     return merged_df
 
-def process_data(data):
-    """Proceso principal de limpieza y transformación de datos"""
+def process_data(data, keywords=None, rules=None):
+    """
+    Proceso principal de limpieza y transformación de datos. keywords y
+    rules permiten sustituir listas de KEYWORD_LISTS y reglas de
+    CLEANING_RULES.
+    """
     # Registrar conteos iniciales
     total_inicial = len(data)
     print(f"\n📊 ESTADÍSTICAS DE EXCLUSIÓN DE CASOS:")
@@ -414,7 +542,7 @@ def process_data(data):
     print(f"   • Registros después de filtrar por RCP transtelefónica: {len(data)}")
     
     # 3. Filtrar casos traumáticos
-    traumatic_cases = data.apply(is_traumatic, axis=1)
+    traumatic_cases = data.apply(is_traumatic, axis=1, keywords=keywords)
     excluidos_traumaticos = sum(traumatic_cases)
     estadisticas_exclusion['excluidos_traumaticos'] = excluidos_traumaticos
     non_traumatic_data = data[~traumatic_cases]
@@ -425,7 +553,8 @@ def process_data(data):
     non_traumatic_data.attrs['estadisticas_exclusion'] = estadisticas_exclusion
     
     # 4. Identificar tipo de respondiente de RCP
-    non_traumatic_data['tipo_respondiente'] = non_traumatic_data.apply(identify_responder_type, axis=1)
+    non_traumatic_data['tipo_respondiente'] = non_traumatic_data.apply(identify_responder_type, axis=1,
+                                                                       keywords=keywords, rules=rules)
     
     # 5. Clasificar ritmo inicial
     non_traumatic_data['ritmo_desfibrilable'] = non_traumatic_data['ritmo_inicial'].apply(classify_initial_rhythm)
@@ -434,7 +563,8 @@ def process_data(data):
     non_traumatic_data['tiempo_llegada'] = non_traumatic_data.apply(calculate_arrival_time, axis=1)
     
     # 7. Determinar ROSC y tiempo de RCP
-    rosc_rcp_time = non_traumatic_data.apply(determine_rosc_and_rcp_time, axis=1, result_type='expand')
+    rosc_rcp_time = non_traumatic_data.apply(determine_rosc_and_rcp_time, axis=1, result_type='expand',
+                                             keywords=keywords)
     non_traumatic_data['rosc'] = rosc_rcp_time[0].astype(int)  # Asegurar que ROSC sea entero
     
     # Actualizar tiempo de RCP si se calculó en la función
@@ -444,7 +574,7 @@ def process_data(data):
         lambda x: int(x) if not pd.isna(x) else np.nan)
     
     # 8. Determinar supervivencia y CPC
-    survival_cpc = non_traumatic_data.apply(determine_survival_and_cpc, axis=1, result_type='expand')
+    survival_cpc = non_traumatic_data.apply(determine_survival_and_cpc, axis=1, result_type='expand', rules=rules)
     non_traumatic_data['supervivencia_7dias'] = survival_cpc[0].astype(int)  # Asegurar que sea entero
     non_traumatic_data['cpc'] = survival_cpc[1].apply(lambda x: int(x) if not pd.isna(x) else x)
     
@@ -471,26 +601,72 @@ def process_data(data):
         if col in non_traumatic_data.columns:
             non_traumatic_data[col] = non_traumatic_data[col].fillna(0).astype(int)  # Valores NaN como 0
     
+    # 14. Enlazar el hospital receptor con la lista canónica (hospital_linkage.py)
+    if 'hospital' in non_traumatic_data.columns:
+        non_traumatic_data['hospital_codigo'] = link_hospitals(non_traumatic_data['hospital'])['hospital_codigo']
+    
     return non_traumatic_data
 
+def clean_record(row, keywords=None, rules=None):
+    """
+    Aplica a un único registro (ya renombrado y, si procede, fusionado con su
+    SVB) las mismas reglas que process_data. keywords y rules permiten
+    sustituir alguna de las listas de KEYWORD_LISTS o reglas de CLEANING_RULES.
+    
+    Devuelve (registro_limpio, motivo_exclusion): el registro limpio es un
+    dict con FINAL_COLUMNS, o None si el caso se excluye (motivo 'trauma').
+    """
+    row = row.copy()
+    
+    # 1. Columnas booleanas (los valores ausentes cuentan como 0, igual que en lote)
+    for col in BOOLEAN_COLUMNS:
+        row[col] = parse_boolean(row.get(col, np.nan))
+    
+    # 2. Excluir casos traumáticos
+    if is_traumatic(row, keywords):
+        return None, 'trauma'
+    
+    # 3. Variables derivadas
+    row['tipo_respondiente'] = identify_responder_type(row, keywords, rules)
+    row['ritmo_desfibrilable'] = classify_initial_rhythm(row.get('ritmo_inicial', np.nan))
+    row['tiempo_llegada'] = calculate_arrival_time(row)
+    
+    rosc, tiempo_rcp = determine_rosc_and_rcp_time(row, keywords)
+    row['rosc'] = int(rosc)
+    row['tiempo_rcp'] = tiempo_rcp
+    
+    supervivencia, cpc = determine_survival_and_cpc(row, rules)
+    row['supervivencia_7dias'] = int(supervivencia)
+    row['cpc'] = cpc
+    row['hospital_codigo'] = link_hospital(row.get('hospital', np.nan))[0]
+    
+    # 4. Enteros naturales, manteniendo NaN donde corresponda
+    for col in ['edad', 'tiempo_rcp', 'tiempo_llegada', 'ritmo_desfibrilable', 'cpc']:
+        value = pd.to_numeric(row.get(col, np.nan), errors='coerce')
+        row[col] = int(value) if not pd.isna(value) else np.nan
+    
+    record = {col: row.get(col, np.nan) for col in FINAL_COLUMNS}
+    return record, None
+
 def select_final_columns(data):
     """Selecciona y ordena las columnas finales para el dataset procesado"""
-    columns = [
-        'n_informe', 'fecha', 'edad', 'sexo', 'rcp_transtelefonica', 'tipo_respondiente',
-        'tiempo_llegada', 'desa_externo', 'ritmo_desfibrilable', 'tiempo_rcp',
-        'rosc', 'supervivencia_7dias', 'cpc'
-    ]
-    
     # Asegurar que solo se seleccionan columnas disponibles
-    available_columns = [col for col in columns if col in data.columns]
+    available_columns = [col for col in FINAL_COLUMNS if col in data.columns]
     return data[available_columns]
 
-def generate_summary_statistics(data):
-    """Genera estadísticas descriptivas del dataset procesado"""
+def generate_summary_statistics(data, sketches=None):
+    """
+    Genera estadísticas descriptivas del dataset procesado. Medianas, rangos,
+    IQR y la partición por la mediana salen de sketches KLL por grupo de RCP
+    y mes (quantile_sketch.py; se construyen aquí si no se pasan)
+    """
     print("\n" + "="*80)
     print("📊 RESUMEN ESTADÍSTICO - ANÁLISIS RCP TRANSTELEFÓNICA")
     print("="*80)
     
+    if sketches is None:
+        sketches = build_sketch_set(data)
+    
     # Tamaño del conjunto de datos
     total_casos = len(data)
     print(f"\n📋 TOTAL DE CASOS ANALIZADOS: {total_casos}")
@@ -590,15 +766,12 @@ def generate_summary_statistics(data):
     
     # Estadísticas de edad
     if 'edad' in data.columns:
-        edad_media = data['edad'].mean()
-        edad_mediana = data['edad'].median()
-        edad_min = data['edad'].min()
-        edad_max = data['edad'].max()
+        edad = query_summary(sketches, 'edad')
         
         print("\n👴 DISTRIBUCIÓN POR EDAD:")
-        print(f"   • Media: {edad_media:.1f} años")
-        print(f"   • Mediana: {edad_mediana:.1f} años")
-        print(f"   • Rango: {edad_min:.0f}-{edad_max:.0f} años")
+        print(f"   • Media: {edad['media']:.1f} años")
+        print(f"   • Mediana: {edad['mediana']:.1f} años (RIC {edad['p25']:.0f}-{edad['p75']:.0f})")
+        print(f"   • Rango: {edad['min']:.0f}-{edad['max']:.0f} años")
         
         # Calcular estadísticas de grupos de edad sin crear columnas permanentes
         edad_menor_65 = len(data[data['edad'] < 65])
@@ -614,16 +787,19 @@ def generate_summary_statistics(data):
     
     # Estadísticas de tiempo de llegada
     if 'tiempo_llegada' in data.columns:
-        tiempo_medio = data['tiempo_llegada'].mean()
-        tiempo_mediana = data['tiempo_llegada'].median()
+        tiempo = query_summary(sketches, 'tiempo_llegada')
+        tiempo_mediana = tiempo['mediana']
         
         print("\n⏱️ TIEMPO DE LLEGADA:")
-        print(f"   • Media: {tiempo_medio:.1f} segundos")
-        print(f"   • Mediana: {tiempo_mediana:.1f} segundos")
+        print(f"   • Media: {tiempo['media']:.1f} segundos")
+        print(f"   • Mediana: {tiempo_mediana:.1f} segundos (RIC {tiempo['p25']:.0f}-{tiempo['p75']:.0f})")
+        for grupo, etiqueta in ((1, 'Con RCP transtelefónica'), (0, 'Sin RCP transtelefónica')):
+            tiempo_grupo = query_summary(sketches, 'tiempo_llegada', group=grupo)
+            if tiempo_grupo['n'] > 0:
+                print(f"   • Mediana {etiqueta.lower()}: {tiempo_grupo['mediana']:.1f} segundos")
         
-        # Calcular estadísticas por tiempo sin crear columnas permanentes
-        tiempo_menor_mediana = len(data[data['tiempo_llegada'] < tiempo_mediana])
-        tiempo_mayor_igual_mediana = len(data[(data['tiempo_llegada'] >= tiempo_mediana) & (~data['tiempo_llegada'].isna())])
+        # Partición por la mediana a partir del sketch (sin volver a recorrer los datos)
+        tiempo_menor_mediana, tiempo_mayor_igual_mediana = query_split(sketches, 'tiempo_llegada', tiempo_mediana)
         total_con_tiempo = tiempo_menor_mediana + tiempo_mayor_igual_mediana
         
         print("\n   Estratificación por tiempo de llegada:")
@@ -633,10 +809,16 @@ def generate_summary_statistics(data):
             print(f"   • <mediana: {tiempo_menor_mediana} ({pct_menor:.1f}%)")
             print(f"   • ≥mediana: {tiempo_mayor_igual_mediana} ({pct_mayor:.1f}%)")
     
+    print(f"\n   (Medianas y cuartiles interpolados como pandas: exactos hasta {sketches['k']} valores, "
+          f"después error de rango ≤ {rank_error(sketches['k']) * 100:.1f}%)")
     print("\n" + "="*80)
 
 def save_output(data, output_dir):
-    """Guarda los datos procesados en formatos CSV y Excel"""
+    """
+    Guarda los datos procesados en formatos CSV y Excel (cada fichero con
+    escritura atómica). main() escribe en el directorio de su ejecución y
+    después publica (run_outputs).
+    """
     os.makedirs(output_dir, exist_ok=True)
     
     # Eliminar columnas de estratificación que son para análisis, no para datos brutos
@@ -657,20 +839,31 @@ def save_output(data, output_dir):
             else:
                 data[col] = data[col].astype(int)
     # Guardar sin floats
-    data.to_csv(csv_path, index=False)
-    data.to_excel(excel_path, index=False)
+    with atomic_write(csv_path) as tmp_path:
+        data.to_csv(tmp_path, index=False)
+    with atomic_write(excel_path) as tmp_path:
+        data.to_excel(tmp_path, index=False)
+    # Copia particionada por año/mes para cargar solo las fechas/columnas necesarias
+    partitioned_path = os.path.join(output_dir, 'cleaned_data')
+    manifest = write_partitioned(data, partitioned_path, source=csv_path)
     
     print(f"\n💾 Datos procesados guardados en:")
     print(f"   • CSV: {csv_path}")
     print(f"   • Excel: {excel_path}")
+    print(f"   • Particionado: {partitioned_path}/ ({len(manifest['ficheros'])} ficheros)")
 
-def generar_resumen_exclusion(datos_iniciales, datos_finales, estadisticas_unidades={}, estadisticas_exclusion={}):
-    """Genera un resumen del proceso de exclusión de datos"""
+def generar_resumen_exclusion(datos_iniciales, datos_finales, estadisticas_unidades={}, estadisticas_exclusion={},
+                              estadisticas_duplicados={}, total_export=None, en_cuarentena=0):
+    """
+    Genera un resumen del proceso de exclusión de datos. total_export es el
+    número de filas del export antes de la validación (por defecto, las de
+    datos_iniciales) y en_cuarentena las apartadas por validation.py.
+    """
     print("\n" + "="*80)
     print("📋 RESUMEN DEL PROCESO DE LIMPIEZA Y EXCLUSIÓN")
     print("="*80)
     
-    total_inicial = len(datos_iniciales)
+    total_inicial = total_export if total_export is not None else len(datos_iniciales)
     total_final = len(datos_finales)
     excluidos = total_inicial - total_final
     
@@ -681,6 +874,20 @@ def generar_resumen_exclusion(datos_iniciales, datos_finales, estadisticas_unida
     # Desglose de exclusiones por motivo
     print("\n📊 DESGLOSE DE EXCLUSIONES POR MOTIVO:")
     
+    # Cuarentena de validación (antes de cualquier otro paso)
+    if en_cuarentena > 0:
+        print(f"   • En cuarentena por validación: {en_cuarentena} ({(en_cuarentena / total_inicial) * 100:.1f}%)")
+    
+    # Duplicados (antes de la fusión SVA/SVB)
+    for clave, texto in [('filas_repetidas', 'Filas repetidas'), ('informes_repetidos', 'Nº de informe repetido'),
+                         ('casi_duplicados', 'Casi duplicados (misma llamada)')]:
+        n_dup = estadisticas_duplicados.get(clave, 0)
+        if n_dup > 0:
+            print(f"   • Por duplicado - {texto}: {n_dup} ({(n_dup / total_inicial) * 100:.1f}%)")
+    if estadisticas_duplicados.get('casi_duplicados_revisar', 0) > 0:
+        print(f"   • Posibles duplicados conservados para revisión manual: "
+              f"{estadisticas_duplicados['casi_duplicados_revisar']}")
+    
     # Exclusiones por RCP transtelefónica desconocida
     excluidos_rcp_trans = estadisticas_exclusion.get('excluidos_rcp_trans', 0)
     if excluidos_rcp_trans > 0:
@@ -690,7 +897,7 @@ def generar_resumen_exclusion(datos_iniciales, datos_finales, estadisticas_unida
     # Exclusiones por origen traumático
     excluidos_traumaticos = estadisticas_exclusion.get('excluidos_traumaticos', 0)
     if excluidos_traumaticos > 0:
-        pct_trauma = (excluidos_traumaticos / (total_inicial - excluidos_rcp_trans)) * 100
+        pct_trauma = (excluidos_traumaticos / (total_inicial - en_cuarentena - excluidos_rcp_trans)) * 100
         print(f"   • Por origen traumático: {excluidos_traumaticos} ({pct_trauma:.1f}%)")
     
     # Información sobre registros SVA y SVB
@@ -728,8 +935,16 @@ def generar_resumen_exclusion(datos_iniciales, datos_finales, estadisticas_unida
     
     print("="*80)
 
-def main():
-    """Función principal que coordina todo el proceso de limpieza y procesamiento"""
+def main(etiqueta=None, publicar=True):
+    """
+    Función principal que coordina todo el proceso de limpieza y procesamiento.
+
+    Las salidas se escriben en un directorio propio de la ejecución
+    (3.cleaned_data/ejecuciones/<run_id>, run_outputs) y al terminar se
+    publican de forma atómica en las rutas de siempre. etiqueta se añade al
+    run_id (región, escenario...); con publicar=False la ejecución queda solo
+    en su directorio.
+    """
     print("\n" + "="*80)
     print("🧹 PROCESAMIENTO DE DATOS - ESTUDIO RCP TRANSTELEFÓNICA")
     print("="*80)
@@ -740,35 +955,53 @@ def main():
     project_dir = os.path.dirname(os.path.dirname(script_dir))  # Subir dos niveles
     
     raw_data_path = os.path.join(project_dir, 'data', '1.raw_imported', 'rawdata_2year.csv')
-    output_dir = os.path.join(project_dir, 'data', '3.cleaned_data')
-    
-    # 1. Leer datos crudos
-    raw_data = read_raw_data(raw_data_path)
-    
-    # 2. Fusionar datos SVA y SVB
-    merged_data = merge_svb_sva(raw_data)
-    
-    # 3. Procesar datos
-    processed_data = process_data(merged_data)
-    
-    # Recopilar estadísticas de exclusión
-    estadisticas_unidades = merged_data.attrs.get('estadisticas_unidades', {})
-    estadisticas_exclusion = processed_data.attrs.get('estadisticas_exclusion', {})
-    
-    # 4. Seleccionar columnas finales
-    final_data = select_final_columns(processed_data)
-    
-    # 5. Generar estadísticas resumidas
-    generate_summary_statistics(final_data)
-    
-    # 6. Generar resumen de exclusión detallado
-    generar_resumen_exclusion(raw_data, final_data, estadisticas_unidades, estadisticas_exclusion)
+    output_root = os.path.join(project_dir, 'data', '3.cleaned_data')
+    run_id, output_dir = start_run(output_root, etiqueta)
+    print(f"📂 Ejecución {run_id}")
     
-    # 7. Guardar resultados
-    save_output(final_data, output_dir)
+    try:
+        # 1. Leer datos crudos
+        raw_data = read_raw_data(raw_data_path, validation_dir=output_dir)
+        
+        # 2. Eliminar duplicados (re-exportaciones, informes repetidos, misma llamada)
+        dedup_data = remove_duplicates(raw_data, report_dir=output_dir)
+        
+        # 3. Fusionar datos SVA y SVB
+        merged_data = merge_svb_sva(dedup_data)
+        
+        # 4. Procesar datos
+        processed_data = process_data(merged_data)
+        
+        # Recopilar estadísticas de exclusión
+        estadisticas_duplicados = dedup_data.attrs.get('estadisticas_duplicados', {})
+        estadisticas_unidades = merged_data.attrs.get('estadisticas_unidades', {})
+        estadisticas_exclusion = processed_data.attrs.get('estadisticas_exclusion', {})
+        
+        # 5. Seleccionar columnas finales
+        final_data = select_final_columns(processed_data)
+        
+        # 6. Generar estadísticas resumidas
+        generate_summary_statistics(final_data)
+        
+        # 7. Generar resumen de exclusión detallado
+        generar_resumen_exclusion(raw_data, final_data, estadisticas_unidades, estadisticas_exclusion,
+                                  estadisticas_duplicados, total_export=raw_data.attrs.get('total_export'),
+                                  en_cuarentena=raw_data.attrs.get('en_cuarentena', 0))
+        
+        # 8. Guardar resultados
+        save_output(final_data, output_dir)
 
-    # 8. Generar informe de anomalías para comprobación manual
-    generate_manual_check_report(final_data, output_dir)
+        # 9. Generar informe de anomalías para comprobación manual
+        generate_manual_check_report(final_data, output_dir)
+    except BaseException:
+        # La ejecución fallida no se publica (queda para revisión hasta que se limpie)
+        finish_run(output_root, run_id, publish=False)
+        raise
+
+    # 10. Publicar (el informe de anomalías va a la carpeta de limpieza, como antes)
+    finish_run(output_root, run_id, publish=publicar,
+               destinations={'informe_anomalias.md': os.path.join(script_dir, 'informe_anomalias.md')})
+    prune_runs(output_root)
 
     print("\n✅ Procesamiento completado con éxito")
     print("="*80)
@@ -791,10 +1024,7 @@ def generate_manual_check_report(data, output_dir):
 
     report_lines.append("\n## 2. Filas con 4 o más campos vacíos\n")
     # Contar nulos por fila (solo en columnas principales)
-    main_cols = ['n_informe', 'fecha', 'edad', 'sexo', 'rcp_transtelefonica', 'tipo_respondiente',
-                 'tiempo_llegada', 'desa_externo', 'ritmo_desfibrilable', 'tiempo_rcp',
-                 'rosc', 'supervivencia_7dias', 'cpc']
-    data_main = data[main_cols]
+    data_main = data[MAIN_COLUMNS]
     null_counts = data_main.isnull() | (data_main == '')
     mask_4plus_nulls = null_counts.sum(axis=1) >= 4
     rows_4plus_nulls = data[mask_4plus_nulls]
@@ -805,11 +1035,17 @@ def generate_manual_check_report(data, output_dir):
     else:
         report_lines.append("No se encontraron casos.\n")
 
-    # Guardar el informe en la carpeta de limpieza
-    report_path = os.path.join(output_dir, '../2.Data_cleaning/informe_anomalias.md')
-    with open(report_path, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(report_lines))
+    # Guardar el informe (main lo publica en la carpeta de limpieza)
+    report_path = os.path.join(output_dir, 'informe_anomalias.md')
+    write_text_atomic('\n'.join(report_lines), report_path)
     print(f"\n📝 Informe de anomalías guardado en: {report_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Limpieza y procesamiento de los datos de RCP transtelefónica')
+    parser.add_argument('--etiqueta', help='Etiqueta de la ejecución (región, escenario...)')
+    parser.add_argument('--no-publicar', action='store_true',
+                        help='Deja las salidas solo en el directorio de la ejecución')
+    args = parser.parse_args()
+    main(args.etiqueta, publicar=not args.no_publicar)
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Detección de registros duplicados antes de la fusión SVA/SVB.
+
+Tres niveles, todos en tiempo aproximadamente lineal (sin comparar todos los
+pares):
+
+1. fila_repetida: misma fila completa re-exportada (hash de todas las
+   columnas). Se elimina.
+2. informe_repetido: mismo n_informe con contenido distinto. Se conserva el
+   registro más completo y se eliminan los demás.
+3. casi_duplicado: la misma llamada registrada dos veces por unidades que no
+   forman un par SVA/SVB (esos pares los fusiona merge_svb_sva). Bloqueo por
+   (edad, sexo, franja de DUP_WINDOW) y franja contigua; solo los pares de
+   cada bloque a menos de DUP_WINDOW se puntúan:
+       0.4 · cercanía en el tiempo + 0.4 · similitud de 'consulta' (Jaccard
+       de palabras) + 0.2 · coincidencia de hospital y ritmo inicial
+   (los componentes sin dato se excluyen y se reparten los pesos).
+   Puntuación >= DROP_SCORE: se elimina el registro menos completo;
+   >= FLAG_SCORE: se marca para revisión manual y se conserva.
+
+Los registros sin edad o sin fecha no entran en el bloqueo de casi
+duplicados.
+"""
+
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '3.cleaned_data'))
+from run_outputs import atomic_write  # noqa: E402
+
+DUP_WINDOW = pd.Timedelta(minutes=30)
+DROP_SCORE = 0.8
+FLAG_SCORE = 0.5
+
+# Pesos de la puntuación de casi duplicados
+SCORE_WEIGHTS = {'tiempo': 0.4, 'texto': 0.4, 'otros': 0.2}
+
+_WORD = re.compile(r'\w{3,}')
+
+
+def _completeness(data):
+    """Nº de campos no vacíos por registro (desempate: el más completo se conserva)"""
+    filled = data.notna()
+    for col in data.columns[data.dtypes.map(lambda d: not pd.api.types.is_numeric_dtype(d))]:
+        filled[col] &= ~data[col].astype(str).str.strip().isin(['', 'nan'])
+    return filled.sum(axis=1)
+
+
+def _tokens(text):
+    text = '' if pd.isna(text) else str(text).lower()
+    return frozenset(_WORD.findall(text)) if text not in ('', 'nan') else None
+
+
+def _jaccard(a, b):
+    if a is None or b is None or not (a or b):
+        return np.nan
+    return len(a & b) / len(a | b)
+
+
+def _equal_or_nan(a, b):
+    """1/0 si ambos tienen dato, NaN si falta alguno"""
+    a = a.astype(str).str.strip().str.lower()
+    b = b.astype(str).str.strip().str.lower()
+    missing = a.isin(['', 'nan']) | b.isin(['', 'nan'])
+    return (a == b).astype(float).where(~missing)
+
+
+def candidate_pairs(data, window=DUP_WINDOW):
+    """
+    Pares candidatos a casi duplicado por bloqueo (edad, sexo, franja) con la
+    franja contigua. Devuelve DataFrame con las posiciones a < b y Δt.
+    """
+    fecha = pd.to_datetime(data['fecha'], errors='coerce')
+    unidad = data['tipo_unidad'].astype(str).str.strip().str.upper()
+    # Claves como enteros: el cruce y los filtros trabajan sobre arrays numéricos
+    keyed = pd.DataFrame({
+        'pos': np.arange(len(data)),
+        'edad': pd.to_numeric(data['edad'], errors='coerce').to_numpy(),
+        'sexo': pd.factorize(data['sexo'].astype(str).str.strip().str.lower())[0],
+        't': fecha.to_numpy().astype('datetime64[ns]').astype('int64'),
+        # 1 = SVA, 2 = SVB, 0 = otra unidad (un par SVA/SVB suma 3)
+        'unidad': np.select([unidad.eq('SVA'), unidad.eq('SVB')], [1, 2], 0),
+    })
+    keyed = keyed[keyed['edad'].notna().to_numpy() & fecha.notna().to_numpy()]
+    keyed['franja'] = keyed['t'] // window.value
+
+    blocks = []
+    for shift in (0, 1):
+        right = keyed.assign(franja=keyed['franja'] - shift)
+        pairs = keyed.merge(right, on=['edad', 'sexo', 'franja'], suffixes=('_a', '_b'))
+        if shift == 0:
+            pairs = pairs[pairs['pos_a'].to_numpy() < pairs['pos_b'].to_numpy()]
+        blocks.append(pairs[['pos_a', 'pos_b', 't_a', 't_b', 'unidad_a', 'unidad_b']].to_numpy())
+    pairs = np.concatenate(blocks)
+    pos_a, pos_b, t_a, t_b, unidad_a, unidad_b = pairs.T
+
+    dt = np.abs(t_a - t_b)
+    svb_sva = (unidad_a * unidad_b == 2)
+    keep = (dt <= window.value) & ~svb_sva
+    return pd.DataFrame({'a': np.minimum(pos_a, pos_b)[keep], 'b': np.maximum(pos_a, pos_b)[keep],
+                         'dt': pd.to_timedelta(dt[keep])}).drop_duplicates(['a', 'b']).reset_index(drop=True)
+
+
+def score_pairs(data, pairs, window=DUP_WINDOW):
+    """Puntuación 0-1 de cada par candidato"""
+    if pairs.empty:
+        return pairs.assign(puntuacion=pd.Series(dtype=float))
+    rows_a = data.iloc[pairs['a']].reset_index(drop=True)
+    rows_b = data.iloc[pairs['b']].reset_index(drop=True)
+
+    tiempo = 1 - pairs['dt'] / window
+    consulta_a = rows_a['consulta'].map(_tokens) if 'consulta' in data.columns else pd.Series([None] * len(pairs))
+    consulta_b = rows_b['consulta'].map(_tokens) if 'consulta' in data.columns else pd.Series([None] * len(pairs))
+    texto = pd.Series([_jaccard(x, y) for x, y in zip(consulta_a, consulta_b)], dtype=float)
+    otros = pd.concat([_equal_or_nan(rows_a[c], rows_b[c]) for c in ('hospital', 'ritmo_inicial') if c in data.columns],
+                      axis=1).mean(axis=1) if any(c in data.columns for c in ('hospital', 'ritmo_inicial')) \
+        else pd.Series(np.nan, index=pairs.index)
+
+    components = pd.DataFrame({'tiempo': tiempo, 'texto': texto, 'otros': otros})
+    weights = pd.Series(SCORE_WEIGHTS)
+    available = components.notna().mul(weights, axis=1)
+    score = components.fillna(0).mul(weights, axis=1).sum(axis=1) / available.sum(axis=1)
+    return pairs.assign(puntuacion=score.round(3))
+
+
+def remove_duplicates(data, window=DUP_WINDOW, drop_score=DROP_SCORE, flag_score=FLAG_SCORE, report_dir=None):
+    """
+    Elimina duplicados exactos, informes repetidos y casi duplicados.
+    Devuelve los datos sin duplicados con attrs['estadisticas_duplicados'];
+    si se indica report_dir guarda ahí duplicados_detectados.csv.
+    """
+    print("\n🔁 DETECCIÓN DE DUPLICADOS")
+    data = data.reset_index(drop=True)
+    ids = data['n_informe'] if 'n_informe' in data.columns else pd.Series(data.index)
+    decisions = []
+
+    def record(positions, reference, motivo, accion, puntuacion=np.nan):
+        for pos, ref in zip(positions, reference):
+            decisions.append({'n_informe': ids.iloc[pos], 'duplicado_de': ids.iloc[ref], 'motivo': motivo,
+                              'puntuacion': puntuacion,
+                              'accion': accion})
+
+    # 1. Filas repetidas (hash de la fila completa)
+    row_hash = pd.util.hash_pandas_object(data.astype(str), index=False)
+    first = pd.Series(data.index).groupby(row_hash.to_numpy()).transform('first').to_numpy()
+    repeated = np.flatnonzero(row_hash.duplicated().to_numpy())
+    record(repeated, first[repeated], 'fila_repetida', 'eliminado')
+    dropped = set(repeated)
+
+    # 2. Mismo n_informe con contenido distinto: se conserva el más completo
+    completeness = _completeness(data)
+    remaining = data.drop(index=list(dropped))
+    if 'n_informe' in data.columns:
+        same_id = remaining[remaining['n_informe'].notna() & remaining['n_informe'].duplicated(keep=False)]
+        for _, group in same_id.groupby('n_informe', sort=False):
+            keep = completeness.loc[group.index].idxmax()
+            others = [i for i in group.index if i != keep]
+            record(others, [keep] * len(others), 'informe_repetido', 'eliminado')
+            dropped.update(others)
+
+    # 3. Casi duplicados por bloqueo
+    n_candidates = 0
+    n_flagged = 0
+    if {'fecha', 'edad', 'sexo', 'tipo_unidad'} <= set(data.columns):
+        pairs = candidate_pairs(data, window)
+        pairs = pairs[~pairs['a'].isin(dropped) & ~pairs['b'].isin(dropped)]
+        n_candidates = len(pairs)
+        scored = score_pairs(data, pairs.reset_index(drop=True), window).sort_values('puntuacion', ascending=False)
+        for pair in scored.itertuples():
+            if pair.a in dropped or pair.b in dropped or pair.puntuacion < flag_score:
+                continue
+            # El menos completo es el duplicado (empate: el posterior)
+            dup, ref = (pair.a, pair.b) if completeness[pair.a] < completeness[pair.b] else (pair.b, pair.a)
+            if pair.puntuacion >= drop_score:
+                record([dup], [ref], 'casi_duplicado', 'eliminado', pair.puntuacion)
+                dropped.add(dup)
+            else:
+                record([dup], [ref], 'casi_duplicado', 'revisar', pair.puntuacion)
+                n_flagged += 1
+
+    decisions = pd.DataFrame(decisions, columns=['n_informe', 'duplicado_de', 'motivo', 'puntuacion', 'accion'])
+    eliminados = decisions[decisions['accion'] == 'eliminado']['motivo'].value_counts()
+    estadisticas = {
+        'filas_repetidas': int(eliminados.get('fila_repetida', 0)),
+        'informes_repetidos': int(eliminados.get('informe_repetido', 0)),
+        'casi_duplicados': int(eliminados.get('casi_duplicado', 0)),
+        'casi_duplicados_revisar': n_flagged,
+        'pares_candidatos': n_candidates,
+    }
+
+    print(f"   • Filas repetidas eliminadas: {estadisticas['filas_repetidas']}")
+    print(f"   • Informes repetidos eliminados: {estadisticas['informes_repetidos']}")
+    print(f"   • Casi duplicados eliminados: {estadisticas['casi_duplicados']} "
+          f"(de {n_candidates} pares candidatos; {n_flagged} marcados para revisión)")
+
+    if report_dir is not None and len(decisions):
+        path = os.path.join(report_dir, 'duplicados_detectados.csv')
+        with atomic_write(path) as tmp_path:
+            decisions.to_csv(tmp_path, index=False)
+        print(f"   💾 Detalle guardado en: {path}")
+
+    result = data.drop(index=sorted(dropped)).reset_index(drop=True)
+    print(f"✅ {len(result)} registros tras eliminar duplicados")
+    result.attrs['estadisticas_duplicados'] = estadisticas
+    return result
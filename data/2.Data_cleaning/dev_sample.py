@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Modo desarrollo: el pipeline de limpieza sobre una muestra estratificada del
+export, con proyección a la cohorte completa.
+
+Pensado para iterar sobre una regla de limpieza (palabras clave, ventanas,
+criterios de exclusión) sin pasar todo el registro por cleaning.main:
+
+1. Unidades de muestreo (conglomerados): registros que el pipeline trata
+   juntos no se separan nunca. Se unen el SVA con su SVB más cercano dentro
+   de la ventana de merge_svb_sva, los registros con el mismo n_informe y
+   los pares candidatos a casi duplicado de deduplication.candidate_pairs.
+2. Estratos: composición del conglomerado (SVA+SVB, SVA, SVB, otro) × mes
+   del aviso × RCP transtelefónica. En cada estrato se sortea una fracción
+   de conglomerados (al menos MIN_PER_STRATUM; censo si hay menos).
+3. Todas las etapas (lectura y validación, duplicados, fusión, procesado) se
+   ejecutan sobre la muestra y se miden.
+4. Proyección: totales de exclusión por etapa con el estimador de expansión
+   estratificado y sus errores estándar (conglomerados sin reposición, con
+   corrección por población finita); tasas de ROSC, supervivencia y CPC
+   favorable como estimadores de razón (linealización). El tiempo de la
+   ejecución completa se extrapola por etapa con el exponente de escala
+   medido entre la muestra y una submuestra de la mitad.
+
+Los registros sin n_informe no se pueden seguir entre etapas y quedan fuera
+de la proyección (se avisa de cuántos son).
+
+Uso:
+    python dev_sample.py                       # 10% del export por defecto
+    python dev_sample.py --fraccion 0.05 --semilla 7 --salida proyeccion_muestra.csv
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from cleaning import (
+    CLEANING_RULES,
+    COLUMN_MAPPING,
+    merge_svb_sva,
+    process_data,
+    read_raw_data,
+    select_final_columns,
+)
+from deduplication import candidate_pairs, remove_duplicates
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_DATA_PATH = os.path.join(os.path.dirname(SCRIPT_DIR), '1.raw_imported', 'rawdata_2year.csv')
+
+SAMPLE_FRACTION = 0.10
+MIN_PER_STRATUM = 2
+# Ventana de emparejamiento SVA/SVB de merge_svb_sva (la de CLEANING_RULES)
+PAIR_WINDOW = pd.Timedelta(hours=CLEANING_RULES['ventana_svb_sva_horas'])
+Z_95 = 1.959964
+
+TRUE_VALUES = ['verdadero', 'true', '1', '1.0']
+
+
+def _informe_key(values):
+    """n_informe como texto comparable entre etapas (12 y 12.0 son el mismo informe)"""
+    return values.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+
+def sampling_units(raw, window=PAIR_WINDOW):
+    """Conglomerado de cada registro del export (array de etiquetas, por posición)"""
+    n = len(raw)
+    fecha = pd.to_datetime(raw['fecha'], errors='coerce').to_numpy()
+    edges = []
+
+    # 1. SVA con su SVB más cercano, como en merge_svb_sva
+    is_sva = (raw['tipo_unidad'] == 'SVA').to_numpy() & ~pd.isna(fecha)
+    is_svb = (raw['tipo_unidad'] == 'SVB').to_numpy() & ~pd.isna(fecha)
+    if is_sva.any() and is_svb.any():
+        sva = pd.DataFrame({'t': fecha[is_sva], 'a': np.flatnonzero(is_sva)}).sort_values('t')
+        svb = pd.DataFrame({'t': fecha[is_svb], 'b': np.flatnonzero(is_svb)}).sort_values('t')
+        paired = pd.merge_asof(sva, svb, on='t', direction='nearest', tolerance=window).dropna()
+        edges.append(paired[['a', 'b']].to_numpy(dtype=np.int64))
+
+    # 2. Mismo n_informe (re-exportaciones, informes repetidos)
+    if 'n_informe' in raw.columns:
+        ids = raw['n_informe']
+        key = pd.Series(np.where(ids.notna(), _informe_key(ids), None))
+        first = pd.Series(np.arange(n)).groupby(key.to_numpy(), dropna=True).transform('first')
+        same = first.notna().to_numpy()
+        edges.append(np.column_stack([np.flatnonzero(same), first[same].to_numpy(dtype=np.int64)]))
+
+    # 3. Candidatos a casi duplicado
+    if {'fecha', 'edad', 'sexo', 'tipo_unidad'} <= set(raw.columns):
+        pairs = candidate_pairs(raw)
+        edges.append(pairs[['a', 'b']].to_numpy(dtype=np.int64))
+
+    edges = np.concatenate(edges) if edges else np.empty((0, 2), dtype=np.int64)
+    graph = coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+def stratify(raw, clusters):
+    """Estrato de cada conglomerado: composición de unidades | mes | RCP transtelefónica"""
+    fecha = pd.to_datetime(raw['fecha'], errors='coerce')
+    info = pd.DataFrame({
+        'conglomerado': clusters,
+        'sva': (raw['tipo_unidad'] == 'SVA').to_numpy(),
+        'svb': (raw['tipo_unidad'] == 'SVB').to_numpy(),
+        'fecha': fecha.to_numpy(),
+        'tcpr': raw['rcp_transtelefonica'].astype(str).str.strip().str.lower().isin(TRUE_VALUES).to_numpy(),
+    })
+    per_cluster = info.groupby('conglomerado').agg(sva=('sva', 'any'), svb=('svb', 'any'), fecha=('fecha', 'min'),
+                                                   tcpr=('tcpr', 'any'), registros=('sva', 'size'))
+    unidad = np.select([per_cluster['sva'] & per_cluster['svb'], per_cluster['sva'], per_cluster['svb']],
+                       ['SVA+SVB', 'SVA', 'SVB'], 'otro')
+    mes = per_cluster['fecha'].dt.strftime('%Y-%m').fillna('sin_fecha')
+    per_cluster['estrato'] = unidad + '|' + mes + '|tcpr=' + per_cluster['tcpr'].astype(int).astype(str)
+    return per_cluster[['estrato', 'registros']]
+
+
+def draw_sample(raw, fraction=SAMPLE_FRACTION, seed=42, min_per_stratum=MIN_PER_STRATUM):
+    """
+    Muestra estratificada de conglomerados. Devuelve (filas de la muestra,
+    diseño) donde el diseño tiene una fila por conglomerado muestreado con
+    estrato, N_h (conglomerados del estrato) y n_h (muestreados).
+    """
+    rng = np.random.default_rng(seed)
+    clusters = sampling_units(raw)
+    strata = stratify(raw, clusters)
+
+    chosen = []
+    for stratum, members in strata.groupby('estrato').groups.items():
+        members = np.asarray(members)
+        N = len(members)
+        n = N if N <= min_per_stratum else max(min_per_stratum, int(round(fraction * N)))
+        picked = rng.choice(members, size=n, replace=False)
+        chosen.append(pd.DataFrame({'conglomerado': picked, 'estrato': stratum, 'N_h': N, 'n_h': n}))
+    design = pd.concat(chosen, ignore_index=True).set_index('conglomerado')
+
+    in_sample = np.isin(clusters, design.index)
+    sample = raw[in_sample].copy()
+    sample['_conglomerado'] = clusters[in_sample]
+    design.attrs['conglomerados_total'] = len(strata)
+    design.attrs['registros_total'] = len(raw)
+    return sample, design
+
+
+def run_stages(sample, verbose=False):
+    """
+    Ejecuta las etapas de cleaning.main sobre la muestra (sin escribir
+    salidas). Devuelve ({etapa: DataFrame de salida}, {etapa: segundos}).
+    """
+    export = sample.drop(columns=['_conglomerado']).rename(columns={v: k for k, v in COLUMN_MAPPING.items()})
+    outputs, times = {}, {}
+    sink = None if verbose else io.StringIO()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'muestra.csv')
+        export.to_csv(path, sep=';', index=False)
+        stages = [
+            ('lectura', lambda _: read_raw_data(path)),
+            ('duplicados', remove_duplicates),
+            ('fusion', merge_svb_sva),
+            ('procesado', lambda data: select_final_columns(process_data(data))),
+        ]
+        data = None
+        for stage, function in stages:
+            tic = time.perf_counter()
+            if sink is None:
+                data = function(data)
+            else:
+                with redirect_stdout(sink):
+                    data = function(data)
+            times[stage] = time.perf_counter() - tic
+            outputs[stage] = data
+    return outputs, times
+
+
+def stratified_total(design, y):
+    """Total estimado y error estándar (conglomerados sin reposición, estratificado, con fpc)"""
+    data = design.assign(y=np.asarray(y, dtype=float))
+    by = data.groupby('estrato').agg(N=('N_h', 'first'), n=('n_h', 'first'), mean=('y', 'mean'),
+                                     var=('y', lambda s: s.var(ddof=1) if len(s) > 1 else 0.0))
+    total = (by['N'] * by['mean']).sum()
+    variance = (by['N'] ** 2 * (1 - by['n'] / by['N']) * by['var'] / by['n']).sum()
+    return total, np.sqrt(variance)
+
+
+def stratified_ratio(design, y, x):
+    """Razón Y/X estimada y su error estándar (linealización)"""
+    total_y, _ = stratified_total(design, y)
+    total_x, _ = stratified_total(design, x)
+    if total_x == 0:
+        return np.nan, np.nan
+    ratio = total_y / total_x
+    _, se = stratified_total(design, np.asarray(y, dtype=float) - ratio * np.asarray(x, dtype=float))
+    return ratio, se / total_x
+
+
+def _per_cluster(values, keys, design):
+    """Suma por conglomerado muestreado (0 donde no hay registros)"""
+    return pd.Series(np.asarray(values, dtype=float)).groupby(np.asarray(keys)).sum() \
+        .reindex(design.index, fill_value=0.0).to_numpy()
+
+
+def project(sample, design, outputs):
+    """
+    Conteos por etapa y outcomes proyectados a la cohorte completa.
+    Devuelve (exclusiones, outcomes, registros sin n_informe).
+    """
+    cluster_of = pd.Series(sample['_conglomerado'].to_numpy(), index=_informe_key(sample['n_informe'])) \
+        .groupby(level=0).first()
+
+    def clusters(df):
+        return _informe_key(df['n_informe']).map(cluster_of).to_numpy()
+
+    untracked = int(sample['n_informe'].isna().sum())
+    counts = {'export': _per_cluster(np.ones(len(sample)), sample['_conglomerado'], design)}
+    for stage, df in outputs.items():
+        keys = clusters(df)
+        known = ~pd.isna(keys)
+        counts[stage] = _per_cluster(np.ones(known.sum()), keys[known], design)
+
+    merged = outputs['fusion']
+    keys = clusters(merged)
+    known = ~pd.isna(keys)
+    sin_rcp_trans = _per_cluster(merged['rcp_transtelefonica'].isna().to_numpy()[known], keys[known], design)
+
+    steps = [
+        ('cuarentena (validación)', counts['export'] - counts['lectura']),
+        ('duplicados', counts['lectura'] - counts['duplicados']),
+        ('SVB fusionados o sin pareja', counts['duplicados'] - counts['fusion']),
+        ('RCP transtelefónica desconocida', sin_rcp_trans),
+        ('traumáticos', counts['fusion'] - counts['procesado'] - sin_rcp_trans),
+        ('registros finales', counts['procesado']),
+    ]
+    exclusions = []
+    for name, y in steps:
+        total, se = stratified_total(design, y)
+        exclusions.append({'concepto': name, 'muestra': int(round(y.sum())), 'proyectado': total, 'ee': se,
+                           'IC95_inf': max(total - Z_95 * se, 0), 'IC95_sup': total + Z_95 * se})
+
+    final = outputs['procesado']
+    keys = clusters(final)
+    known = ~pd.isna(keys)
+    final, keys = final[known], keys[known]
+    cpc = pd.to_numeric(final['cpc'], errors='coerce')
+    outcomes_spec = [
+        ('ROSC', pd.to_numeric(final['rosc'], errors='coerce').fillna(0), np.ones(len(final))),
+        ('Supervivencia 7 días', pd.to_numeric(final['supervivencia_7dias'], errors='coerce').fillna(0),
+         np.ones(len(final))),
+        ('CPC favorable (1-2)', cpc.isin([1, 2]).astype(float), cpc.notna().astype(float)),
+    ]
+    tcpr = pd.to_numeric(final['rcp_transtelefonica'], errors='coerce').fillna(0).to_numpy()
+    outcomes = []
+    for name, events, base in outcomes_spec:
+        events, base = np.asarray(events, dtype=float), np.asarray(base, dtype=float)
+        for grupo, mask in (('Todos', np.ones(len(final), dtype=bool)), ('RCP-T', tcpr == 1), ('Sin RCP-T', tcpr == 0)):
+            y = _per_cluster(events * mask, keys, design)
+            x = _per_cluster(base * mask, keys, design)
+            rate, se = stratified_ratio(design, y, x)
+            outcomes.append({'outcome': name, 'grupo': grupo, 'n_muestra': int(x.sum()), 'tasa_pct': 100 * rate,
+                             'ee_pct': 100 * se, 'IC95_inf_pct': 100 * max(rate - Z_95 * se, 0),
+                             'IC95_sup_pct': 100 * min(rate + Z_95 * se, 1)})
+    return pd.DataFrame(exclusions), pd.DataFrame(outcomes), untracked
+
+
+def project_run_time(sample, design, times, seed=42, verbose=False):
+    """
+    Tiempo proyectado por etapa para el export completo. El exponente de
+    escala de cada etapa (1 = lineal, 2 = cuadrático) se mide repitiendo las
+    etapas con la mitad de los conglomerados de la muestra.
+    """
+    rng = np.random.default_rng(seed + 1)
+    half = rng.choice(design.index, size=max(1, len(design) // 2), replace=False)
+    subsample = sample[sample['_conglomerado'].isin(half)]
+    _, half_times = run_stages(subsample, verbose=verbose)
+
+    scale = design.attrs['registros_total'] / len(sample)
+    ratio = len(sample) / max(len(subsample), 1)
+    rows = []
+    for stage, seconds in times.items():
+        exponent = 1.0
+        if ratio > 1 and seconds > 0.05 and half_times[stage] > 0:
+            exponent = float(np.clip(np.log(seconds / half_times[stage]) / np.log(ratio), 1.0, 2.0))
+        rows.append({'etapa': stage, 'muestra_s': seconds, 'exponente': exponent,
+                     'proyectado_s': seconds * scale ** exponent})
+    return pd.DataFrame(rows)
+
+
+def _format_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes < 60 else f"{minutes // 60}h {minutes % 60:02d}m"
+
+
+def run_dev_mode(raw_path=RAW_DATA_PATH, fraction=SAMPLE_FRACTION, seed=42, project_time=True, verbose=False):
+    """Muestra, etapas y proyección; imprime el informe y devuelve las tablas"""
+    tic = time.perf_counter()
+    raw = pd.read_csv(raw_path, delimiter=';').rename(columns=COLUMN_MAPPING)
+    sample, design = draw_sample(raw, fraction, seed)
+    sampling_time = time.perf_counter() - tic
+
+    print("\n🧪 MODO DESARROLLO: MUESTRA ESTRATIFICADA")
+    print(f"   • Conglomerados: {len(design):,} de {design.attrs['conglomerados_total']:,} "
+          f"({design['estrato'].nunique()} estratos)")
+    print(f"   • Registros: {len(sample):,} de {len(raw):,} ({100 * len(sample) / len(raw):.1f}%)")
+    print(f"   • Lectura y muestreo del export: {_format_seconds(sampling_time)}")
+
+    outputs, times = run_stages(sample, verbose=verbose)
+    exclusions, outcomes, untracked = project(sample, design, outputs)
+    print(f"   • Etapas sobre la muestra: {_format_seconds(sum(times.values()))} ("
+          + ', '.join(f"{stage} {_format_seconds(s)}" for stage, s in times.items()) + ")")
+    if untracked:
+        print(f"   ⚠️  {untracked} registros de la muestra sin n_informe no entran en la proyección")
+
+    print("\n📋 EXCLUSIONES PROYECTADAS A LA COHORTE COMPLETA (IC95%)")
+    for row in exclusions.itertuples():
+        print(f"   • {row.concepto}: {row.proyectado:,.0f} [{row.IC95_inf:,.0f}-{row.IC95_sup:,.0f}] "
+              f"(muestra: {row.muestra})")
+
+    print("\n📊 OUTCOMES PROYECTADOS (IC95%)")
+    for row in outcomes.itertuples():
+        print(f"   • {row.outcome} — {row.grupo}: {row.tasa_pct:.1f}% "
+              f"[{row.IC95_inf_pct:.1f}-{row.IC95_sup_pct:.1f}] (n muestra={row.n_muestra})")
+
+    timing = None
+    if project_time:
+        timing = project_run_time(sample, design, times, seed, verbose)
+        print(f"\n⏱️  Tiempo proyectado de la ejecución completa: {_format_seconds(timing['proyectado_s'].sum())}")
+        for row in timing.itertuples():
+            print(f"   • {row.etapa}: {_format_seconds(row.proyectado_s)} (escala n^{row.exponente:.2f})")
+    return {'diseño': design, 'exclusiones': exclusions, 'outcomes': outcomes, 'tiempos': timing}
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Pipeline de limpieza sobre una muestra estratificada')
+    parser.add_argument('--raw', default=RAW_DATA_PATH, help='Export crudo (CSV separado por ;)')
+    parser.add_argument('--fraccion', type=float, default=SAMPLE_FRACTION, help='Fracción de conglomerados por estrato')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--sin-tiempo', action='store_true', help='No proyectar el tiempo de la ejecución completa')
+    parser.add_argument('--verbose', action='store_true', help='Mostrar la salida de cada etapa')
+    parser.add_argument('--salida', help='CSV donde guardar exclusiones y outcomes proyectados')
+    args = parser.parse_args()
+
+    result = run_dev_mode(args.raw, args.fraccion, args.semilla, not args.sin_tiempo, args.verbose)
+    if args.salida:
+        table = pd.concat([result['exclusiones'].assign(tabla='exclusiones'),
+                           result['outcomes'].assign(tabla='outcomes')], ignore_index=True)
+        table.to_csv(args.salida, index=False)
+        print(f"\n💾 Proyección guardada en: {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
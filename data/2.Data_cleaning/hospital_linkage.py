@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Enlace del texto libre de 'hospital' con una lista canónica de hospitales
+receptores.
+
+El campo se escribe a mano en el informe: erratas, abreviaturas, con o sin
+tildes, con prefijos ("hosp.", "h.u.") o sufijos ("urgencias"). Cada valor
+se normaliza (minúsculas, sin tildes ni signos, sin palabras vacías como
+'hospital' o 'universitario') y se enlaza con el alias más parecido:
+
+1. Índice invertido de trigramas de caracteres sobre los alias de HOSPITALS:
+   solo se puntúan los alias que comparten trigramas con el valor
+   (MAX_CANDIDATES con mayor coeficiente de Dice). Un valor corto con una
+   errata puede no compartir ningún trigrama ('pez' y 'paz'): si tiene
+   SHORT_LENGTH caracteres o menos se añaden también los alias cortos a
+   distancia de edición 1.
+2. Similitud por distancia de edición (Levenshtein normalizada) contra el
+   valor completo y contra cada ventana de palabras de la misma longitud que
+   el alias (así "paz urgencias" enlaza con "paz").
+3. Se acepta con similitud >= MIN_SIMILARITY o con una sola errata (en alias
+   cortos como 'paz' una errata ya baja de ese umbral). Si no, el valor
+   queda como 'OTRO'; vacío -> NaN.
+
+El resultado se memoriza por texto distinto: en un export de cientos de miles
+de registros solo se enlazan las pocas decenas de valores diferentes.
+
+Uso:
+    python hospital_linkage.py ../3.cleaned_data/cleaned_data.csv
+"""
+
+import argparse
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# código -> (nombre, alias). Los alias se normalizan igual que los valores.
+HOSPITALS = {
+    'HULP': ('H. U. La Paz', ['la paz', 'hulp']),
+    'HCSC': ('H. Clínico San Carlos', ['clinico san carlos', 'clinico', 'san carlos', 'hcsc']),
+    'HGUGM': ('H. G. U. Gregorio Marañón', ['gregorio marañon', 'marañon', 'hgugm']),
+    'H12O': ('H. U. 12 de Octubre', ['doce de octubre', '12 de octubre', 'h12o']),
+    'HRYC': ('H. U. Ramón y Cajal', ['ramon y cajal', 'ramon cajal', 'hryc']),
+    'HFJD': ('H. U. Fundación Jiménez Díaz', ['concepcion fund j diaz', 'fundacion jimenez diaz', 'jimenez diaz',
+                                             'concepcion', 'fjd']),
+    'HUP': ('H. U. de La Princesa', ['la princesa', 'princesa']),
+    'HNJ': ('H. Infantil U. Niño Jesús', ['niño jesus infantil', 'niño jesus']),
+    'HUPHM': ('H. U. Puerta de Hierro Majadahonda', ['puerta de hierro', 'majadahonda']),
+    'HUIL': ('H. U. Infanta Leonor', ['infanta leonor', 'vallecas']),
+    'HUIS': ('H. U. Infanta Sofía', ['infanta sofia']),
+    'HUFA': ('H. U. Fundación Alcorcón', ['fundacion alcorcon', 'alcorcon']),
+    'HUSO': ('H. U. Severo Ochoa', ['severo ochoa']),
+    'HUG': ('H. U. de Getafe', ['getafe']),
+    'HUM': ('H. U. de Móstoles', ['mostoles']),
+    'HURJC': ('H. U. Rey Juan Carlos', ['rey juan carlos']),
+    'HUPA': ('H. U. Príncipe de Asturias', ['principe de asturias']),
+    'HUHE': ('H. U. del Henares', ['henares']),
+    'HUSE': ('H. U. del Sureste', ['sureste']),
+    'HUF': ('H. U. de Fuenlabrada', ['fuenlabrada']),
+    'HCDGU': ('H. Central de la Defensa Gómez Ulla', ['gomez ulla', 'central de la defensa']),
+    'HUSC': ('H. U. Santa Cristina', ['santa cristina']),
+    'HUIC': ('H. U. Infanta Cristina', ['infanta cristina', 'parla']),
+    'HUIE': ('H. U. Infanta Elena', ['infanta elena', 'valdemoro']),
+    'HUTO': ('H. U. de Torrejón', ['torrejon']),
+    'HUGV': ('H. U. General de Villalba', ['villalba', 'collado villalba']),
+    'HUEE': ('H. U. El Escorial', ['escorial', 'san lorenzo de el escorial']),
+    'HUTA': ('H. U. del Tajo', ['tajo', 'aranjuez']),
+    'HCR': ('H. Central de la Cruz Roja San José y Santa Adela', ['cruz roja', 'san jose y santa adela']),
+    'HGUAD': ('H. de Guadarrama', ['guadarrama']),
+    'HVP': ('H. Virgen de la Poveda', ['virgen de la poveda', 'poveda']),
+    'HCAN': ('H. de Cantoblanco', ['cantoblanco']),
+    'HVT': ('H. Virgen de la Torre', ['virgen de la torre']),
+    'HULS': ('H. U. La Luz', ['la luz']),
+    'PRIV': ('Centros privados', ['privados clinicas y hosp', 'privado', 'clinica privada', 'quiron', 'quironsalud',
+                                  'sanitas', 'vithas', 'hm hospitales']),
+}
+
+# Palabras que no identifican al hospital
+STOPWORDS = {'hospital', 'hosp', 'h', 'hu', 'hg', 'hgu', 'universitario', 'univ', 'u', 'general', 'g', 'de', 'del',
+             'la', 'el', 'los', 'las', 'y', 'fund', 'urgencias', 'urg', 'infantil'}
+
+NGRAM_SIZE = 3
+MAX_CANDIDATES = 10
+SHORT_LENGTH = 5
+MIN_SIMILARITY = 0.75
+UNMATCHED = 'OTRO'
+
+_NON_ALNUM = re.compile(r'[^a-z0-9ñ ]+')
+
+
+def normalize(text):
+    """Minúsculas, sin tildes (salvo la ñ), sin signos ni palabras vacías"""
+    if text is None or (not isinstance(text, str) and pd.isna(text)):
+        return ''
+    text = str(text).lower().replace('ñ', '\0')
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().replace('\0', 'ñ')
+    words = _NON_ALNUM.sub(' ', text).split()
+    kept = [w for w in words if w not in STOPWORDS]
+    return ' '.join(kept or words)
+
+
+def _ngrams(text):
+    padded = f' {text} '
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def levenshtein(a, b):
+    """Distancia de edición (fila a fila con numpy)"""
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    b_codes = np.frombuffer(b.encode('utf-32-le'), dtype=np.uint32)
+    previous = np.arange(len(b) + 1)
+    for i, char in enumerate(a, 1):
+        substitution = previous[:-1] + (b_codes != ord(char))
+        current = np.empty_like(previous)
+        current[0] = i
+        current[1:] = np.minimum(substitution, previous[1:] + 1)
+        # Inserciones: mínimo acumulado de izquierda a derecha
+        current = np.minimum.accumulate(current - np.arange(len(b) + 1)) + np.arange(len(b) + 1)
+        previous = current
+    return int(previous[-1])
+
+
+def similarity(a, b):
+    return 1 - levenshtein(a, b) / max(len(a), len(b), 1)
+
+
+def build_index(hospitals=None):
+    """Alias normalizados e índice trigrama -> alias"""
+    aliases = []
+    for code, (_, names) in (hospitals or HOSPITALS).items():
+        for name in names:
+            aliases.append((normalize(name), code))
+    index = {}
+    for i, (alias, _) in enumerate(aliases):
+        for gram in _ngrams(alias):
+            index.setdefault(gram, []).append(i)
+    short = [i for i, (alias, _) in enumerate(aliases) if len(alias) <= SHORT_LENGTH + 1]
+    return {'aliases': aliases, 'index': index, 'sizes': [len(_ngrams(a)) for a, _ in aliases], 'cortos': short}
+
+
+_INDEX = build_index()
+
+
+def _best_alias(value, index=_INDEX):
+    """(código, similitud) del mejor alias para un valor ya normalizado"""
+    grams = _ngrams(value)
+    shared = Counter(i for gram in grams for i in index['index'].get(gram, ()))
+    dice = {i: 2 * n / (len(grams) + index['sizes'][i]) for i, n in shared.items()}
+    candidates = sorted(dice, key=dice.get, reverse=True)[:MAX_CANDIDATES]
+    if len(value) <= SHORT_LENGTH:
+        # Una errata en un valor corto puede romper todos sus trigramas
+        candidates += [i for i in index['cortos']
+                       if i not in candidates and levenshtein(value, index['aliases'][i][0]) <= 1]
+    if not candidates:
+        return UNMATCHED, 0.0
+
+    words = value.split()
+    best_code, best_score, one_typo = UNMATCHED, 0.0, False
+    for i in candidates:
+        alias, code = index['aliases'][i]
+        distance = levenshtein(value, alias)
+        score = 1 - distance / max(len(value), len(alias))
+        width = len(alias.split())
+        if width < len(words):
+            windows = (' '.join(words[j:j + width]) for j in range(len(words) - width + 1))
+            # Coincidencia parcial: ligera penalización frente a la completa
+            score = max(score, 0.95 * max(similarity(w, alias) for w in windows))
+        if score > best_score:
+            best_code, best_score = code, score
+            one_typo = distance == 1 and len(alias) >= 3
+    if best_score < MIN_SIMILARITY and not one_typo:
+        return UNMATCHED, round(best_score, 3)
+    return best_code, round(best_score, 3)
+
+
+@lru_cache(maxsize=None)
+def link_hospital(text):
+    """(código, similitud) para un texto de hospital; vacío -> (NaN, NaN)"""
+    value = normalize(text)
+    if value in ('', 'nan', 'none'):
+        return np.nan, np.nan
+    return _best_alias(value)
+
+
+def link_hospitals(values):
+    """
+    Enlaza una serie de textos de hospital. Cada texto distinto se enlaza una
+    sola vez. Devuelve DataFrame (mismo índice) con hospital_codigo y
+    hospital_similitud.
+    """
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values.astype(str).str.strip().str.lower())
+    linked = [link_hospital(u) for u in uniques] + [(np.nan, np.nan)]
+    result = pd.DataFrame(linked, columns=['hospital_codigo', 'hospital_similitud'])
+    result = result.iloc[np.where(codes < 0, len(uniques), codes)]
+    result.index = values.index
+    return result
+
+
+def outcomes_by_hospital(data, code_col='hospital_codigo'):
+    """Resultados por hospital receptor: n, ROSC, supervivencia a 7 días y CPC favorable (1-2)"""
+    data = data[data[code_col].notna()].copy()
+    cpc = pd.to_numeric(data.get('cpc'), errors='coerce') if 'cpc' in data.columns else pd.Series(np.nan, index=data.index)
+    data['cpc_favorable'] = np.where(cpc.notna(), cpc.isin([1, 2]).astype(float), np.nan)
+    agg = {'n': (code_col, 'size')}
+    for col in ('rosc', 'supervivencia_7dias', 'cpc_favorable'):
+        if col in data.columns:
+            agg[f'{col}_pct'] = (col, lambda s: 100 * pd.to_numeric(s, errors='coerce').mean())
+    table = data.groupby(code_col).agg(**agg).sort_values('n', ascending=False)
+    table.insert(0, 'hospital', [HOSPITALS[c][0] if c in HOSPITALS else 'Sin asignar' for c in table.index])
+    return table.round(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Enlace de hospitales y resultados por hospital receptor')
+    parser.add_argument('csv', help="CSV con columna 'hospital' (o 'hospital_codigo')")
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.csv, sep=None, engine='python')
+    data.columns = [c.strip().lower() for c in data.columns]
+    if 'hospital_codigo' not in data.columns:
+        linked = link_hospitals(data['hospital'])
+        data = data.join(linked)
+        distinct = data[['hospital', 'hospital_codigo', 'hospital_similitud']].drop_duplicates('hospital')
+        print(f"🏥 {data['hospital'].nunique()} textos distintos de hospital enlazados:")
+        print(distinct.sort_values('hospital_similitud').to_string(index=False))
+
+    print("\n📊 RESULTADOS POR HOSPITAL RECEPTOR:")
+    print(outcomes_by_hospital(data).to_string())
+
+
+if __name__ == '__main__':
+    main()
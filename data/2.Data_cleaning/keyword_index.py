@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Índice invertido sobre el texto clínico libre para análisis "what-if" de las
+listas de palabras clave de cleaning.py.
+
+Cada cambio en las listas de is_traumatic, identify_responder_type o en las
+de ROSC/exitus obligaba a relanzar todo el pipeline. Este script construye
+una vez un índice persistente (trigramas de caracteres -> textos -> registros)
+sobre los mismos textos en los que buscan las reglas:
+
+- 'consulta'     -> trauma
+- 'respondiente' -> consulta + antecedentes (bombero, policía, sanitario)
+- 'evolucion'    -> técnicas + evolución (ROSC, exitus)
+
+Como las reglas solo buscan subcadenas, la clasificación de un registro solo
+puede cambiar si su texto contiene alguna palabra clave añadida o eliminada.
+Con el índice se localizan exactamente esos registros, se reevalúan solo
+ellos con clean_record y se informa de la diferencia antes/después en los
+conteos de exclusión y en las variables derivadas.
+
+Uso:
+    python keyword_index.py build
+    python keyword_index.py what-if --add trauma:ahorcam --remove sanitario:tes
+    python keyword_index.py what-if --add policia:guardia --apply
+"""
+
+import argparse
+import io
+import os
+import pickle
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import pandas as pd
+
+from cleaning import (
+    KEYWORD_LISTS,
+    clean_record,
+    merge_svb_sva,
+    read_raw_data,
+)
+from deduplication import remove_duplicates
+
+# Tamaño de los n-gramas de caracteres del índice
+NGRAM_SIZE = 3
+
+# Texto en el que busca cada lista de palabras clave
+LIST_VIEWS = {
+    'trauma': 'consulta',
+    'bombero': 'respondiente',
+    'policia': 'respondiente',
+    'sanitario': 'respondiente',
+    'rosc': 'evolucion',
+    'exitus': 'evolucion',
+}
+
+INDEX_FILENAME = 'indice_palabras_clave.pkl'
+
+
+def search_texts(row):
+    """Construye los textos exactamente como los leen las reglas de cleaning.py"""
+    consulta = str(row.get('consulta', '')).lower()
+    antecedentes = str(row.get('antecedentes', '')).lower()
+    tecnicas = str(row.get('tecnicas', '')).lower()
+    evolucion = str(row.get('evolucion', '')).lower()
+    return {
+        'consulta': consulta,
+        'respondiente': consulta + " " + antecedentes,
+        'evolucion': tecnicas + " " + evolucion,
+    }
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def _summarize(results):
+    """Conteos de exclusión y de variables derivadas sobre una lista de resultados"""
+    summary = Counter()
+    for record, motivo in results:
+        if record is None:
+            summary[f'excluidos_{motivo}'] += 1
+            continue
+        summary['incluidos'] += 1
+        summary[f"respondiente_{record['tipo_respondiente'] or 'sin_rcp_testigos'}"] += 1
+        summary['rosc'] += int(record['rosc'] == 1)
+        summary['supervivencia_7dias'] += int(record['supervivencia_7dias'] == 1)
+    return summary
+
+
+def build_keyword_index(merged_data, keywords=None, source=None):
+    """
+    Construye el índice a partir de los datos ya fusionados SVA/SVB (la
+    entrada de process_data) y guarda la clasificación de partida.
+    """
+    keywords = {name: list(values) for name, values in (keywords or KEYWORD_LISTS).items()}
+    rows = [pd.Series(r, dtype=object) for r in merged_data.to_dict(orient='records')]
+
+    views = {}
+    for view in set(LIST_VIEWS.values()):
+        views[view] = {'textos': [], 'registros': [], 'ngramas': {}}
+    text_ids = {view: {} for view in views}
+
+    for record_id, row in enumerate(rows):
+        for view, text in search_texts(row).items():
+            index = views[view]
+            text_id = text_ids[view].get(text)
+            if text_id is None:
+                # Cada texto distinto se indexa una sola vez
+                text_id = len(index['textos'])
+                text_ids[view][text] = text_id
+                index['textos'].append(text)
+                index['registros'].append([])
+                for gram in _ngrams(text):
+                    index['ngramas'].setdefault(gram, set()).add(text_id)
+            index['registros'][text_id].append(record_id)
+
+    results = [clean_record(row, keywords) for row in rows]
+
+    return {
+        'fuente': source,
+        'creado': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'keywords': keywords,
+        'registros': rows,
+        'vistas': views,
+        'resultados': results,
+        'resumen': _summarize(results),
+    }
+
+
+def records_containing(index, view, keyword):
+    """Devuelve los ids de los registros cuyo texto de la vista contiene keyword"""
+    keyword = keyword.lower()
+    view_index = index['vistas'][view]
+
+    if len(keyword) < NGRAM_SIZE:
+        # Palabras muy cortas: se recorren los textos distintos (no todos los registros)
+        candidates = range(len(view_index['textos']))
+    else:
+        postings = [view_index['ngramas'].get(gram, set()) for gram in _ngrams(keyword)]
+        postings.sort(key=len)
+        candidates = set.intersection(*postings) if postings else set()
+
+    record_ids = set()
+    for text_id in candidates:
+        # Los trigramas dan candidatos; la subcadena se verifica sobre el texto
+        if keyword in view_index['textos'][text_id]:
+            record_ids.update(view_index['registros'][text_id])
+    return record_ids
+
+
+def what_if(index, add=None, remove=None):
+    """
+    Evalúa un cambio en las listas de palabras clave sin relanzar el pipeline.
+
+    add/remove: dict {nombre_lista: [palabras]} con nombres de KEYWORD_LISTS.
+    Devuelve un dict con las nuevas listas, los registros afectados, los
+    resultados reevaluados y el resumen antes/después.
+    """
+    add = add or {}
+    remove = remove or {}
+    new_keywords = {name: list(values) for name, values in index['keywords'].items()}
+    affected = set()
+
+    for name, words in add.items():
+        if name not in LIST_VIEWS:
+            raise ValueError(f"Lista de palabras clave desconocida: '{name}'. Opciones: {list(LIST_VIEWS)}")
+        for word in words:
+            if word not in new_keywords[name]:
+                new_keywords[name].append(word)
+                affected |= records_containing(index, LIST_VIEWS[name], word)
+
+    for name, words in remove.items():
+        if name not in LIST_VIEWS:
+            raise ValueError(f"Lista de palabras clave desconocida: '{name}'. Opciones: {list(LIST_VIEWS)}")
+        for word in words:
+            if word in new_keywords[name]:
+                new_keywords[name].remove(word)
+                affected |= records_containing(index, LIST_VIEWS[name], word)
+
+    affected = sorted(affected)
+    old_results = [index['resultados'][i] for i in affected]
+    new_results = [clean_record(index['registros'][i], new_keywords) for i in affected]
+
+    before = index['resumen']
+    after = before - _summarize(old_results) + _summarize(new_results)
+    # Counter elimina claves que quedan a 0; se conservan para el informe
+    for key in before:
+        after.setdefault(key, 0)
+
+    changed = []
+    for record_id, (old_record, _), (new_record, _) in zip(affected, old_results, new_results):
+        if old_record is not None and new_record is not None:
+            fields = [col for col in new_record if str(old_record[col]) != str(new_record[col])]
+            if not fields:
+                continue
+        elif old_record is None and new_record is None:
+            continue
+        else:
+            fields = []
+        changed.append({
+            'id': record_id,
+            'n_informe': index['registros'][record_id].get('n_informe'),
+            'antes': 'excluido' if old_record is None else 'incluido',
+            'despues': 'excluido' if new_record is None else 'incluido',
+            'campos': fields,
+        })
+
+    return {
+        'keywords': new_keywords,
+        'afectados': affected,
+        'resultados': dict(zip(affected, new_results)),
+        'cambiados': changed,
+        'antes': before,
+        'despues': after,
+    }
+
+
+def apply_what_if(index, result):
+    """Consolida en el índice las listas y resultados de un what-if"""
+    index['keywords'] = result['keywords']
+    for record_id, res in result['resultados'].items():
+        index['resultados'][record_id] = res
+    index['resumen'] = Counter({k: v for k, v in result['despues'].items() if v})
+    return index
+
+
+def print_what_if_report(result, elapsed=None):
+    """Muestra en terminal la diferencia antes/después de un what-if"""
+    print("\n" + "="*80)
+    print("🔎 ANÁLISIS WHAT-IF DE PALABRAS CLAVE")
+    print("="*80)
+    print(f"   • Registros a reevaluar: {len(result['afectados'])}")
+    print(f"   • Registros cuya clasificación cambia: {len(result['cambiados'])}")
+    if elapsed is not None:
+        print(f"   • Tiempo: {elapsed*1000:.0f} ms")
+
+    print("\n📊 CONTEOS ANTES → DESPUÉS:")
+    for key in sorted(set(result['antes']) | set(result['despues'])):
+        antes = result['antes'].get(key, 0)
+        despues = result['despues'].get(key, 0)
+        marca = "" if antes == despues else f"  ({despues - antes:+d})"
+        print(f"   • {key}: {antes} → {despues}{marca}")
+
+    if result['cambiados']:
+        print("\n📝 REGISTROS MODIFICADOS:")
+        for change in result['cambiados'][:50]:
+            detalle = ', '.join(change['campos']) if change['campos'] else f"{change['antes']} → {change['despues']}"
+            print(f"   • {change['n_informe']}: {detalle}")
+        if len(result['cambiados']) > 50:
+            print(f"   • ... y {len(result['cambiados']) - 50} más")
+    print("="*80)
+
+
+def save_index(index, path):
+    with open(path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"💾 Índice guardado en: {path}")
+
+
+def load_index(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _parse_changes(values):
+    changes = {}
+    for value in values or []:
+        name, _, word = value.partition(':')
+        if not word:
+            raise ValueError(f"Formato esperado lista:palabra, recibido '{value}'")
+        changes.setdefault(name, []).append(word.lower())
+    return changes
+
+
+def main():
+    """Función principal"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_dir = os.path.dirname(os.path.dirname(script_dir))
+
+    parser = argparse.ArgumentParser(description='Índice de palabras clave para análisis what-if')
+    parser.add_argument('accion', choices=['build', 'what-if'])
+    parser.add_argument('--raw', default=os.path.join(project_dir, 'data', '1.raw_imported', 'rawdata_2year.csv'))
+    parser.add_argument('--index', default=os.path.join(script_dir, INDEX_FILENAME))
+    parser.add_argument('--add', action='append', help='lista:palabra a añadir (p. ej. trauma:ahorcam)')
+    parser.add_argument('--remove', action='append', help='lista:palabra a eliminar (p. ej. sanitario:tes)')
+    parser.add_argument('--apply', action='store_true', help='Guardar el cambio en el índice')
+    args = parser.parse_args()
+
+    if args.accion == 'build':
+        start = time.perf_counter()
+        # Mismos pasos que cleaning.main: validación (en read_raw_data) y duplicados antes de fusionar
+        raw_data = read_raw_data(args.raw)
+        dedup_data = remove_duplicates(raw_data)
+        with redirect_stdout(io.StringIO()):
+            merged_data = merge_svb_sva(dedup_data)
+        index = build_keyword_index(merged_data, source=args.raw)
+        print(f"✅ Índice construido: {len(index['registros'])} registros en {time.perf_counter() - start:.1f}s")
+        save_index(index, args.index)
+        return
+
+    index = load_index(args.index)
+    start = time.perf_counter()
+    result = what_if(index, add=_parse_changes(args.add), remove=_parse_changes(args.remove))
+    print_what_if_report(result, time.perf_counter() - start)
+
+    if args.apply:
+        save_index(apply_what_if(index, result), args.index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Seguimiento del rendimiento del pipeline de limpieza con un histórico local.
+
+Cada ejecución corre los mismos escenarios (exports sintéticos con semilla
+fija y tamaño fijo, mismo formato que el export crudo) por las etapas de
+cleaning.main y de process_data.py, y registra por etapa:
+
+- tiempo de reloj (s) de cada repetición
+- rendimiento (registros de entrada por segundo)
+- pico de memoria (MB) asignada durante la etapa (tracemalloc, en una pasada
+  aparte para no distorsionar los tiempos)
+
+Los resultados se añaden a perf_historial.csv y se comparan con la línea
+base: las últimas BASELINE_RUNS ejecuciones aceptadas del mismo escenario.
+Una etapa es regresión de tiempo si sus repeticiones son más lentas que las
+de la base (Mann-Whitney unilateral, p < ALPHA) y la mediana empeora más de
+MIN_SLOWDOWN; de memoria si el pico supera la mediana de la base en más de
+MEMORY_TOLERANCE. Las ejecuciones con regresión se guardan como no
+aceptadas (no entran en la base) salvo con --aceptar, y el script termina
+con código 1 para poder usarse como control antes del refresco en
+producción.
+
+Uso:
+    python perf_tracking.py run
+    python perf_tracking.py run --escenarios pequeno mediano grande --repeticiones 5
+    python perf_tracking.py run --aceptar          # asumir el cambio como nueva base
+    python perf_tracking.py tendencia
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.stats import mannwhitneyu
+
+import process_data as separation
+from cleaning import merge_svb_sva, process_data, read_raw_data, select_final_columns
+from deduplication import remove_duplicates
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.path.join(SCRIPT_DIR, 'perf_historial.csv')
+
+# Escenarios fijos: mismo tamaño y semilla en todas las ejecuciones
+SCENARIOS = {
+    'pequeno': {'filas': 1000, 'semilla': 101},
+    'mediano': {'filas': 5000, 'semilla': 202},
+    'grande': {'filas': 20000, 'semilla': 303},
+}
+DEFAULT_SCENARIOS = ('pequeno', 'mediano')
+
+REPETITIONS = 3
+BASELINE_RUNS = 5
+ALPHA = 0.05
+MIN_SLOWDOWN = 0.10
+MEMORY_TOLERANCE = 0.20
+TREND_RUNS = 8
+
+HISTORY_COLUMNS = ['ejecucion', 'commit', 'escenario', 'filas', 'etapa', 'repeticion', 'registros_entrada',
+                   'tiempo_s', 'registros_s', 'memoria_pico_mb', 'aceptada']
+
+# Esquema de salida de cleaning.py -> esquema de la hoja que procesa process_data.py
+NOTEBOOK_COLUMNS = {
+    'n_informe': 'NUM INFORME', 'fecha': 'FECHA_LLAMADA', 'edad': 'EDAD', 'sexo': 'SEXO',
+    'rcp_transtelefonica': 'RCP_TRANSTELEFONICA', 'desa_externo': 'DESA_EXTERNO', 'tiempo_llegada': 'Tiempo_llegada',
+    'tiempo_rcp': 'Tiempo_Rcp', 'ritmo_desfibrilable': 'Desfibrilable_inicial', 'rosc': 'ROSC',
+    'supervivencia_7dias': 'Supervivencia_7dias', 'cpc': 'CPC',
+}
+
+_CONSULTAS = ['pcr en domicilio', 'parada cardiorrespiratoria en via publica', 'inconsciente no respira',
+              'varon que se desploma en el trabajo', 'mujer inconsciente en su domicilio',
+              'precipitado desde altura', 'atropello de peaton', 'ahorcado en domicilio']
+_CONSULTA_PROBS = [0.3, 0.2, 0.2, 0.12, 0.1, 0.03, 0.03, 0.02]
+_ANTECEDENTES = ['hta dm', 'cardiopatia isquemica', 'policia municipal inicia rcp', 'bomberos inician rcp',
+                 'enfermera testigo', 'sin antecedentes', '']
+_TECNICAS = ['rcp avanzada', 'rcp avanzada, iot, adrenalina', 'tras 25 min de rcp exitus', 'recupera pulso',
+             'desfibrilacion, rosc']
+_RITMOS = ['Asistolia', 'FV', 'AESP', 'TV sin pulso', '']
+_HOSPITALES = ['la paz', 'h. 12 de octubre', 'clinico san carlos', 'gregorio marañon', 'ramon y cajal']
+_SIETE_DIAS = ['alta cpc 1', 'vivo, cpc 2', 'exitus', 'estable en uci', '']
+
+
+def synthetic_export(n, seed=0):
+    """
+    Export crudo sintético de n filas (columnas y formato del export
+    real): cada aviso tiene un registro SVA y, en la mitad de los casos, un
+    SVB minutos antes; ~2% de filas re-exportadas para la deduplicación.
+    """
+    rng = np.random.default_rng(seed)
+    n_calls = max(1, int(np.ceil(n / 1.4)))
+    start = pd.Timestamp('2022-01-01')
+    call_time = start + pd.to_timedelta(np.sort(rng.integers(0, 2 * 365 * 86400, n_calls)), unit='s')
+    has_svb = rng.random(n_calls) < 0.5
+
+    calls = pd.DataFrame({
+        'EDAD': np.where(rng.random(n_calls) < 0.02, np.nan, rng.integers(18, 96, n_calls)),
+        'SEXO': rng.choice(['Masculino', 'Femenino'], n_calls, p=[0.7, 0.3]),
+        'RCP_TESTIGOS': np.where(rng.random(n_calls) < 0.6, 'verdadero', 'falso'),
+        'RITMO INICIAL': rng.choice(_RITMOS, n_calls),
+        'CONSULTA': rng.choice(_CONSULTAS, n_calls, p=_CONSULTA_PROBS),
+        'ANTECEDENTES': rng.choice(_ANTECEDENTES, n_calls),
+        'TECNICAS': rng.choice(_TECNICAS, n_calls),
+        'C0_C1': rng.gamma(2.0, 40.0, n_calls).round(),
+        'C1_C2': rng.gamma(2.0, 60.0, n_calls).round(),
+        'C2_C3': rng.gamma(3.0, 150.0, n_calls).round(),
+        'C3_C4': rng.gamma(4.0, 300.0, n_calls).round(),
+    })
+    hospital = rng.random(n_calls) < 0.4
+    calls['HOSPITAL'] = np.where(hospital, rng.choice(_HOSPITALES, n_calls), '')
+    calls['7 DIAS'] = np.where(hospital, rng.choice(_SIETE_DIAS, n_calls), '')
+
+    sva = calls.assign(**{'Tipo de Unidad': 'SVA', 'FECHA_LLAMADA': call_time,
+                          'RCP_TRANSTELEFONICA': np.where(rng.random(n_calls) < 0.3, 'verdadero', 'falso'),
+                          'DESA_EXTERNO': np.where(rng.random(n_calls) < 0.1, 'verdadero', 'falso')})
+    svb = calls[has_svb].assign(**{
+        'Tipo de Unidad': 'SVB',
+        'FECHA_LLAMADA': call_time[has_svb] - pd.to_timedelta(rng.integers(3, 40, has_svb.sum()), unit='m'),
+        'RCP_TRANSTELEFONICA': np.where(rng.random(has_svb.sum()) < 0.35, 'verdadero', 'falso'),
+        'DESA_EXTERNO': 'falso',
+        'HOSPITAL': '', '7 DIAS': '', 'RITMO INICIAL': '',
+    })
+    export = pd.concat([sva, svb], ignore_index=True).sort_values('FECHA_LLAMADA', kind='stable')
+    export.insert(0, 'NUM INFORME', np.arange(1, len(export) + 1))
+    # Re-exportaciones: filas idénticas (mismo número de informe)
+    n_repeated = int(round(n * 0.02))
+    export = export.head(n - n_repeated)
+    export = pd.concat([export, export.sample(n=n_repeated, random_state=seed)])
+    export = export.sort_values('FECHA_LLAMADA', kind='stable').reset_index(drop=True)
+    export['FECHA_LLAMADA'] = export['FECHA_LLAMADA'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return export
+
+
+def _split_datasets(final_data):
+    """Pasos de process_data.py sobre la salida limpia, sin escribir ficheros"""
+    df = final_data.rename(columns=NOTEBOOK_COLUMNS).copy()
+    # Casilla 'Excluido' de la revisión manual: uno de cada diez casos
+    df['Excluido'] = np.where(np.arange(len(df)) % 10 == 0, 'excluido revision', '')
+    df = separation.add_derived_flags(df)
+    df = separation.analyze_cpc_values(df)
+    df = separation.analyze_exclusions(df)
+    valid, excluded = separation.split_datasets(df)
+    valid = separation.analyze_valid_data(valid)
+    return valid, excluded
+
+
+def pipeline_stages(export_path):
+    """[(etapa, función)] en el orden de cleaning.main; cada función recibe la salida de la anterior"""
+    return [
+        ('lectura', lambda _: read_raw_data(export_path)),
+        ('duplicados', remove_duplicates),
+        ('fusion', merge_svb_sva),
+        ('procesado', lambda data: select_final_columns(process_data(data))),
+        ('separacion', _split_datasets),
+    ]
+
+
+def run_pipeline(export_path, trace_memory=False):
+    """
+    Ejecuta todas las etapas una vez. Devuelve {etapa: (registros de
+    entrada, segundos, pico MB o NaN)}.
+    """
+    measures = {}
+    data = None
+    for stage, function in pipeline_stages(export_path):
+        stage_input = data.copy() if isinstance(data, pd.DataFrame) else data
+        n_input = len(stage_input) if stage_input is not None else np.nan
+        if trace_memory:
+            tracemalloc.start()
+            baseline, _ = tracemalloc.get_traced_memory()
+        tic = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            data = function(stage_input)
+        elapsed = time.perf_counter() - tic
+        peak = np.nan
+        if trace_memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak = (peak_bytes - baseline) / 2 ** 20
+        if stage == 'lectura':
+            n_input = len(data)
+        measures[stage] = (n_input, elapsed, peak)
+    return measures
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True,
+                                text=True, timeout=10)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_scenarios(scenarios=DEFAULT_SCENARIOS, repetitions=REPETITIONS):
+    """Mide todos los escenarios; devuelve las filas de la ejecución (formato del histórico)"""
+    run_id = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    commit = _git_commit()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in scenarios:
+            config = SCENARIOS[name]
+            export_path = os.path.join(tmp, f'export_{name}.csv')
+            synthetic_export(config['filas'], config['semilla']).to_csv(export_path, sep=';', index=False)
+            print(f"⏱️  Escenario '{name}' ({config['filas']:,} filas, {repetitions} repeticiones)...")
+
+            memory = {stage: peak for stage, (_, _, peak) in run_pipeline(export_path, trace_memory=True).items()}
+            for repetition in range(1, repetitions + 1):
+                for stage, (n_input, elapsed, _) in run_pipeline(export_path).items():
+                    rows.append({
+                        'ejecucion': run_id, 'commit': commit, 'escenario': name, 'filas': config['filas'],
+                        'etapa': stage, 'repeticion': repetition, 'registros_entrada': n_input,
+                        'tiempo_s': round(elapsed, 5), 'registros_s': round(n_input / elapsed, 1),
+                        'memoria_pico_mb': round(memory[stage], 2), 'aceptada': True,
+                    })
+    return pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    history = pd.read_csv(path)
+    history['aceptada'] = history['aceptada'].astype(str).str.lower().isin(['true', '1'])
+    return history
+
+
+def append_history(run, path=HISTORY_PATH):
+    run.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+
+def compare_with_baseline(run, history, baseline_runs=BASELINE_RUNS, alpha=ALPHA, min_slowdown=MIN_SLOWDOWN,
+                          memory_tolerance=MEMORY_TOLERANCE):
+    """Comparación por (escenario, etapa) de la ejecución con su línea base"""
+    rows = []
+    for (scenario, n_rows, stage), current in run.groupby(['escenario', 'filas', 'etapa'], sort=False):
+        past = history[(history['escenario'] == scenario) & (history['filas'] == n_rows)
+                       & (history['etapa'] == stage) & history['aceptada']]
+        base_runs = past['ejecucion'].drop_duplicates().tail(baseline_runs)
+        base = past[past['ejecucion'].isin(base_runs)]
+        row = {'escenario': scenario, 'etapa': stage, 'ejecuciones_base': len(base_runs),
+               'tiempo_base_s': np.nan, 'tiempo_s': current['tiempo_s'].median(), 'cambio_pct': np.nan,
+               'p_valor': np.nan, 'memoria_base_mb': np.nan, 'memoria_mb': current['memoria_pico_mb'].median(),
+               'registros_s': current['registros_s'].median(), 'regresion_tiempo': False,
+               'regresion_memoria': False}
+        if len(base_runs) >= 2:
+            row['tiempo_base_s'] = base['tiempo_s'].median()
+            row['cambio_pct'] = 100 * (row['tiempo_s'] / row['tiempo_base_s'] - 1)
+            row['p_valor'] = mannwhitneyu(current['tiempo_s'], base['tiempo_s'], alternative='greater').pvalue
+            row['regresion_tiempo'] = bool(row['p_valor'] < alpha and row['cambio_pct'] > 100 * min_slowdown)
+            row['memoria_base_mb'] = base['memoria_pico_mb'].median()
+            # Por debajo de 1 MB las variaciones relativas no significan nada
+            row['regresion_memoria'] = bool(row['memoria_mb'] > max(row['memoria_base_mb'], 1.0)
+                                            * (1 + memory_tolerance))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _sparkline(values):
+    bars = '▁▂▃▄▅▆▇█'
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return ''
+    lo, hi = values.min(), values.max()
+    if hi - lo < 1e-12:
+        return bars[0] * len(values)
+    return ''.join(bars[int(round((v - lo) / (hi - lo) * (len(bars) - 1)))] for v in values)
+
+
+def trend_table(history, comparison=None, last=TREND_RUNS):
+    """Tabla compacta: mediana por ejecución de las últimas `last` ejecuciones y estado actual"""
+    medians = history.groupby(['escenario', 'etapa', 'ejecucion'], sort=False)['tiempo_s'].median()
+    rows = []
+    for (scenario, stage), series in medians.groupby(level=['escenario', 'etapa'], sort=False):
+        series = series.tail(last)
+        row = {'escenario': scenario, 'etapa': stage, 'tendencia': _sparkline(series.to_numpy()),
+               'ultima_s': round(series.iloc[-1], 4)}
+        if comparison is not None:
+            match = comparison[(comparison['escenario'] == scenario) & (comparison['etapa'] == stage)]
+            if len(match):
+                c = match.iloc[0]
+                row['base_s'] = round(c['tiempo_base_s'], 4)
+                row['cambio'] = '-' if pd.isna(c['cambio_pct']) else f"{c['cambio_pct']:+.1f}%"
+                row['p'] = '-' if pd.isna(c['p_valor']) else f"{c['p_valor']:.3f}"
+                row['reg/s'] = f"{c['registros_s']:,.0f}"
+                row['MB'] = round(c['memoria_mb'], 1)
+                row['estado'] = ('🐢 más lento' if c['regresion_tiempo'] else
+                                 '📈 más memoria' if c['regresion_memoria'] else
+                                 '🆕 sin base' if c['ejecuciones_base'] < 2 else '✅')
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Seguimiento del rendimiento del pipeline de limpieza')
+    parser.add_argument('accion', nargs='?', default='run', choices=['run', 'tendencia'])
+    parser.add_argument('--escenarios', nargs='+', default=list(DEFAULT_SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--repeticiones', type=int, default=REPETITIONS)
+    parser.add_argument('--historial', default=HISTORY_PATH, help='CSV con el histórico de ejecuciones')
+    parser.add_argument('--aceptar', action='store_true', help='Guardar la ejecución como base aunque haya regresión')
+    parser.add_argument('--sin-guardar', action='store_true', help='Comparar sin añadir la ejecución al histórico')
+    args = parser.parse_args()
+
+    history = load_history(args.historial)
+    if args.accion == 'tendencia':
+        if history.empty:
+            print(f"ℹ️  Sin histórico en {args.historial}")
+            return
+        print(trend_table(history).to_string(index=False))
+        return
+
+    run = run_scenarios(args.escenarios, args.repeticiones)
+    comparison = compare_with_baseline(run, history)
+    regressions = comparison[comparison['regresion_tiempo'] | comparison['regresion_memoria']]
+    run['aceptada'] = regressions.empty or args.aceptar
+
+    if not args.sin_guardar:
+        append_history(run, args.historial)
+        print(f"💾 Ejecución añadida a {args.historial}" + ('' if run['aceptada'].all() else ' (no aceptada)'))
+
+    print("\n📊 TENDENCIA POR ETAPA (mediana de las repeticiones)")
+    print(trend_table(pd.concat([history, run], ignore_index=True), comparison).to_string(index=False))
+
+    if not regressions.empty:
+        print(f"\n❌ {len(regressions)} etapas con regresión respecto a la base "
+              f"(últimas {BASELINE_RUNS} ejecuciones aceptadas):")
+        for row in regressions.itertuples():
+            print(f"   • {row.escenario}/{row.etapa}: {row.tiempo_base_s:.3f}s → {row.tiempo_s:.3f}s "
+                  f"({row.cambio_pct:+.1f}%, p={row.p_valor:.3f}), {row.memoria_base_mb:.1f} → {row.memoria_mb:.1f} MB")
+        sys.exit(0 if args.aceptar else 1)
+    print("\n✅ Sin regresiones de rendimiento")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,12 +12,21 @@ from matplotlib.backends.backend_pdf import PdfPages
 import seaborn as sns
 from datetime import datetime
 import os
+import sys
+
+# Módulos que viven junto a los datos limpios (cohorte particionada)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '3.cleaned_data'))
+from partitioned_cohort import write_partitioned  # noqa: E402
+from run_outputs import atomic_write, finish_run, start_run  # noqa: E402
+from quantile_sketch import NOTEBOOK_METRICS, build_sketch_set, query_summary, rank_error  # noqa: E402
+
+OUTPUT_ROOT = "../3.cleaned_data/"
 
 def load_and_analyze_data():
     """Cargar y analizar el dataset principal"""
     
     # Cargar datos
-    input_file = "./Datos 2 años. En proceso de limpieza.xlsx - Sheet.csv"
+    input_file = INPUT_FILE
     df = pd.read_csv(input_file)
     
     print("="*60)
@@ -80,6 +89,41 @@ def convert_numeric_columns(df):
     
     return df_converted
 
+# Hoja de revisión manual (con la casilla Excluido), relativa a data/2.Data_cleaning
+INPUT_FILE = "./Datos 2 años. En proceso de limpieza.xlsx - Sheet.csv"
+
+# Valores de CPC (escala 1-5) y flags derivados que se calculan una sola vez
+CPC_VALUES = [1, 2, 3, 4, 5]
+CPC_FAVORABLE_VALUES = [1, 2]
+FLAG_COLUMNS = ['CPC_valido', 'CPC_favorable', 'Es_excluido', 'Edad_65_o_mas']
+
+def add_derived_flags(df):
+    """
+    Una sola pasada vectorizada sobre la hoja: tipos enteros
+    (convert_numeric_columns) y flags derivados que usan las estadísticas,
+    la separación en CSV y todas las páginas del PDF:
+    - CPC_valido: CPC entero entre 1 y 5 y sin casilla Excluido rellenada
+    - CPC_favorable: CPC 1-2
+    - Es_excluido: casilla Excluido rellenada
+    - Edad_65_o_mas: EDAD >= 65 (NA si falta la edad)
+    """
+    typed = df.copy()
+    # CPC como número (texto libre, decimales o vacío -> NaN)
+    cpc = pd.to_numeric(typed['CPC'].astype(str).str.strip(), errors='coerce')
+    typed['CPC'] = cpc.where(cpc == np.trunc(cpc))
+    typed = convert_numeric_columns(typed)
+    
+    if 'Excluido' in typed.columns:
+        # Mismo criterio que antes: solo NaN o cadena vacía cuentan como no excluido
+        excluido = typed['Excluido']
+        typed['Es_excluido'] = ~(excluido.isna() | (excluido == ''))
+    else:
+        typed['Es_excluido'] = False
+    typed['CPC_valido'] = typed['CPC'].isin(CPC_VALUES).astype(bool) & ~typed['Es_excluido']
+    typed['CPC_favorable'] = typed['CPC'].isin(CPC_FAVORABLE_VALUES).astype(bool)
+    typed['Edad_65_o_mas'] = (typed['EDAD'] >= 65) if 'EDAD' in typed.columns else pd.NA
+    return typed
+
 def analyze_cpc_values(df):
     """Analizar los valores de CPC"""
     
@@ -87,26 +131,16 @@ def analyze_cpc_values(df):
     print("ANÁLISIS DE VALORES CPC")
     print("="*60)
     
+    if 'CPC_valido' not in df.columns:
+        df = add_derived_flags(df)
+    
     # Analizar valores únicos de CPC
     cpc_counts = df['CPC'].value_counts(dropna=False)
     print("Distribución de valores CPC:")
     print(cpc_counts)
     
-    # Identificar registros con CPC válido (numérico)
-    def is_valid_cpc(value):
-        if pd.isna(value) or value == '':
-            return False
-        try:
-            # Intentar convertir a float para detectar valores numéricos
-            float_val = float(str(value).strip())
-            # CPC válido debe estar entre 1 y 5
-            return 1 <= float_val <= 5
-        except (ValueError, TypeError):
-            return False
-    
-    df['CPC_valido'] = df['CPC'].apply(is_valid_cpc)
-    
-    valid_cpc_count = df['CPC_valido'].sum()
+    # Registros con CPC válido (1-5), sin contar la casilla Excluido
+    valid_cpc_count = int(df['CPC'].isin(CPC_VALUES).sum())
     invalid_cpc_count = len(df) - valid_cpc_count
     
     print(f"\nRegistros con CPC válido (1-5): {valid_cpc_count:,}")
@@ -122,167 +156,192 @@ def analyze_exclusions(df):
     print("ANÁLISIS DE EXCLUSIONES")
     print("="*60)
     
+    if 'Es_excluido' not in df.columns:
+        df = add_derived_flags(df)
+    
     # Analizar columna Excluido
     if 'Excluido' in df.columns:
         excluido_counts = df['Excluido'].value_counts(dropna=False)
         print("Distribución de valores en columna 'Excluido':")
         print(excluido_counts)
-        
-        # Considerar como excluidos aquellos que tienen cualquier valor en Excluido (excepto NaN y vacío)
-        df['Es_excluido'] = ~(df['Excluido'].isna() | (df['Excluido'] == ''))
     else:
         print("Columna 'Excluido' no encontrada")
-        df['Es_excluido'] = False
     
-    excluded_count = df['Es_excluido'].sum()
+    excluded_count = int(df['Es_excluido'].sum())
     included_count = len(df) - excluded_count
     
     print(f"\nTotal excluidos (con casilla Excluido rellenada): {excluded_count:,}")
     print(f"Total potencialmente incluibles: {included_count:,}")
     print(f"Porcentaje excluidos: {excluded_count/len(df)*100:.1f}%")
     
-    # Verificar que no haya solapamiento: si Excluido está rellenado, no puede tener CPC válido
-    solapamiento = df[(df['Es_excluido'] == True) & (df['CPC_valido'] == True)]
-    if len(solapamiento) > 0:
-        print(f"\n⚠️  ADVERTENCIA: {len(solapamiento)} registros tienen CPC válido pero casilla Excluido rellenada")
+    # Solapamiento: si Excluido está rellenado, no cuenta como CPC válido (ya aplicado en CPC_valido)
+    solapamiento = int((df['Es_excluido'] & df['CPC'].isin(CPC_VALUES)).sum())
+    if solapamiento > 0:
+        print(f"\n⚠️  ADVERTENCIA: {solapamiento} registros tienen CPC válido pero casilla Excluido rellenada")
         print("Estos registros se incluirán SOLO en el archivo de exclusiones")
-        # Corregir: si está excluido, no puede tener CPC válido para el dataset final
-        df.loc[df['Es_excluido'] == True, 'CPC_valido'] = False
     
     return df
 
-def create_datasets(df):
-    """Crear los datasets separados"""
+def split_datasets(df):
+    """Separa (con los flags ya calculados) los registros con CPC válido y los excluidos"""
+    df_with_cpc = df[df['CPC_valido']].copy()
+    df_excluded = df[df['Es_excluido']].copy()
+    return df_with_cpc, df_excluded
+
+def create_datasets(df, output_dir=OUTPUT_ROOT):
+    """
+    Crear los datasets separados (main escribe en el directorio de su
+    ejecución y después publica). Los CSV no llevan los flags auxiliares;
+    los DataFrames devueltos sí, para las estadísticas y el PDF.
+    """
     
     print("\n" + "="*60)
     print("CREACIÓN DE DATASETS")
     print("="*60)
     
-    # Dataset 1: Registros con CPC válido (sin casilla Excluido rellenada)
-    df_with_cpc = df[(df['CPC_valido'] == True) & (df['Es_excluido'] == False)].copy()
+    if 'CPC_valido' not in df.columns:
+        df = add_derived_flags(df)
     
+    # Dataset 1: Registros con CPC válido (sin casilla Excluido rellenada)
     # Dataset 2: Registros excluidos (casilla Excluido rellenada)
-    df_excluded = df[df['Es_excluido'] == True].copy()
+    df_with_cpc, df_excluded = split_datasets(df)
     
     print(f"Dataset con CPC válido: {len(df_with_cpc):,} registros")
     print(f"Dataset de exclusiones: {len(df_excluded):,} registros")
     
-    # Limpiar datasets - eliminar columnas auxiliares y convertir números
-    columns_to_remove = ['CPC_valido', 'Es_excluido', 'Excluido']
-    
-    # Limpiar dataset CPC válido
-    df_with_cpc_clean = df_with_cpc.drop(columns=columns_to_remove).copy()
-    df_with_cpc_clean = convert_numeric_columns(df_with_cpc_clean)
-    
-    # Limpiar dataset excluidos (mantener columna Excluido para ver motivo)
-    df_excluded_clean = df_excluded.drop(columns=['CPC_valido', 'Es_excluido']).copy()
-    df_excluded_clean = convert_numeric_columns(df_excluded_clean)
+    # Datasets sin flags auxiliares (el de excluidos mantiene la columna Excluido para ver el motivo)
+    df_with_cpc_clean = df_with_cpc.drop(columns=FLAG_COLUMNS + ['Excluido'], errors='ignore')
+    df_excluded_clean = df_excluded.drop(columns=FLAG_COLUMNS, errors='ignore')
     
     # Guardar datasets
-    output_dir = "../3.cleaned_data/"
     os.makedirs(output_dir, exist_ok=True)
     
     # Guardar dataset con CPC
     cpc_file = os.path.join(output_dir, "datos_con_cpc_valido.csv")
-    df_with_cpc_clean.to_csv(cpc_file, index=False)
+    with atomic_write(cpc_file) as tmp_path:
+        df_with_cpc_clean.to_csv(tmp_path, index=False)
     print(f"Archivo guardado: {cpc_file}")
     
+    # Copia particionada por año/mes de la cohorte de análisis
+    cpc_dir = os.path.join(output_dir, "datos_con_cpc_valido")
+    manifest = write_partitioned(df_with_cpc_clean, cpc_dir, source=os.path.abspath(cpc_file))
+    print(f"Conjunto particionado: {cpc_dir}/ ({len(manifest['ficheros'])} ficheros)")
+    
     # Guardar dataset de exclusiones  
     excluded_file = os.path.join(output_dir, "datos_excluidos.csv")
-    df_excluded_clean.to_csv(excluded_file, index=False)
+    with atomic_write(excluded_file) as tmp_path:
+        df_excluded_clean.to_csv(tmp_path, index=False)
     print(f"Archivo guardado: {excluded_file}")
     
-    return df_with_cpc_clean, df_excluded_clean
+    return df_with_cpc, df_excluded
+
+def summarize_valid(df_valid):
+    """
+    Conteos y estadísticas de los datos válidos (terminal y PDF) a partir de
+    los flags; edad y tiempos resumidos con sketches KLL por grupo y mes
+    """
+    total = len(df_valid)
+    sketches = build_sketch_set(df_valid, NOTEBOOK_METRICS, group_col='RCP_TRANSTELEFONICA',
+                                date_col='FECHA_LLAMADA')
+    
+    def count(col, value=1):
+        return int((df_valid[col] == value).sum()) if col in df_valid.columns else 0
+    
+    resumen = {
+        'total': total,
+        'rcp_transtelefonica': count('RCP_TRANSTELEFONICA'),
+        'rosc': count('ROSC'),
+        'supervivencia_7dias': count('Supervivencia_7dias'),
+        'cpc_favorable': int(df_valid['CPC_favorable'].sum()),
+        'testigos': df_valid['RCP_TESTIGOS'].value_counts(dropna=False) if 'RCP_TESTIGOS' in df_valid.columns else None,
+        'sexo': df_valid['SEXO'].value_counts(dropna=False) if 'SEXO' in df_valid.columns else None,
+        'edad': query_summary(sketches, 'edad') if 'EDAD' in df_valid.columns else None,
+        'sketches': sketches,
+    }
+    if 'EDAD' in df_valid.columns:
+        resumen['edad_menor_65'] = int((df_valid['Edad_65_o_mas'] == False).sum())
+        resumen['edad_65_o_mas'] = int((df_valid['Edad_65_o_mas'] == True).sum())
+    return resumen
 
 def analyze_valid_data(df_valid):
-    """Analizar datos válidos para el estudio"""
+    """Analizar datos válidos para el estudio (el resumen queda en df_valid.attrs['resumen'] para el PDF)"""
     
     print("\n" + "="*60)
     print("ANÁLISIS DE DATOS VÁLIDOS")
     print("="*60)
     
+    if 'CPC_favorable' not in df_valid.columns:
+        df_valid = add_derived_flags(df_valid)
+    resumen = summarize_valid(df_valid)
+    df_valid.attrs['resumen'] = resumen
+    
     # Estadísticas básicas
-    total_valid = len(df_valid)
+    total_valid = resumen['total']
     print(f"Total de casos válidos: {total_valid:,}")
     
     # Análisis de RCP Transtelefónica
     if 'RCP_TRANSTELEFONICA' in df_valid.columns:
-        rcp_trans_count = (df_valid['RCP_TRANSTELEFONICA'] == 1).sum()
-        rcp_trans_pct = rcp_trans_count / total_valid * 100
-        print(f"RCP Transtelefónica: {rcp_trans_count:,} ({rcp_trans_pct:.1f}%)")
+        rcp_trans_count = resumen['rcp_transtelefonica']
+        print(f"RCP Transtelefónica: {rcp_trans_count:,} ({rcp_trans_count / total_valid * 100:.1f}%)")
     
     # Análisis de RCP por testigos
-    if 'RCP_TESTIGOS' in df_valid.columns:
-        # Contar diferentes tipos de testigos
-        testigos_counts = df_valid['RCP_TESTIGOS'].value_counts(dropna=False)
+    if resumen['testigos'] is not None:
         print(f"\nDistribución RCP por testigos:")
-        for testigo, count in testigos_counts.items():
+        for testigo, count in resumen['testigos'].items():
             pct = count / total_valid * 100
             print(f"  {testigo}: {count:,} ({pct:.1f}%)")
     
     # Análisis de ROSC
     if 'ROSC' in df_valid.columns:
-        rosc_count = (df_valid['ROSC'] == 1).sum()
-        rosc_pct = rosc_count / total_valid * 100
-        print(f"\nROSC: {rosc_count:,} ({rosc_pct:.1f}%)")
+        rosc_count = resumen['rosc']
+        print(f"\nROSC: {rosc_count:,} ({rosc_count / total_valid * 100:.1f}%)")
     
     # Análisis de Supervivencia a 7 días
     if 'Supervivencia_7dias' in df_valid.columns:
-        surv_count = (df_valid['Supervivencia_7dias'] == 1).sum()
-        surv_pct = surv_count / total_valid * 100
-        print(f"Supervivencia 7 días: {surv_count:,} ({surv_pct:.1f}%)")
+        surv_count = resumen['supervivencia_7dias']
+        print(f"Supervivencia 7 días: {surv_count:,} ({surv_count / total_valid * 100:.1f}%)")
     
     # Análisis de CPC favorable (1-2)
-    def is_favorable_cpc(value):
-        try:
-            # Manejar tanto int como float
-            if pd.isna(value):
-                return False
-            cpc_val = int(value)
-            return cpc_val in [1, 2]
-        except (ValueError, TypeError):
-            return False
-    
-    df_valid_copy = df_valid.copy()
-    df_valid_copy['CPC_favorable'] = df_valid_copy['CPC'].apply(is_favorable_cpc)
-    cpc_fav_count = df_valid_copy['CPC_favorable'].sum()
-    cpc_fav_pct = cpc_fav_count / total_valid * 100
-    print(f"CPC favorable (1-2): {cpc_fav_count:,} ({cpc_fav_pct:.1f}%)")
+    cpc_fav_count = resumen['cpc_favorable']
+    print(f"CPC favorable (1-2): {cpc_fav_count:,} ({cpc_fav_count / total_valid * 100:.1f}%)")
     
     # Análisis por edad
-    if 'EDAD' in df_valid.columns:
-        edad_stats = df_valid['EDAD'].describe()
+    if resumen['edad'] is not None:
+        edad_stats = resumen['edad']
         print(f"\nEstadísticas de edad:")
-        print(f"  Media: {edad_stats['mean']:.1f} años")
-        print(f"  Mediana: {edad_stats['50%']:.1f} años")
+        print(f"  Media: {edad_stats['media']:.1f} años")
+        print(f"  Mediana: {edad_stats['mediana']:.1f} años (RIC {edad_stats['p25']:.0f} - {edad_stats['p75']:.0f}, "
+              f"exacta hasta {resumen['sketches']['k']} valores, después error de rango ≤ "
+              f"{rank_error(resumen['sketches']['k']) * 100:.1f}%)")
         print(f"  Rango: {edad_stats['min']:.0f} - {edad_stats['max']:.0f} años")
         
         # Estratificación por edad <65 vs ≥65
-        bajo_65 = (df_valid['EDAD'] < 65).sum()
-        alto_65 = (df_valid['EDAD'] >= 65).sum()
+        bajo_65 = resumen['edad_menor_65']
+        alto_65 = resumen['edad_65_o_mas']
         print(f"  <65 años: {bajo_65:,} ({bajo_65/total_valid*100:.1f}%)")
         print(f"  ≥65 años: {alto_65:,} ({alto_65/total_valid*100:.1f}%)")
     
     # Análisis por sexo
-    if 'SEXO' in df_valid.columns:
-        sexo_counts = df_valid['SEXO'].value_counts(dropna=False)
+    if resumen['sexo'] is not None:
         print(f"\nDistribución por sexo:")
-        for sexo, count in sexo_counts.items():
+        for sexo, count in resumen['sexo'].items():
             pct = count / total_valid * 100
             print(f"  {sexo}: {count:,} ({pct:.1f}%)")
     
-    return df_valid_copy
+    return df_valid
 
 def create_pdf_report(df_original, df_valid, df_excluded):
-    """Crear reporte en PDF"""
+    """Crear reporte en PDF (con el resumen ya calculado por analyze_valid_data)"""
     
     print("\n" + "="*60)
     print("GENERANDO REPORTE PDF")
     print("="*60)
     
+    resumen = df_valid.attrs.get('resumen') or summarize_valid(df_valid)
+    
     output_file = "reporte_datos_rcp_transtelefonica.pdf"
     
-    with PdfPages(output_file) as pdf:
+    with atomic_write(output_file) as tmp_path, PdfPages(tmp_path) as pdf:
         # Configurar estilo
         plt.style.use('default')
         fig_size = (12, 8)
@@ -300,16 +359,7 @@ def create_pdf_report(df_original, df_valid, df_excluded):
         
         # Gráfico 2: CPC favorable
         if len(df_valid) > 0 and 'CPC' in df_valid.columns:
-            def is_favorable_cpc_pdf(value):
-                try:
-                    if pd.isna(value):
-                        return False
-                    cpc_val = int(value)
-                    return cpc_val in [1, 2]
-                except (ValueError, TypeError):
-                    return False
-            
-            cpc_favorable = df_valid['CPC'].apply(is_favorable_cpc_pdf).sum()
+            cpc_favorable = resumen['cpc_favorable']
             cpc_no_favorable = len(df_valid) - cpc_favorable
             ax2.bar(['CPC Favorable\n(1-2)', 'CPC No Favorable\n(3-5)'], 
                    [cpc_favorable, cpc_no_favorable], 
@@ -323,7 +373,7 @@ def create_pdf_report(df_original, df_valid, df_excluded):
         
         # Gráfico 3: Distribución por edad
         if 'EDAD' in df_valid.columns and len(df_valid) > 0:
-            edades = df_valid['EDAD'].dropna()
+            edades = df_valid['EDAD'].dropna().astype(float)
             ax3.hist(edades, bins=20, color='skyblue', alpha=0.7, edgecolor='black')
             ax3.axvline(edades.mean(), color='red', linestyle='--', label=f'Media: {edades.mean():.1f}')
             ax3.axvline(edades.median(), color='orange', linestyle='--', label=f'Mediana: {edades.median():.1f}')
@@ -333,8 +383,8 @@ def create_pdf_report(df_original, df_valid, df_excluded):
             ax3.legend()
         
         # Gráfico 4: Tipos de RCP
-        if 'RCP_TESTIGOS' in df_valid.columns and len(df_valid) > 0:
-            rcp_counts = df_valid['RCP_TESTIGOS'].value_counts().head(5)
+        if resumen['testigos'] is not None and len(df_valid) > 0:
+            rcp_counts = resumen['testigos'].dropna().head(5)
             ax4.bar(range(len(rcp_counts)), rcp_counts.values, color='lightcoral')
             ax4.set_title('Tipos de RCP por Testigos (Top 5)')
             ax4.set_xlabel('Tipo de RCP')
@@ -361,21 +411,10 @@ def create_pdf_report(df_original, df_valid, df_excluded):
         
         if len(df_valid) > 0:
             # Añadir estadísticas de datos válidos
-            rcp_trans = (df_valid['RCP_TRANSTELEFONICA'] == 1).sum() if 'RCP_TRANSTELEFONICA' in df_valid.columns else 0
-            rosc = (df_valid['ROSC'] == 1).sum() if 'ROSC' in df_valid.columns else 0
-            supervivencia = (df_valid['Supervivencia_7dias'] == 1).sum() if 'Supervivencia_7dias' in df_valid.columns else 0
-            
-            # CPC favorable con manejo de enteros
-            def is_favorable_cpc_table(value):
-                try:
-                    if pd.isna(value):
-                        return False
-                    cpc_val = int(value)
-                    return cpc_val in [1, 2]
-                except (ValueError, TypeError):
-                    return False
-            
-            cpc_fav = df_valid['CPC'].apply(is_favorable_cpc_table).sum()
+            rcp_trans = resumen['rcp_transtelefonica']
+            rosc = resumen['rosc']
+            supervivencia = resumen['supervivencia_7dias']
+            cpc_fav = resumen['cpc_favorable']
             
             summary_data.extend([
                 ['', '', ''],
@@ -412,8 +451,8 @@ def main():
     os.chdir("/Users/miguelrosa/Desktop/RCP Transtelefonica/data/2.Data_cleaning")
     
     try:
-        # 1. Cargar y limpiar datos
-        df = load_and_analyze_data()
+        # 1. Cargar y limpiar datos; tipos y flags derivados en una pasada
+        df = add_derived_flags(load_and_analyze_data())
         
         # 2. Analizar CPC
         df = analyze_cpc_values(df)
@@ -421,8 +460,14 @@ def main():
         # 3. Analizar exclusiones
         df = analyze_exclusions(df)
         
-        # 4. Crear datasets separados
-        df_valid, df_excluded = create_datasets(df)
+        # 4. Crear datasets separados (en el directorio de la ejecución) y publicarlos
+        run_id, run_dir = start_run(OUTPUT_ROOT, pipeline='datasets')
+        try:
+            df_valid, df_excluded = create_datasets(df, run_dir)
+        except BaseException:
+            finish_run(OUTPUT_ROOT, run_id, 'datasets', publish=False)
+            raise
+        finish_run(OUTPUT_ROOT, run_id, 'datasets')
         
         # 5. Analizar datos válidos
         df_valid = analyze_valid_data(df_valid)
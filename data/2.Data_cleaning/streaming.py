@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Ingesta en streaming de registros de llamadas cerradas para el estudio de RCP Transtelefónica.
+
+En lugar de esperar al export histórico anual, este script consume los
+registros a medida que se cierran y aplica por registro las mismas reglas
+que cleaning.py (trauma, tipo de respondiente, ritmo, ROSC, supervivencia/CPC).
+
+Fuentes soportadas:
+- Directorio de entrega: ficheros .jsonl o .csv (delimitador ';', mismas
+  columnas que el export crudo) que se leen en modo "tail" según van creciendo
+- Socket local: servidor TCP que recibe un registro JSON por línea
+  (sustituto local del feed del centro coordinador)
+
+Los registros SVB se retienen en un buffer de emparejamiento (tiempo del
+evento; la ventana de CLEANING_RULES, 2 horas) hasta que llega su SVA. Si
+un SVB llega después de emitir su SVA, se emite una revisión del registro
+fusionado. Los SVB que salen del buffer sin pareja se excluyen, igual que
+en merge_svb_sva.
+
+Las colas entre fuente, procesado y escritura están acotadas, de modo que
+si la escritura se retrasa las fuentes dejan de leer (back-pressure).
+
+Salidas (en --output-dir):
+- stream_registros.jsonl: registros limpios (evento 'nuevo' o 'revision')
+- stream_excluidos.jsonl: registros excluidos con su motivo (y, en
+  cuarentena, las líneas JSON inválidas: motivo 'json_invalido')
+- stream_kpis.json: KPIs acumulados, reescritos cada pocos segundos, con
+  mediana y cuartiles de edad y tiempos por grupo (sketches KLL de
+  quantile_sketch.py, sin guardar los registros)
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cleaning import (
+    CLEANING_RULES,
+    clean_record,
+    merge_svb_into_sva,
+    normalize_raw_record,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '3.cleaned_data'))
+from quantile_sketch import add_record, finalize_sketch_set, new_sketch_set, query_summary  # noqa: E402
+
+# Ventana de emparejamiento SVA/SVB (la misma que merge_svb_sva)
+PAIRING_WINDOW = pd.Timedelta(hours=CLEANING_RULES['ventana_svb_sva_horas'])
+
+# Tamaño máximo de las colas internas (back-pressure)
+QUEUE_SIZE = 1000
+
+# Cada cuántos segundos se reescribe el fichero de KPIs
+KPI_INTERVAL = 2.0
+
+# Intervalo de sondeo del directorio de entrega (segundos)
+POLL_INTERVAL = 0.5
+
+_END = object()
+
+# Clave del marcador que envían las fuentes por cada línea JSON inválida
+INVALID_LINE = '_linea_invalida'
+
+
+# ============================================================================
+# ESTADO DEL STREAM: BUFFER DE EMPAREJAMIENTO Y KPIs
+# ============================================================================
+
+def new_stream_state():
+    """Crea el estado inicial del stream (buffers de emparejamiento y KPIs)"""
+    return {
+        'svb_pendientes': [],   # SVB esperando a su SVA
+        'sva_recientes': [],    # SVA emitidos que aún pueden recibir un SVB
+        'watermark': pd.NaT,    # Fecha de evento más reciente vista
+        'secuencia': 0,
+        # Cuantiles de edad/tiempos por grupo T-CPR y mes (un registro entra
+        # al incluirse por primera vez; el sketch no admite borrar valores de revisiones)
+        'cuantiles': new_sketch_set(group_col='rcp_transtelefonica', date_col='fecha'),
+        'kpis': {
+            'recibidos': 0,
+            'lineas_invalidas': 0,
+            'total_sva': 0,
+            'total_svb': 0,
+            'total_otros': 0,
+            'svb_emparejados': 0,
+            'svb_no_emparejados': 0,
+            'svb_en_buffer': 0,
+            'excluidos_traumaticos': 0,
+            'incluidos': 0,
+            'revisiones': 0,
+            'rcp_transtelefonica': 0,
+            'rosc': 0,
+            'supervivencia_7dias': 0,
+            'cpc_favorable': 0,
+            'supervivencia_tcpr': 0,
+            'supervivencia_no_tcpr': 0,
+        },
+    }
+
+
+def _kpi_contribution(record):
+    """Contribución de un registro limpio a los contadores de KPIs"""
+    tcpr = record['rcp_transtelefonica'] == 1
+    supervivencia = record['supervivencia_7dias'] == 1
+    return {
+        'incluidos': 1,
+        'rcp_transtelefonica': int(tcpr),
+        'rosc': int(record['rosc'] == 1),
+        'supervivencia_7dias': int(supervivencia),
+        'cpc_favorable': int(record['cpc'] in (1, 2)),
+        'supervivencia_tcpr': int(tcpr and supervivencia),
+        'supervivencia_no_tcpr': int((not tcpr) and supervivencia),
+    }
+
+
+def _apply_kpis(kpis, previous, current):
+    """Actualiza los KPIs restando la versión anterior de un registro y sumando la nueva"""
+    for record, sign in ((previous, -1), (current, 1)):
+        if record is None:
+            continue
+        for key, value in _kpi_contribution(record).items():
+            kpis[key] += sign * value
+
+
+def kpi_snapshot(state):
+    """Devuelve los KPIs acumulados con las tasas derivadas"""
+    kpis = dict(state['kpis'])
+    kpis['svb_en_buffer'] = len(state['svb_pendientes'])
+    incluidos = kpis['incluidos']
+    tcpr = kpis['rcp_transtelefonica']
+    no_tcpr = incluidos - tcpr
+
+    def rate(num, den):
+        return round(num / den * 100, 1) if den > 0 else None
+
+    kpis['pct_rcp_transtelefonica'] = rate(tcpr, incluidos)
+    kpis['pct_rosc'] = rate(kpis['rosc'], incluidos)
+    kpis['pct_supervivencia_7dias'] = rate(kpis['supervivencia_7dias'], incluidos)
+    kpis['pct_cpc_favorable'] = rate(kpis['cpc_favorable'], incluidos)
+    kpis['pct_supervivencia_tcpr'] = rate(kpis['supervivencia_tcpr'], tcpr)
+    kpis['pct_supervivencia_no_tcpr'] = rate(kpis['supervivencia_no_tcpr'], no_tcpr)
+    sketches = finalize_sketch_set(state['cuantiles'])
+    kpis['cuantiles'] = {}
+    for metric in sketches['metricas']:
+        por_grupo = {}
+        for nombre, grupo in (('todos', None), ('tcpr', 1), ('no_tcpr', 0)):
+            resumen = query_summary(sketches, metric, group=grupo)
+            por_grupo[nombre] = {clave: (None if pd.isna(resumen[clave]) else round(resumen[clave], 1))
+                                 for clave in ('p25', 'mediana', 'p75')}
+            por_grupo[nombre]['n'] = resumen['n']
+        kpis['cuantiles'][metric] = por_grupo
+    kpis['watermark'] = None if pd.isna(state['watermark']) else state['watermark'].isoformat()
+    kpis['actualizado'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return kpis
+
+
+def _emit_sva(state, entry, event):
+    """Limpia el SVA (fusionado con su mejor SVB, si lo hay) y genera el evento de salida"""
+    row = entry['sva']
+    if entry['svb'] is not None:
+        row = merge_svb_into_sva(entry['sva'], entry['svb']['row'])
+
+    record, motivo = clean_record(row)
+    _apply_kpis(state['kpis'], entry['emitido'], record)
+
+    # Una revisión puede hacer que el caso pase de incluido a excluido o viceversa
+    state['kpis']['excluidos_traumaticos'] += int(record is None) - int(bool(entry['excluido']))
+    if event == 'revision':
+        state['kpis']['revisiones'] += 1
+    entry['emitido'] = record
+    entry['excluido'] = record is None
+    if record is not None and not entry.get('en_cuantiles'):
+        add_record(state['cuantiles'], record)
+        entry['en_cuantiles'] = True
+
+    if record is None:
+        return {'evento': event, 'excluido': True, 'motivo_exclusion': motivo,
+                'n_informe': row.get('n_informe', np.nan), 'fecha': row.get('fecha', pd.NaT)}
+    return {'evento': event, 'excluido': False, 'registro': record}
+
+
+def _expire(state):
+    """Saca de los buffers los registros cuya ventana de emparejamiento ya ha pasado"""
+    watermark = state['watermark']
+    if pd.isna(watermark):
+        return
+
+    vivos = []
+    for svb in state['svb_pendientes']:
+        if watermark - svb['fecha'] > PAIRING_WINDOW:
+            if svb['parejas'] > 0:
+                state['kpis']['svb_emparejados'] += 1
+            else:
+                state['kpis']['svb_no_emparejados'] += 1
+        else:
+            vivos.append(svb)
+    state['svb_pendientes'] = vivos
+
+    state['sva_recientes'] = [
+        entry for entry in state['sva_recientes']
+        if watermark - entry['fecha'] <= PAIRING_WINDOW
+    ]
+
+
+def process_stream_record(state, raw):
+    """
+    Procesa un registro crudo del stream y devuelve la lista de eventos a
+    emitir (registros limpios nuevos, revisiones o exclusiones).
+    """
+    kpis = state['kpis']
+    kpis['recibidos'] += 1
+    if INVALID_LINE in raw:
+        # Línea que no es un objeto JSON: se guarda en cuarentena con los excluidos
+        kpis['lineas_invalidas'] += 1
+        return [{'evento': 'nuevo', 'excluido': True, 'motivo_exclusion': 'json_invalido',
+                 'origen': raw['origen'], 'error': raw['error'], 'linea': raw[INVALID_LINE]}]
+    row = normalize_raw_record(raw)
+    fecha = row['fecha']
+    tipo_unidad = row.get('tipo_unidad', np.nan)
+
+    if pd.notna(fecha) and (pd.isna(state['watermark']) or fecha > state['watermark']):
+        state['watermark'] = fecha
+
+    events = []
+
+    if tipo_unidad == 'SVA':
+        kpis['total_sva'] += 1
+        state['secuencia'] += 1
+        entry = {'id': state['secuencia'], 'sva': row, 'fecha': fecha, 'svb': None, 'emitido': None, 'excluido': None}
+
+        if pd.notna(fecha):
+            # Buscar el SVB pendiente más cercano dentro de la ventana
+            candidates = [
+                svb for svb in state['svb_pendientes']
+                if abs(svb['fecha'] - fecha) <= PAIRING_WINDOW
+            ]
+            if candidates:
+                best = min(candidates, key=lambda svb: abs(svb['fecha'] - fecha))
+                best['parejas'] += 1
+                entry['svb'] = best
+            state['sva_recientes'].append(entry)
+
+        events.append(_emit_sva(state, entry, 'nuevo'))
+
+    elif tipo_unidad == 'SVB':
+        kpis['total_svb'] += 1
+        if pd.isna(fecha):
+            # Sin fecha nunca puede emparejarse
+            kpis['svb_no_emparejados'] += 1
+            events.append({'evento': 'nuevo', 'excluido': True, 'motivo_exclusion': 'svb_no_emparejado',
+                           'n_informe': row.get('n_informe', np.nan), 'fecha': fecha})
+        else:
+            # parejas: SVA que lo tienen ahora como mejor SVB (un SVB sustituido deja de contar)
+            svb = {'row': row, 'fecha': fecha, 'parejas': 0}
+            state['svb_pendientes'].append(svb)
+
+            # SVA ya emitidos para los que este SVB es mejor pareja que la actual
+            for entry in state['sva_recientes']:
+                diff = abs(entry['fecha'] - fecha)
+                if diff > PAIRING_WINDOW:
+                    continue
+                if entry['svb'] is None or diff < abs(entry['svb']['fecha'] - entry['fecha']):
+                    if entry['svb'] is not None:
+                        entry['svb']['parejas'] -= 1
+                    entry['svb'] = svb
+                    svb['parejas'] += 1
+                    events.append(_emit_sva(state, entry, 'revision'))
+
+    else:
+        # merge_svb_sva solo conserva registros SVA (y SVB emparejados)
+        kpis['total_otros'] += 1
+        events.append({'evento': 'nuevo', 'excluido': True, 'motivo_exclusion': 'tipo_unidad',
+                       'n_informe': row.get('n_informe', np.nan), 'fecha': fecha})
+
+    _expire(state)
+    return events
+
+
+def flush_stream_state(state):
+    """Cierra el stream: los SVB que quedan en el buffer se cuentan como emparejados o no emparejados"""
+    for svb in state['svb_pendientes']:
+        if svb['parejas'] > 0:
+            state['kpis']['svb_emparejados'] += 1
+        else:
+            state['kpis']['svb_no_emparejados'] += 1
+    state['svb_pendientes'] = []
+    state['sva_recientes'] = []
+
+
+# ============================================================================
+# FUENTES
+# ============================================================================
+
+def _read_new_lines(path, offset, quoted=False):
+    """
+    Lee el texto de las líneas completas añadidas a un fichero desde offset.
+    Con quoted (CSV) un salto de línea dentro de un campo entre comillas no
+    cierra el registro: se corta en el último salto con las comillas
+    equilibradas y el resto se lee en la siguiente pasada.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    if quoted:
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        # Comillas abiertas antes de cada byte (las dobles "" escapadas suman 2)
+        open_quotes = np.cumsum(data == ord('"')) % 2
+        newlines = np.flatnonzero((data == ord('\n')) & (open_quotes == 0))
+        end = int(newlines[-1]) if newlines.size else -1
+    else:
+        end = chunk.rfind(b'\n')
+    if end < 0:
+        return '', offset
+    return chunk[:end + 1].decode('utf-8'), offset + end + 1
+
+
+def _parse_json_line(line, origen):
+    """Registro (dict) de una línea JSON; si no es un objeto JSON válido, marcador de cuarentena"""
+    try:
+        record = json.loads(line)
+    except ValueError as exc:  # JSONDecodeError o bytes que no son UTF-8
+        error = str(exc)
+    else:
+        if isinstance(record, dict):
+            return record
+        error = f'no es un objeto JSON ({type(record).__name__})'
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', errors='replace')
+    print(f"⚠️  Línea JSON inválida en {origen}: {error} (en cuarentena)")
+    return {INVALID_LINE: line.rstrip('\r\n'), 'origen': origen, 'error': error}
+
+
+async def tail_drop_directory(directory, queue, poll_interval=POLL_INTERVAL, stop_event=None):
+    """
+    Vigila un directorio de entrega y envía a la cola cada registro nuevo de
+    los ficheros .jsonl y .csv (los ficheros pueden seguir creciendo).
+    """
+    offsets = {}
+    headers = {}
+    print(f"📂 Vigilando directorio de entrega: {directory}")
+
+    while stop_event is None or not stop_event.is_set():
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not (name.endswith('.jsonl') or name.endswith('.csv')) or not os.path.isfile(path):
+                continue
+            if os.path.getsize(path) <= offsets.get(path, 0):
+                continue
+
+            is_csv = name.endswith('.csv')
+            text, offsets[path] = await asyncio.to_thread(_read_new_lines, path, offsets.get(path, 0), is_csv)
+
+            if not is_csv:
+                for line in text.splitlines():
+                    if line.strip():
+                        await queue.put(_parse_json_line(line, name))
+            else:
+                # El lector csv respeta los saltos de línea dentro de campos entre comillas
+                for values in csv.reader(io.StringIO(text, newline=''), delimiter=';'):
+                    if not values:
+                        continue
+                    if path not in headers:
+                        headers[path] = values
+                        continue
+                    await queue.put(dict(zip(headers[path], values)))
+
+        await asyncio.sleep(poll_interval)
+
+
+async def serve_socket(host, port, queue, stop_event=None):
+    """
+    Servidor TCP local: cada conexión envía un registro JSON por línea.
+    Mientras la cola esté llena no se leen más líneas, y TCP frena al emisor.
+    """
+    async def handle(reader, writer):
+        peer = writer.get_extra_info('peername')
+        origen = f'socket {peer[0]}:{peer[1]}' if peer else 'socket'
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await queue.put(_parse_json_line(line, origen))
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"🔌 Escuchando registros en {host}:{port}")
+    async with server:
+        if stop_event is None:
+            await server.serve_forever()
+        else:
+            await stop_event.wait()
+
+
+# ============================================================================
+# PROCESADO Y ESCRITURA
+# ============================================================================
+
+def _to_json(value):
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+def _write_kpis(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(kpi_snapshot(state), f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def process_queue(state, in_queue, out_queue):
+    """Aplica las reglas de limpieza a cada registro de entrada"""
+    while True:
+        raw = await in_queue.get()
+        if raw is _END:
+            flush_stream_state(state)
+            await out_queue.put(_END)
+            return
+        for event in process_stream_record(state, raw):
+            await out_queue.put(event)
+
+
+async def write_outputs(state, out_queue, output_dir, kpi_interval=KPI_INTERVAL):
+    """Escribe registros limpios, excluidos y KPIs en output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    records_path = os.path.join(output_dir, 'stream_registros.jsonl')
+    excluded_path = os.path.join(output_dir, 'stream_excluidos.jsonl')
+    kpis_path = os.path.join(output_dir, 'stream_kpis.json')
+    last_kpis = 0.0
+    loop = asyncio.get_running_loop()
+
+    with open(records_path, 'a', encoding='utf-8') as records_file, \
+            open(excluded_path, 'a', encoding='utf-8') as excluded_file:
+        while True:
+            event = await out_queue.get()
+            if event is _END:
+                break
+
+            if event['excluido']:
+                line = {key: _to_json(value) for key, value in event.items()}
+                excluded_file.write(json.dumps(line, ensure_ascii=False) + '\n')
+                excluded_file.flush()
+            else:
+                line = {key: _to_json(value) for key, value in event['registro'].items()}
+                line['evento'] = event['evento']
+                records_file.write(json.dumps(line, ensure_ascii=False) + '\n')
+                records_file.flush()
+
+            if loop.time() - last_kpis >= kpi_interval:
+                _write_kpis(kpis_path, state)
+                last_kpis = loop.time()
+                kpis = state['kpis']
+                print(f"   • Recibidos: {kpis['recibidos']} | Incluidos: {kpis['incluidos']} | "
+                      f"T-CPR: {kpis['rcp_transtelefonica']} | SVB en buffer: {len(state['svb_pendientes'])}")
+
+    _write_kpis(kpis_path, state)
+    print(f"💾 KPIs finales guardados en: {kpis_path}")
+
+
+async def run_stream(source, output_dir, queue_size=QUEUE_SIZE, stop_event=None):
+    """
+    Ejecuta el pipeline en streaming. source es una corrutina que recibe la
+    cola de entrada y la va llenando (tail_drop_directory o serve_socket).
+    """
+    state = new_stream_state()
+    in_queue = asyncio.Queue(maxsize=queue_size)
+    out_queue = asyncio.Queue(maxsize=queue_size)
+
+    processor = asyncio.create_task(process_queue(state, in_queue, out_queue))
+    writer = asyncio.create_task(write_outputs(state, out_queue, output_dir))
+    try:
+        await source(in_queue)
+    finally:
+        await in_queue.put(_END)
+        await processor
+        await writer
+    return state
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Ingesta en streaming de registros de RCP')
+    parser.add_argument('--drop-dir', help='Directorio de entrega con ficheros .jsonl/.csv')
+    parser.add_argument('--socket', help='host:puerto en el que escuchar registros JSON por línea')
+    parser.add_argument('--output-dir', default=os.path.join('..', '3.cleaned_data', 'stream'))
+    args = parser.parse_args()
+
+    if bool(args.drop_dir) == bool(args.socket):
+        parser.error('Indica exactamente una fuente: --drop-dir o --socket')
+
+    print("\n" + "="*80)
+    print("📡 INGESTA EN STREAMING - ESTUDIO RCP TRANSTELEFÓNICA")
+    print("="*80)
+    print(f"📅 Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    if args.drop_dir:
+        def source(queue):
+            return tail_drop_directory(args.drop_dir, queue)
+    else:
+        host, port = args.socket.rsplit(':', 1)
+
+        def source(queue):
+            return serve_socket(host, int(port), queue)
+
+    try:
+        asyncio.run(run_stream(source, args.output_dir))
+    except KeyboardInterrupt:
+        print("\n⏹️ Stream detenido")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Validación de esquema y plausibilidad del export crudo al cargarlo.
+
+Las reglas de RAW_SCHEMA (nombres internos, tras COLUMN_MAPPING) se compilan
+una vez en comprobaciones por columna. Cada columna se factoriza y se
+convierte una sola vez (número, fecha o texto normalizado) sobre sus valores
+distintos; cada regla es una máscara vectorizada sobre esa conversión que se
+lleva a las filas con los códigos, sin recorrer filas.
+
+Severidades:
+- 'fatal': falta una columna imprescindible; se aborta en ese momento sin
+  comprobar el resto (ValueError)
+- 'error': la fila no es utilizable (tiempo no numérico, fecha mal formada,
+  booleano desconocido...); se aparta a cuarentena
+- 'aviso': valor sospechoso que no impide procesar la fila; solo se informa
+
+Si la fracción de filas en cuarentena supera MAX_REJECTED_FRACTION también
+se aborta: casi siempre indica un export con otro formato.
+
+Uso:
+    data, resumen = validate_raw_data(data, quarantine_path='cuarentena_registros.csv')
+"""
+
+import numpy as np
+import pandas as pd
+
+# Valores aceptados en las columnas booleanas del export
+BOOLEAN_VALUES = {'verdadero', 'falso', 'true', 'false', '1', '0', '1.0', '0.0'}
+
+# Tiempos parciales en segundos: negativos imposibles, más de 4 h sospechoso
+MAX_SECONDS = 4 * 3600
+
+MAX_REJECTED_FRACTION = 0.5
+
+# columna -> (tipo, [(regla, severidad, parámetros)])
+# tipo: 'numero' | 'fecha' | 'texto'
+RAW_SCHEMA = {
+    'n_informe': ('texto', [('requerida', 'fatal', None), ('no_nulo', 'aviso', None)]),
+    'fecha': ('fecha', [('requerida', 'fatal', None), ('formato', 'error', None), ('no_nulo', 'aviso', None),
+                        ('rango_fecha', 'aviso', ('2000-01-01', None))]),
+    'tipo_unidad': ('texto', [('requerida', 'fatal', None), ('valores', 'aviso', {'sva', 'svb'})]),
+    'edad': ('numero', [('formato', 'aviso', None), ('rango', 'aviso', (0, 120))]),
+    'sexo': ('texto', [('valores', 'aviso', {'masculino', 'femenino', 'desconocido'})]),
+    'tiempo_c0_c1': ('numero', [('formato', 'error', None), ('rango', 'error', (0, None)),
+                                ('rango', 'aviso', (None, MAX_SECONDS))]),
+    'tiempo_c1_c2': ('numero', [('formato', 'error', None), ('rango', 'error', (0, None)),
+                                ('rango', 'aviso', (None, MAX_SECONDS))]),
+    'tiempo_c2_c3': ('numero', [('formato', 'error', None), ('rango', 'error', (0, None)),
+                                ('rango', 'aviso', (None, MAX_SECONDS))]),
+    'tiempo_rcp': ('numero', [('formato', 'error', None), ('rango', 'error', (0, None)),
+                              ('rango', 'aviso', (None, MAX_SECONDS))]),
+    'rcp_transtelefonica': ('texto', [('valores', 'error', BOOLEAN_VALUES)]),
+    'desa_externo': ('texto', [('valores', 'error', BOOLEAN_VALUES)]),
+    'rcp_testigos': ('texto', [('valores', 'error', BOOLEAN_VALUES)]),
+    'ritmo_inicial': ('texto', [('tipo_texto', 'aviso', None)]),
+}
+
+
+def _cast(values, kind):
+    """
+    Conversión de los valores distintos de una columna según su tipo.
+    Devuelve (convertida, vacío), donde vacío es NaN/None o texto en blanco.
+    """
+    text = values.astype(str).str.strip()
+    missing = values.isna() | text.eq('')
+    if kind == 'numero':
+        return pd.to_numeric(values, errors='coerce'), missing
+    if kind == 'fecha':
+        # La misma conversión que merge_svb_sva, para validar lo que el pipeline verá
+        return pd.to_datetime(values, errors='coerce'), missing
+    return text.str.lower(), missing
+
+
+def _compile_rule(rule, params):
+    """Devuelve f(original, convertida, vacío) -> máscara de filas que incumplen"""
+    if rule == 'no_nulo':
+        return lambda raw, cast, missing: missing
+    if rule == 'formato':
+        return lambda raw, cast, missing: ~missing & cast.isna()
+    if rule == 'rango':
+        lo, hi = params
+        def check(raw, cast, missing):
+            bad = pd.Series(False, index=raw.index)
+            if lo is not None:
+                bad |= cast < lo
+            if hi is not None:
+                bad |= cast > hi
+            return bad
+        return check
+    if rule == 'rango_fecha':
+        lo = pd.Timestamp(params[0])
+        hi = pd.Timestamp(params[1]) if params[1] else pd.Timestamp.now()
+        return lambda raw, cast, missing: (cast < lo) | (cast > hi)
+    if rule == 'valores':
+        allowed = list(params)
+        return lambda raw, cast, missing: ~missing & ~cast.isin(allowed)
+    if rule == 'tipo_texto':
+        return lambda raw, cast, missing: ~missing & ~raw.map(lambda v: isinstance(v, str))
+    raise ValueError(f"Regla desconocida: '{rule}'")
+
+
+def compile_schema(schema=None):
+    """Compila el esquema en [(columna, tipo, [(regla, severidad, función)])]"""
+    schema = schema or RAW_SCHEMA
+    compiled = []
+    for col, (kind, rules) in schema.items():
+        compiled.append((col, kind, [(rule, severity, None if rule == 'requerida' else _compile_rule(rule, params))
+                                     for rule, severity, params in rules]))
+    return compiled
+
+
+_COMPILED = compile_schema()
+
+
+def validate_raw_data(data, quarantine_path=None, schema=None, max_rejected=MAX_REJECTED_FRACTION, verbose=True):
+    """
+    Valida el DataFrame crudo (columnas ya renombradas). Devuelve
+    (filas válidas, resumen por columna/regla). Las filas con algún 'error'
+    se escriben en quarantine_path con sus motivos si se indica.
+    """
+    compiled = compile_schema(schema) if schema is not None else _COMPILED
+
+    # Fatales primero: sin estas columnas no tiene sentido seguir
+    for col, kind, rules in compiled:
+        if col not in data.columns and any(rule == 'requerida' for rule, _, _ in rules):
+            raise ValueError(f"❌ Validación: falta la columna obligatoria '{col}' en el export crudo")
+
+    summary = []
+    rejected = pd.Series(False, index=data.index)
+    reasons = pd.Series('', index=data.index)
+
+    for col, kind, rules in compiled:
+        if col not in data.columns:
+            continue
+        # Reglas sobre los valores distintos (+ NaN al final) y luego a las filas
+        codes, uniques = pd.factorize(data[col])
+        values = pd.Series(list(uniques) + [np.nan], dtype=object)
+        codes = np.where(codes < 0, len(uniques), codes)
+        cast, missing = _cast(values, kind)
+        for rule, severity, check in rules:
+            if check is None:
+                continue
+            bad_values = check(values, cast, missing).fillna(False).to_numpy(dtype=bool)
+            if not bad_values.any():
+                continue
+            bad = pd.Series(bad_values[codes], index=data.index)
+            n_bad = int(bad.sum())
+            if n_bad == 0:
+                continue
+            summary.append({'columna': col, 'regla': rule, 'severidad': severity, 'n_filas': n_bad,
+                            'ejemplos': ', '.join(map(str, values[bad_values].head(5).tolist()))})
+            if severity == 'error':
+                rejected |= bad
+                reasons = reasons.where(~bad, reasons + f"{col}:{rule};")
+
+    summary = pd.DataFrame(summary, columns=['columna', 'regla', 'severidad', 'n_filas', 'ejemplos'])
+    n_rejected = int(rejected.sum())
+
+    if verbose:
+        print(f"\n🔎 VALIDACIÓN DEL EXPORT CRUDO ({len(data)} registros)")
+        if summary.empty:
+            print("   ✅ Sin incidencias")
+        for row in summary.itertuples():
+            icon = '❌' if row.severidad == 'error' else '⚠️'
+            print(f"   {icon} {row.columna} [{row.regla}]: {row.n_filas} filas (p. ej. {row.ejemplos})")
+        print(f"   • Registros en cuarentena: {n_rejected}")
+
+    # La cuarentena se guarda también si se aborta: es lo que hay que revisar
+    if quarantine_path is not None and n_rejected:
+        quarantine = data[rejected].copy()
+        quarantine['motivos_cuarentena'] = reasons[rejected].str.rstrip(';')
+        quarantine.to_csv(quarantine_path, index=False)
+        if verbose:
+            print(f"   💾 Cuarentena guardada en: {quarantine_path}")
+
+    if len(data) and n_rejected / len(data) > max_rejected:
+        raise ValueError(f"❌ Validación: {n_rejected}/{len(data)} registros con errores "
+                         f"(> {max_rejected:.0%}); revisar el formato del export"
+                         + (f" (cuarentena en {quarantine_path})" if quarantine_path is not None else ''))
+
+    valid = data[~rejected].copy()
+    return valid, summary
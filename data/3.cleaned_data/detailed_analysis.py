@@ -11,6 +11,9 @@ import seaborn as sns
 from datetime import datetime
 import os
 
+from quantile_sketch import NOTEBOOK_METRICS, build_sketch_set, query_summary, rank_error
+from shared_cohort import attach_if_fresh
+
 def load_processed_data():
     """Cargar los datos ya procesados"""
     
@@ -19,9 +22,14 @@ def load_processed_data():
     print("="*70)
     print(f"Fecha de análisis: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    # Cargar datos procesados
-    df_valid = pd.read_csv("datos_con_cpc_valido.csv")
-    df_excluded = pd.read_csv("datos_excluidos.csv")
+    # Cargar datos procesados (cohorte compartida si está publicada y al día)
+    df_valid = attach_if_fresh("datos_con_cpc_valido.csv")
+    df_excluded = attach_if_fresh("datos_excluidos.csv")
+    if df_valid is not None and df_excluded is not None:
+        print("📦 Usando cohorte publicada en memoria compartida (shared_cohort.py)")
+    else:
+        df_valid = pd.read_csv("datos_con_cpc_valido.csv")
+        df_excluded = pd.read_csv("datos_excluidos.csv")
     
     print(f"Datos válidos cargados: {len(df_valid):,} registros")
     print(f"Datos excluidos cargados: {len(df_excluded):,} registros")
@@ -184,24 +192,30 @@ def detailed_valid_analysis(df_valid):
     print("ANÁLISIS DE TIEMPOS")
     print("="*50)
     
-    if 'Tiempo_llegada' in df_valid.columns:
-        tiempo_llegada = df_valid['Tiempo_llegada'].dropna()
-        if len(tiempo_llegada) > 0:
-            print("Tiempo de llegada (segundos):")
-            print(f"  Media: {tiempo_llegada.mean():.0f}s ({tiempo_llegada.mean()/60:.1f} min)")
-            print(f"  Mediana: {tiempo_llegada.median():.0f}s ({tiempo_llegada.median()/60:.1f} min)")
-            print(f"  Rango: {tiempo_llegada.min():.0f}s - {tiempo_llegada.max():.0f}s")
-            print(f"  Casos con datos: {len(tiempo_llegada):,}/{total_valid:,}")
-    
-    if 'Tiempo_Rcp' in df_valid.columns:
-        tiempo_rcp = df_valid['Tiempo_Rcp'].dropna()
-        tiempo_rcp = tiempo_rcp[tiempo_rcp > 0]  # Excluir valores 0
-        if len(tiempo_rcp) > 0:
-            print("\nTiempo de RCP (segundos, excluyendo 0s):")
-            print(f"  Media: {tiempo_rcp.mean():.0f}s ({tiempo_rcp.mean()/60:.1f} min)")
-            print(f"  Mediana: {tiempo_rcp.median():.0f}s ({tiempo_rcp.median()/60:.1f} min)")
-            print(f"  Rango: {tiempo_rcp.min():.0f}s - {tiempo_rcp.max():.0f}s")
-            print(f"  Casos con datos: {len(tiempo_rcp):,}/{total_valid:,}")
+    # Sketches KLL por grupo de RCP y mes (Tiempo de RCP sin los valores 0)
+    tiempos = df_valid.assign(Tiempo_Rcp=df_valid['Tiempo_Rcp'].where(df_valid['Tiempo_Rcp'] > 0)) \
+        if 'Tiempo_Rcp' in df_valid.columns else df_valid
+    sketches = build_sketch_set(tiempos, NOTEBOOK_METRICS, group_col='Grupo_RCP', date_col='FECHA_LLAMADA')
+    
+    for metrica, columna, titulo in (('tiempo_llegada', 'Tiempo_llegada', 'Tiempo de llegada (segundos):'),
+                                     ('tiempo_rcp', 'Tiempo_Rcp', 'Tiempo de RCP (segundos, excluyendo 0s):')):
+        if columna not in df_valid.columns:
+            continue
+        resumen = query_summary(sketches, metrica)
+        if resumen['n'] > 0:
+            print(("\n" if metrica == 'tiempo_rcp' else "") + titulo)
+            print(f"  Media: {resumen['media']:.0f}s ({resumen['media']/60:.1f} min)")
+            print(f"  Mediana: {resumen['mediana']:.0f}s ({resumen['mediana']/60:.1f} min), "
+                  f"RIC {resumen['p25']:.0f}s - {resumen['p75']:.0f}s")
+            print(f"  Rango: {resumen['min']:.0f}s - {resumen['max']:.0f}s")
+            print(f"  Casos con datos: {resumen['n']:,}/{total_valid:,}")
+            for grupo in grupos_rcp.index:
+                resumen_grupo = query_summary(sketches, metrica, group=grupo)
+                if resumen_grupo['n'] > 0:
+                    print(f"    {grupo:30s}: mediana {resumen_grupo['mediana']:.0f}s "
+                          f"(RIC {resumen_grupo['p25']:.0f}-{resumen_grupo['p75']:.0f}s, n={resumen_grupo['n']})")
+    print(f"\n(Medianas y cuartiles interpolados como pandas: exactos hasta {sketches['k']} valores, "
+          f"después error de rango ≤ {rank_error(sketches['k']) * 100:.1f}%)")
     
     return df_valid
 
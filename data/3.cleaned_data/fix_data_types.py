@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 """
 Script para corregir tipos de datos a enteros naturales
+
+Corrige los ficheros en una ejecución nueva del pipeline 'datasets'
+derivada de la publicada (run_outputs.derive_run) y la publica: los
+ficheros publicados y el puntero ejecucion_actual.json siguen indicando la
+misma ejecución.
 """
 
+import os
+
 import pandas as pd
 import numpy as np
 
+from run_outputs import derive_run, finish_run, write_csv_atomic
+
+OUTPUT_ROOT = os.path.dirname(os.path.abspath(__file__))
+PIPELINE = 'datasets'
+
 def fix_data_types():
     """Corregir tipos de datos en los archivos finales"""
     
@@ -25,33 +37,41 @@ def fix_data_types():
         'ROSC', 'Supervivencia_7dias', 'CPC'
     ]
     
-    for filename in files_to_fix:
-        print(f"\nProcesando: {filename}")
-        
-        # Cargar archivo
-        df = pd.read_csv(filename)
-        print(f"Registros: {len(df):,}")
-        
-        # Convertir columnas a enteros
-        for col in integer_columns:
-            if col in df.columns:
-                # Convertir a numérico, manteniendo NaN
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                
-                # Convertir a entero que permite NaN (Int64)
-                df[col] = df[col].astype('Int64')
-                print(f"  {col}: convertido a Int64")
-        
-        # Guardar archivo corregido
-        df.to_csv(filename, index=False)
-        print(f"✅ {filename} actualizado con tipos correctos")
+    run_id, run_dir, base = derive_run(OUTPUT_ROOT, PIPELINE, label='tipos')
+    print(f"Ejecución {run_id} (a partir de {os.path.basename(base) if base else 'los ficheros publicados'})")
+    try:
+        for filename in files_to_fix:
+            print(f"\nProcesando: {filename}")
+            
+            # Cargar archivo (el de la ejecución publicada; sin ejecuciones, el publicado)
+            source = os.path.join(run_dir, filename)
+            df = pd.read_csv(source if os.path.exists(source) else os.path.join(OUTPUT_ROOT, filename))
+            print(f"Registros: {len(df):,}")
+            
+            # Convertir columnas a enteros
+            for col in integer_columns:
+                if col in df.columns:
+                    # Convertir a numérico, manteniendo NaN
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
+                    
+                    # Convertir a entero que permite NaN (Int64)
+                    df[col] = df[col].astype('Int64')
+                    print(f"  {col}: convertido a Int64")
+            
+            # Guardar archivo corregido en la ejecución (fichero temporal + rename)
+            write_csv_atomic(df, source, index=False)
+            print(f"✅ {filename} actualizado con tipos correctos")
+    except BaseException:
+        finish_run(OUTPUT_ROOT, run_id, PIPELINE, publish=False)
+        raise
+    finish_run(OUTPUT_ROOT, run_id, PIPELINE)
     
     print("\n" + "="*50)
     print("CORRECCIÓN COMPLETADA")
     
     # Verificar resultado final
     print("\nVERIFICACIÓN FINAL:")
-    df_final = pd.read_csv('datos_con_cpc_valido.csv')
+    df_final = pd.read_csv(os.path.join(run_dir, 'datos_con_cpc_valido.csv'))
     print("\nTipos de datos después de corrección:")
     for col in df_final.columns:
         print(f"  {col}: {df_final[col].dtype}")
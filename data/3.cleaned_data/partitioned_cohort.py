@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Cohorte limpia como conjunto de ficheros particionado por año/mes (y región
+si existe la columna), con estadísticas por fichero para cargar solo lo
+necesario.
+
+Estructura en disco:
+    <raiz>/_manifest.json
+    <raiz>/anio=2023/mes=01/part.rcpcol
+    <raiz>/anio=2023/mes=02/region=Centro/part.rcpcol   (con región)
+    <raiz>/anio=sin_fecha/mes=sin_fecha/part.rcpcol      (fecha no válida)
+
+Cada partición es un buffer columnar de shared_cohort.py (mismo formato que
+la cohorte en memoria compartida). El manifiesto guarda, por fichero, el nº
+de filas y estadísticas de cada columna: mínimo/máximo de numéricas y
+fechas y valores distintos de las columnas de texto con pocas categorías
+(sexo, tipo de respondiente, hospital...).
+
+load_partitioned() descarta ficheros con el manifiesto (sin abrirlos) a
+partir de los filtros y solo mapea las columnas pedidas de los que quedan;
+después aplica los filtros fila a fila sobre lo leído.
+
+Filtros: {columna: valor | [valores] | (mínimo, máximo)}, con None en un
+extremo del rango para dejarlo abierto.
+
+Uso:
+    python partitioned_cohort.py write cleaned_data.csv
+    python partitioned_cohort.py info cleaned_data
+    python partitioned_cohort.py query cleaned_data --desde 2024-01-01 --filtro rcp_transtelefonica=1
+
+Desde un notebook:
+    from partitioned_cohort import load_partitioned
+    df = load_partitioned('cleaned_data', columns=['edad', 'rosc'], fecha_desde='2024-01-01',
+                          filters={'tipo_respondiente': ['lego']})
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from shared_cohort import FILE_EXTENSION, attach_cohort, publish_cohort
+
+MANIFEST = '_manifest.json'
+PART_FILE = f'part{FILE_EXTENSION}'
+
+# Columnas de fecha reconocidas (esquema interno y esquema de los notebooks)
+DATE_COLUMNS = ('fecha', 'FECHA_LLAMADA')
+# Columnas de región reconocidas, por si el export las incluye
+REGION_COLUMNS = ('region', 'REGION', 'distrito', 'DISTRITO')
+
+NO_DATE = 'sin_fecha'
+# Por encima de este nº de valores distintos no se guardan los valores en el manifiesto
+MAX_DISTINCT = 64
+
+
+def _find_column(df, candidates):
+    return next((c for c in candidates if c in df.columns), None)
+
+
+def _partition_value(value):
+    """Valor de partición seguro como nombre de directorio"""
+    text = str(value).strip() or 'sin_valor'
+    return text.replace(os.sep, '_').replace('=', '_')
+
+
+def _json_value(value):
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, (np.integer, np.bool_)):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def column_statistics(part):
+    """Estadísticas por columna de una partición para el manifiesto"""
+    stats = {}
+    for col in part.columns:
+        series = part[col]
+        entry = {'nulos': int(series.isna().sum())}
+        values = series.dropna()
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            entry['tipo'] = 'fecha'
+        elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+            entry['tipo'] = 'numero'
+        else:
+            entry['tipo'] = 'texto'
+            values = values.astype(str)
+        if len(values):
+            if entry['tipo'] != 'texto':
+                entry['min'] = _json_value(values.min())
+                entry['max'] = _json_value(values.max())
+            distinct = values.unique()
+            if len(distinct) <= MAX_DISTINCT:
+                entry['valores'] = sorted(_json_value(v) for v in distinct)
+        stats[str(col)] = entry
+    return stats
+
+
+def write_partitioned(df, root, date_col=None, region_col=None, source=None):
+    """
+    Escribe el DataFrame como conjunto particionado en `root`.
+
+    La escritura es atómica a nivel de conjunto: se construye en un
+    directorio temporal junto a `root` y se sustituye al final, de modo que
+    un lector nunca ve un manifiesto a medias. Devuelve el manifiesto.
+    """
+    date_col = date_col or _find_column(df, DATE_COLUMNS)
+    region_col = region_col or _find_column(df, REGION_COLUMNS)
+    if date_col is None:
+        raise ValueError(f"❌ No hay columna de fecha para particionar (se busca {', '.join(DATE_COLUMNS)})")
+
+    df = df.reset_index(drop=True)
+    fechas = pd.to_datetime(df[date_col], errors='coerce')
+    if not pd.api.types.is_datetime64_any_dtype(df[date_col].dtype):
+        df[date_col] = fechas
+    keys = pd.DataFrame({
+        'anio': fechas.dt.year.map(lambda v: NO_DATE if pd.isna(v) else f"{int(v):04d}"),
+        'mes': fechas.dt.month.map(lambda v: NO_DATE if pd.isna(v) else f"{int(v):02d}"),
+    })
+    partition_by = ['anio', 'mes']
+    if region_col is not None:
+        keys['region'] = df[region_col].map(lambda v: 'sin_region' if pd.isna(v) else _partition_value(v))
+        partition_by.append('region')
+
+    root = os.path.abspath(root)
+    parent = os.path.dirname(root)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=f".{os.path.basename(root)}.tmp-")
+    try:
+        files = []
+        for key, index in keys.groupby(partition_by, sort=True).groups.items():
+            key = key if isinstance(key, tuple) else (key,)
+            relative = os.path.join(*(f"{name}={value}" for name, value in zip(partition_by, key)), PART_FILE)
+            part = df.loc[index]
+            publish_cohort(part, os.path.join(staging, relative), source=source)
+            files.append({
+                'ruta': relative,
+                'particion': dict(zip(partition_by, key)),
+                'filas': int(len(part)),
+                'estadisticas': column_statistics(part),
+            })
+
+        manifest = {
+            'columnas': [str(c) for c in df.columns],
+            'columna_fecha': date_col,
+            'columna_region': region_col,
+            'particion': partition_by,
+            'filas': int(len(df)),
+            'ficheros': files,
+            'fuente': source,
+            'escrito': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with open(os.path.join(staging, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        # Sustitución del conjunto anterior (un rename por paso)
+        previous = None
+        if os.path.exists(root):
+            previous = f"{staging}.anterior"
+            os.replace(root, previous)
+        os.replace(staging, root)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def read_manifest(root):
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"❌ {root} no es un conjunto particionado (falta {MANIFEST})")
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _normalize_filter(condition, kind):
+    """('rango', lo, hi) o ('valores', [...]) con cada valor convertido al tipo de la columna"""
+    def convert(v):
+        if v is None:
+            return None
+        if kind == 'fecha':
+            return pd.Timestamp(v)
+        if kind == 'numero':
+            return float(v)
+        return str(v)
+
+    if isinstance(condition, tuple):
+        lo, hi = condition
+        return 'rango', convert(lo), convert(hi)
+    values = condition if isinstance(condition, (list, set, frozenset, np.ndarray, pd.Series)) else [condition]
+    return 'valores', [convert(v) for v in values]
+
+
+def _file_may_match(entry, filters):
+    """False si las estadísticas del fichero garantizan que ninguna fila cumple los filtros"""
+    for col, condition in filters.items():
+        stats = entry['estadisticas'].get(col)
+        if stats is None:
+            continue
+        if stats.get('nulos', 0) == entry['filas']:
+            return False
+        convert = pd.Timestamp if stats['tipo'] == 'fecha' else (lambda v: v)
+        lo = convert(stats['min']) if 'min' in stats else None
+        hi = convert(stats['max']) if 'max' in stats else None
+        if condition[0] == 'rango':
+            if condition[1] is not None and hi is not None and hi < condition[1]:
+                return False
+            if condition[2] is not None and lo is not None and lo > condition[2]:
+                return False
+            continue
+        wanted = condition[1]
+        if 'valores' in stats:
+            if not {convert(v) for v in stats['valores']} & set(wanted):
+                return False
+        elif lo is not None and all(v < lo or v > hi for v in wanted):
+            return False
+    return True
+
+
+def _row_mask(df, col, condition):
+    series = df[col]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    if condition[0] == 'rango':
+        mask = series.notna()
+        if condition[1] is not None:
+            mask &= series >= condition[1]
+        if condition[2] is not None:
+            mask &= series <= condition[2]
+        return mask.to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.isin(condition[1]).to_numpy(dtype=bool)
+    return series.astype(str).isin(condition[1]).to_numpy(dtype=bool)
+
+
+def _concat(parts, columns):
+    """Concatena particiones unificando las categorías de las columnas de texto"""
+    if len(parts) == 1:
+        return parts[0].reset_index(drop=True)
+    data = {}
+    for col in columns:
+        pieces = [p[col] for p in parts]
+        if all(isinstance(s.dtype, pd.CategoricalDtype) for s in pieces):
+            data[col] = pd.Series(union_categoricals([s.array for s in pieces]), name=col)
+        else:
+            data[col] = pd.concat(pieces, ignore_index=True)
+    return pd.DataFrame(data)
+
+
+def load_partitioned(root, columns=None, fecha_desde=None, fecha_hasta=None, filters=None, verbose=True):
+    """
+    Carga la cohorte particionada leyendo solo los ficheros y columnas
+    necesarios.
+
+    - columns: columnas a devolver (por defecto todas)
+    - fecha_desde / fecha_hasta: rango inclusivo sobre la columna de fecha
+      (una fecha_hasta sin hora incluye todo ese día)
+    - filters: {columna: valor | [valores] | (mínimo, máximo)}
+
+    Devuelve un DataFrame con attrs['particiones'] = {'leidos', 'total'}.
+    """
+    manifest = read_manifest(root)
+    kinds = {}
+    for entry in manifest['ficheros']:
+        for col, stats in entry['estadisticas'].items():
+            kinds.setdefault(col, stats['tipo'])
+
+    filters = dict(filters or {})
+    if fecha_hasta is not None:
+        fecha_hasta = pd.Timestamp(fecha_hasta)
+        if fecha_hasta == fecha_hasta.normalize():
+            # Fecha sin hora: incluye todo ese día
+            fecha_hasta += pd.Timedelta(days=1) - pd.Timedelta(1)
+    if fecha_desde is not None or fecha_hasta is not None:
+        filters[manifest['columna_fecha']] = (fecha_desde, fecha_hasta)
+    unknown = [c for c in list(filters) + list(columns or []) if c not in manifest['columnas']]
+    if unknown:
+        raise KeyError(f"❌ Columnas no presentes en el conjunto: {unknown}")
+    conditions = {col: _normalize_filter(cond, kinds.get(col)) for col, cond in filters.items()}
+
+    selected = [e for e in manifest['ficheros'] if _file_may_match(e, conditions)]
+    output_columns = list(columns) if columns is not None else manifest['columnas']
+    needed = output_columns + [c for c in conditions if c not in output_columns]
+
+    parts = []
+    for entry in selected:
+        part = attach_cohort(os.path.join(root, entry['ruta']), columns=needed)
+        if conditions:
+            mask = np.ones(len(part), dtype=bool)
+            for col, condition in conditions.items():
+                mask &= _row_mask(part, col, condition)
+            part = part[mask]
+        if len(part):
+            parts.append(part[output_columns])
+
+    if parts:
+        result = _concat(parts, output_columns)
+    else:
+        result = pd.DataFrame({col: pd.Series(dtype=object) for col in output_columns})
+    result.attrs['particiones'] = {'leidos': len(selected), 'total': len(manifest['ficheros'])}
+    if verbose:
+        print(f"📂 {root}: {len(selected)}/{len(manifest['ficheros'])} ficheros leídos, "
+              f"{len(needed)}/{len(manifest['columnas'])} columnas, {len(result):,} registros")
+    return result
+
+
+def print_dataset_info(root):
+    manifest = read_manifest(root)
+    print(f"🗂️  Conjunto particionado: {root}")
+    print(f"   • Filas: {manifest['filas']:,}")
+    print(f"   • Ficheros: {len(manifest['ficheros'])} (partición: {' / '.join(manifest['particion'])})")
+    print(f"   • Columna de fecha: {manifest['columna_fecha']}")
+    print(f"   • Fuente: {manifest.get('fuente')}")
+    print(f"   • Escrito: {manifest.get('escrito')}")
+    for entry in manifest['ficheros']:
+        fecha = entry['estadisticas'].get(manifest['columna_fecha'], {})
+        rango = f"{fecha.get('min', '-')[:10]} → {fecha.get('max', '-')[:10]}" if 'min' in fecha else 'sin fecha'
+        print(f"   - {entry['ruta']}: {entry['filas']:,} filas ({rango})")
+
+
+def _parse_filter(text):
+    """'col=a,b' -> valores; 'col=lo..hi' -> rango (extremo vacío = abierto)"""
+    col, _, value = text.partition('=')
+    if '..' in value:
+        lo, hi = value.split('..', 1)
+        return col, (lo or None, hi or None)
+    return col, value.split(',')
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Cohorte limpia particionada por año/mes con carga selectiva')
+    parser.add_argument('accion', choices=['write', 'info', 'query'])
+    parser.add_argument('fuente', help='CSV a particionar (write) o directorio del conjunto')
+    parser.add_argument('--out', help='Directorio del conjunto (write; por defecto, el nombre del CSV)')
+    parser.add_argument('--desde', help='Fecha inicial (query)')
+    parser.add_argument('--hasta', help='Fecha final (query)')
+    parser.add_argument('--filtro', action='append', default=[],
+                        help="Filtro 'columna=v1,v2' o 'columna=min..max' (query, repetible)")
+    parser.add_argument('--columnas', help='Columnas separadas por comas (query)')
+    parser.add_argument('--salida', help='CSV donde guardar el resultado (query)')
+    args = parser.parse_args()
+
+    if args.accion == 'write':
+        root = args.out or os.path.splitext(args.fuente)[0]
+        df = pd.read_csv(args.fuente)
+        manifest = write_partitioned(df, root, source=os.path.abspath(args.fuente))
+        print(f"✅ {manifest['filas']:,} registros en {len(manifest['ficheros'])} ficheros → {root}")
+    elif args.accion == 'info':
+        print_dataset_info(args.fuente)
+    else:
+        columns = args.columnas.split(',') if args.columnas else None
+        filters = dict(_parse_filter(f) for f in args.filtro)
+        df = load_partitioned(args.fuente, columns=columns, fecha_desde=args.desde, fecha_hasta=args.hasta,
+                              filters=filters)
+        if args.salida:
+            df.to_csv(args.salida, index=False)
+            print(f"💾 Resultado guardado en: {args.salida}")
+        else:
+            print(df.head(20).to_string())
+
+
+if __name__ == "__main__":
+    main()
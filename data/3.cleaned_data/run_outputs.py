@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Salidas por ejecución con publicación atómica, para poder lanzar varias
+ejecuciones del pipeline a la vez (regiones, escenarios) en la misma máquina.
+
+Cada ejecución escribe en su propio directorio:
+    <raiz>/ejecuciones/<pipeline>/<run_id>/cleaned_data.csv, informe_anomalias.md, ...
+
+(pipeline: 'limpieza' para cleaning.py, 'datasets' para process_data.py)
+
+y al terminar publica ese contenido en las rutas de siempre
+(<raiz>/cleaned_data.csv, ...):
+
+- Cada fichero se publica con fichero temporal en el mismo directorio +
+  os.replace (enlace duro si se puede, sin copiar datos): un lector ve la
+  versión anterior completa o la nueva completa, nunca un fichero a medias.
+- Los directorios (conjuntos particionados) se publican como enlace
+  simbólico a una versión oculta y se cambian de versión con un único
+  os.replace del enlace (ver _replace_dir: la primera publicación sobre un
+  directorio real, y Windows sin enlaces simbólicos, no son atómicas).
+- La publicación y el puntero <raiz>/ejecucion_actual.json (ejecución
+  publicada de cada pipeline) se hacen bajo un bloqueo de fichero
+  (<raiz>/.ejecuciones.lock): dos ejecuciones que terminan a la vez no
+  mezclan sus ficheros y el puntero siempre indica la ejecución cuyos
+  ficheros están publicados.
+
+Para leer un conjunto coherente de ficheros aunque otra ejecución esté
+publicando, current_run_dir() devuelve el directorio (inmutable) de la
+ejecución actual.
+
+Uso:
+    python run_outputs.py info
+    python run_outputs.py limpiar --conservar 5
+    python run_outputs.py publicar limpieza <run_id>     (volver a una ejecución anterior)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+RUNS_DIR = 'ejecuciones'
+POINTER = 'ejecucion_actual.json'
+LOCK_FILE = '.ejecuciones.lock'
+IN_PROGRESS = '.en_curso'
+DESTINATIONS = '.destinos.json'
+LOCK_TIMEOUT = 600
+KEEP_RUNS = 5
+DEFAULT_PIPELINE = 'limpieza'
+
+
+def new_run_id(label=None):
+    """Identificador ordenable por fecha: AAAAMMDD-HHMMSS-<pid>-<aleatorio>[-etiqueta]"""
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    if label:
+        run_id += '-' + ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(label))
+    return run_id
+
+
+def run_path(output_root, run_id, pipeline=DEFAULT_PIPELINE):
+    return os.path.join(output_root, RUNS_DIR, pipeline, run_id)
+
+
+def start_run(output_root, label=None, pipeline=DEFAULT_PIPELINE):
+    """Crea el directorio de una ejecución nueva (marcado como en curso); devuelve (run_id, ruta)"""
+    run_id = new_run_id(label)
+    path = run_path(output_root, run_id, pipeline)
+    os.makedirs(path)
+    with open(os.path.join(path, IN_PROGRESS), 'w') as f:
+        f.write(str(os.getpid()))
+    return run_id, path
+
+
+def _default_mode(base=0o666):
+    """Permisos de un fichero (0o666) o directorio (0o777) nuevo según la umask del proceso"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return base & ~umask
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Devuelve una ruta temporal oculta en el mismo directorio (con la misma
+    extensión, para pandas) y la renombra sobre path al terminar sin errores.
+    mkstemp crea el temporal con 0600: antes de renombrarlo se le dan los
+    permisos de un fichero creado con open() (0644 con la umask habitual).
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{stem}-', suffix=ext)
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.chmod(tmp_path, _default_mode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_csv_atomic(df, path, **kwargs):
+    with atomic_write(path) as tmp_path:
+        df.to_csv(tmp_path, **kwargs)
+
+
+def write_text_atomic(text, path):
+    with atomic_write(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def _try_lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT, poll=0.1):
+    """Bloqueo exclusivo entre procesos sobre un fichero (se libera también si el proceso muere)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    f = open(path, 'a+')
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"No se pudo obtener el bloqueo {path} en {timeout}s")
+                time.sleep(poll)
+        try:
+            yield
+        finally:
+            _unlock(f)
+    finally:
+        f.close()
+
+
+def output_lock(output_root, timeout=LOCK_TIMEOUT):
+    """Bloqueo de las rutas publicadas y del puntero de una raíz de salidas"""
+    return file_lock(os.path.join(output_root, LOCK_FILE), timeout)
+
+
+def _link_or_copy(src, dst):
+    """Enlace duro (los ficheros de una ejecución no se modifican) o copia si no se puede"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _replace_file(src, dest):
+    directory = os.path.dirname(dest) or '.'
+    os.makedirs(directory, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(dest))
+    tmp_path = os.path.join(directory, f'.{stem}-{uuid.uuid4().hex[:8]}{ext}')
+    try:
+        _link_or_copy(src, tmp_path)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _swap_dir(version, dest):
+    """Intercambio por renombrado (sin enlaces simbólicos): entre los dos os.replace dest no existe"""
+    previous = None
+    if os.path.lexists(dest):
+        previous = f"{version}.anterior"
+        os.replace(dest, previous)
+    os.replace(version, dest)
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def _replace_dir(src, dest):
+    """
+    Publica un directorio. La copia (enlaces duros) va a una versión oculta
+    junto a dest (.<nombre>.v-<id>) y dest es un enlace simbólico a ella: el
+    cambio de versión es un único os.replace del enlace, atómico para los
+    lectores. La versión anterior se conserva hasta la siguiente publicación
+    (quien ya la estaba leyendo puede terminar).
+
+    No es atómico: la primera publicación sobre un directorio real (de antes
+    de este esquema), que se aparta antes de crear el enlace, ni los sistemas
+    sin enlaces simbólicos (Windows sin permisos), que usan el intercambio
+    por renombrado: en ambos casos dest no existe durante un instante.
+    """
+    parent = os.path.dirname(os.path.abspath(dest))
+    name = os.path.basename(os.path.abspath(dest))
+    os.makedirs(parent, exist_ok=True)
+    version = os.path.join(parent, f'.{name}.v-{time.strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:8]}')
+    link = None
+    try:
+        shutil.copytree(src, version, copy_function=_link_or_copy)
+        os.chmod(version, _default_mode(0o777))
+        link = os.path.join(parent, f'.{name}.enlace-{uuid.uuid4().hex[:8]}')
+        try:
+            os.symlink(os.path.basename(version), link, target_is_directory=True)
+        except (OSError, NotImplementedError):
+            _swap_dir(version, dest)
+            return
+        previous = os.path.realpath(dest) if os.path.islink(dest) else None
+        if os.path.isdir(dest) and not os.path.islink(dest):
+            legacy = f"{version}.anterior"
+            os.replace(dest, legacy)
+            os.replace(link, dest)
+            shutil.rmtree(legacy, ignore_errors=True)
+        else:
+            os.replace(link, dest)
+    except BaseException:
+        if link and os.path.islink(link):
+            os.remove(link)
+        if os.path.isdir(version) and os.path.realpath(dest) != version:
+            shutil.rmtree(version, ignore_errors=True)
+        raise
+    # Versiones antiguas: se conservan la publicada y la anterior
+    keep = {os.path.basename(version), os.path.basename(previous or '')}
+    for entry in os.listdir(parent):
+        if entry.startswith(f'.{name}.v-') and entry not in keep:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+def read_pointers(output_root):
+    """{pipeline: puntero} de las ejecuciones publicadas"""
+    path = os.path.join(output_root, POINTER)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def current_run_dir(output_root, pipeline=DEFAULT_PIPELINE):
+    """Directorio de la ejecución publicada de un pipeline (None si aún no hay ninguna)"""
+    pointer = read_pointers(output_root).get(pipeline)
+    if pointer is None:
+        return None
+    path = run_path(output_root, pointer['run_id'], pipeline)
+    return path if os.path.isdir(path) else None
+
+
+def derive_run(output_root, pipeline=DEFAULT_PIPELINE, label=None):
+    """
+    Ejecución nueva con el contenido de la publicada del pipeline (enlaces
+    duros, también sus destinos), para corregir algún fichero en ella y
+    volver a publicar con finish_run: así los ficheros publicados siguen
+    siendo los de la ejecución del puntero. Devuelve (run_id, ruta, ruta de
+    la ejecución de origen o None si aún no había ninguna).
+    """
+    base = current_run_dir(output_root, pipeline)
+    run_id, path = start_run(output_root, label, pipeline)
+    if base is not None:
+        for name in os.listdir(base):
+            if name == IN_PROGRESS:
+                continue
+            src = os.path.join(base, name)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(path, name), copy_function=_link_or_copy)
+            else:
+                _link_or_copy(src, os.path.join(path, name))
+    return run_id, path, base
+
+
+def publish_run(output_root, run_id, pipeline=DEFAULT_PIPELINE, destinations=None, timeout=LOCK_TIMEOUT):
+    """
+    Publica los ficheros y directorios de una ejecución en output_root (o en
+    la ruta de destinations[nombre]) y actualiza el puntero del pipeline,
+    todo bajo el bloqueo. Devuelve el puntero escrito.
+    """
+    source = run_path(output_root, run_id, pipeline)
+    destinations_path = os.path.join(source, DESTINATIONS)
+    if destinations is None and os.path.exists(destinations_path):
+        # Republicación: mismos destinos que la primera vez
+        with open(destinations_path, encoding='utf-8') as f:
+            destinations = json.load(f)
+    elif destinations:
+        destinations = {name: os.path.abspath(dest) for name, dest in destinations.items()}
+        write_text_atomic(json.dumps(destinations, indent=2, ensure_ascii=False), destinations_path)
+    destinations = destinations or {}
+    names = sorted(n for n in os.listdir(source) if not n.startswith('.'))
+    with output_lock(output_root, timeout):
+        published = {}
+        for name in names:
+            src = os.path.join(source, name)
+            dest = destinations.get(name, os.path.join(output_root, name))
+            (_replace_dir if os.path.isdir(src) else _replace_file)(src, dest)
+            published[name] = os.path.relpath(dest, output_root)
+        pointer = {
+            'run_id': run_id,
+            'ruta': os.path.relpath(source, output_root),
+            'publicado': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'ficheros': published,
+        }
+        pointers = read_pointers(output_root)
+        pointers[pipeline] = pointer
+        write_text_atomic(json.dumps(pointers, indent=2, ensure_ascii=False), os.path.join(output_root, POINTER))
+    return pointer
+
+
+def finish_run(output_root, run_id, pipeline=DEFAULT_PIPELINE, publish=True, destinations=None):
+    """Cierra una ejecución (quita la marca de en curso) y, si publish, la publica"""
+    marker = os.path.join(run_path(output_root, run_id, pipeline), IN_PROGRESS)
+    if os.path.exists(marker):
+        os.remove(marker)
+    if not publish:
+        return None
+    pointer = publish_run(output_root, run_id, pipeline, destinations)
+    print(f"📌 Ejecución {run_id} publicada ({len(pointer['ficheros'])} salidas)")
+    return pointer
+
+
+def prune_runs(output_root, pipeline=DEFAULT_PIPELINE, keep=KEEP_RUNS):
+    """
+    Borra las ejecuciones terminadas más antiguas de un pipeline, conservando
+    las keep más recientes, la publicada y las que siguen en curso. Devuelve
+    las borradas.
+    """
+    runs_dir = os.path.join(output_root, RUNS_DIR, pipeline)
+    if not os.path.isdir(runs_dir):
+        return []
+    with output_lock(output_root):
+        pointer = read_pointers(output_root).get(pipeline)
+        current = pointer['run_id'] if pointer else None
+        finished = sorted(r for r in os.listdir(runs_dir)
+                          if not os.path.exists(os.path.join(runs_dir, r, IN_PROGRESS)))
+        removed = [r for r in finished[:max(len(finished) - keep, 0)] if r != current]
+        for run_id in removed:
+            shutil.rmtree(os.path.join(runs_dir, run_id), ignore_errors=True)
+    return removed
+
+
+def list_pipelines(output_root):
+    runs_dir = os.path.join(output_root, RUNS_DIR)
+    return sorted(os.listdir(runs_dir)) if os.path.isdir(runs_dir) else []
+
+
+def print_runs(output_root):
+    pointers = read_pointers(output_root)
+    for pipeline in list_pipelines(output_root):
+        runs_dir = os.path.join(output_root, RUNS_DIR, pipeline)
+        runs = sorted(os.listdir(runs_dir))
+        pointer = pointers.get(pipeline)
+        print(f"📂 {pipeline}: {len(runs)} ejecuciones")
+        for run_id in runs:
+            estado = 'en curso' if os.path.exists(os.path.join(runs_dir, run_id, IN_PROGRESS)) else 'terminada'
+            actual = ' ← publicada' if pointer and pointer['run_id'] == run_id else ''
+            print(f"   • {run_id} ({estado}){actual}")
+        if pointer:
+            print(f"   📌 Publicada el {pointer['publicado']}: {', '.join(pointer['ficheros'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ejecuciones del pipeline y salidas publicadas')
+    parser.add_argument('--raiz', default=os.path.dirname(os.path.abspath(__file__)),
+                        help='Raíz de salidas (por defecto data/3.cleaned_data)')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('info', help='Lista las ejecuciones y la publicada de cada pipeline')
+    p_prune = sub.add_parser('limpiar', help='Borra ejecuciones antiguas terminadas')
+    p_prune.add_argument('--conservar', type=int, default=KEEP_RUNS)
+    p_publish = sub.add_parser('publicar', help='Vuelve a publicar una ejecución (p. ej. para deshacer)')
+    p_publish.add_argument('pipeline')
+    p_publish.add_argument('run_id')
+    args = parser.parse_args()
+
+    if args.comando == 'info':
+        print_runs(args.raiz)
+    elif args.comando == 'limpiar':
+        removed = [r for pipeline in list_pipelines(args.raiz) for r in prune_runs(args.raiz, pipeline, args.conservar)]
+        print(f"🗑️ {len(removed)} ejecuciones borradas")
+    elif args.comando == 'publicar':
+        finish_run(args.raiz, args.run_id, args.pipeline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Publicación de la cohorte limpia como buffer columnar de solo lectura
+compartido entre procesos (memory-mapped).
+
+Cada consumidor de los datos limpios (workers en paralelo, celdas de
+bootstrap, detailed_analysis.py, varios notebooks abiertos a la vez)
+parseaba su propia copia del CSV. Con este módulo la cohorte se publica
+una sola vez en un único fichero binario y cada proceso se adjunta a él con
+np.memmap: las columnas son vistas de solo lectura sobre las mismas páginas
+del sistema operativo, sin copias ni parseo.
+
+Formato del fichero:
+    MAGIC (8 bytes) | longitud cabecera (8 bytes, little endian) | cabecera JSON
+    | columnas, cada una alineada a 64 bytes
+
+- Numéricas, booleanas y fechas se guardan con su dtype nativo (las fechas
+  como datetime64[ns], NaT incluido).
+- Texto/objeto se codifica como diccionario: códigos enteros en el buffer y
+  las categorías en la cabecera (-1 = faltante), y se adjunta como
+  pd.Categorical sin copiar los códigos.
+
+Por defecto se publica en /dev/shm (memoria compartida) si existe.
+
+Uso:
+    python shared_cohort.py publish datos_con_cpc_valido.csv
+    python shared_cohort.py info datos_con_cpc_valido
+
+Desde un notebook o un worker:
+    from shared_cohort import attach_cohort
+    df = attach_cohort('datos_con_cpc_valido')
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'RCPCOL01'
+ALIGNMENT = 64
+FILE_EXTENSION = '.rcpcol'
+
+
+def default_shared_dir():
+    """Directorio de publicación: /dev/shm si existe, si no el temporal del sistema"""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def cohort_path(name, directory=None):
+    """Ruta del buffer publicado para un nombre de cohorte (o ruta directa)"""
+    if name.endswith(FILE_EXTENSION) or os.sep in name:
+        return name
+    return os.path.join(directory or default_shared_dir(), f"rcp_{name}{FILE_EXTENSION}")
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _encode_column(series):
+    """Convierte una columna en (array contiguo, metadatos de la cabecera)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = [str(c) for c in series.cat.categories]
+        codes = np.asarray(series.cat.codes)
+        return np.ascontiguousarray(codes), {'tipo': 'categoria', 'categorias': categories}
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        return np.ascontiguousarray(values.to_numpy(dtype='datetime64[ns]')), {'tipo': 'fecha'}
+
+    if pd.api.types.is_bool_dtype(series.dtype) and not series.isna().any():
+        return np.ascontiguousarray(series.to_numpy(dtype=bool)), {'tipo': 'numero'}
+
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        # Enteros con faltantes (Int64) pasan a float64 con NaN, como en read_csv
+        if series.isna().any() and not pd.api.types.is_float_dtype(series.dtype):
+            return np.ascontiguousarray(series.to_numpy(dtype='float64', na_value=np.nan)), {'tipo': 'numero'}
+        return np.ascontiguousarray(series.to_numpy()), {'tipo': 'numero'}
+
+    # Texto u objeto: codificación por diccionario
+    text = series.astype(object).where(series.notna(), None)
+    codes, categories = pd.factorize(text.map(lambda v: v if v is None else str(v)), sort=True)
+    dtype = np.int8 if len(categories) < 127 else (np.int16 if len(categories) < 32767 else np.int32)
+    return codes.astype(dtype), {'tipo': 'categoria', 'categorias': [str(c) for c in categories]}
+
+
+def publish_cohort(df, name, directory=None, source=None):
+    """
+    Publica un DataFrame como buffer columnar compartido.
+
+    La escritura es atómica (fichero temporal + os.replace): los procesos ya
+    adjuntos conservan la versión anterior y los nuevos ven la completa.
+    Devuelve la ruta del buffer publicado.
+    """
+    path = cohort_path(name, directory)
+    arrays = []
+    columns = []
+    offset = 0
+    for col in df.columns:
+        array, meta = _encode_column(df[col])
+        offset = _align(offset)
+        meta.update({
+            'nombre': str(col),
+            'dtype': array.dtype.str,
+            'offset': offset,
+            'nbytes': int(array.nbytes),
+        })
+        columns.append(meta)
+        arrays.append(array)
+        offset += array.nbytes
+
+    header = {
+        'filas': int(len(df)),
+        'columnas': columns,
+        'fuente': source,
+        'fuente_mtime': os.path.getmtime(source) if source and os.path.exists(source) else None,
+        'publicado': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(8, 'little'))
+            f.write(header_bytes)
+            for meta, array in zip(columns, arrays):
+                f.seek(data_start + meta['offset'])
+                f.write(array.tobytes())
+            f.truncate(data_start + _align(offset))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def read_header(name, directory=None):
+    """Lee la cabecera de un buffer publicado; devuelve (cabecera, inicio de datos)"""
+    path = cohort_path(name, directory)
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} no es una cohorte compartida ({FILE_EXTENSION})")
+        length = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(length).decode('utf-8'))
+    return header, _align(len(MAGIC) + 8 + length)
+
+
+def attach_arrays(name, columns=None, directory=None):
+    """
+    Se adjunta al buffer y devuelve {columna: np.ndarray de solo lectura}.
+
+    Los arrays son vistas sobre el mapeo de memoria: no se copia ni se parsea
+    nada. Para las columnas de texto se devuelven los códigos enteros.
+    """
+    path = cohort_path(name, directory)
+    header, data_start = read_header(path)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for meta in header['columnas']:
+        if columns is not None and meta['nombre'] not in columns:
+            continue
+        start = data_start + meta['offset']
+        arrays[meta['nombre']] = buffer[start:start + meta['nbytes']].view(np.dtype(meta['dtype']))
+    return arrays
+
+
+def attach_cohort(name, columns=None, directory=None, text_as_object=False):
+    """
+    Se adjunta al buffer y devuelve un DataFrame cuyas columnas son vistas de
+    solo lectura sobre memoria compartida.
+
+    Las columnas de texto se devuelven como pd.Categorical sobre los códigos
+    compartidos; con text_as_object=True se decodifican a texto (NaN para
+    faltantes) con el mismo dtype que daría pd.read_csv (object, o str en
+    pandas 3). Eso copia solo las columnas de texto.
+
+    Añadir columnas nuevas al DataFrame está permitido (viven en el proceso);
+    modificar in situ las publicadas lanza error, como corresponde a datos
+    compartidos: usar df.copy() si se necesita una copia editable.
+    """
+    path = cohort_path(name, directory)
+    header, _ = read_header(path)
+    arrays = attach_arrays(path, columns)
+    data = {}
+    for meta in header['columnas']:
+        col = meta['nombre']
+        if col not in arrays:
+            continue
+        if meta['tipo'] == 'categoria' and text_as_object:
+            # El código -1 (faltante) toma el último elemento: NaN
+            lookup = np.array(meta['categorias'] + [np.nan], dtype=object)
+            values = lookup[arrays[col]]
+        elif meta['tipo'] == 'categoria':
+            values = pd.Categorical.from_codes(arrays[col], meta['categorias'])
+        else:
+            values = arrays[col]
+        # Series intermedias: el constructor por dict copiaría los códigos
+        data[col] = pd.Series(values, name=col, copy=False)
+    return pd.DataFrame(data, copy=False)
+
+
+def attach_if_fresh(csv_path, name=None, directory=None):
+    """
+    Devuelve la cohorte compartida si está publicada a partir de csv_path y el
+    CSV no ha cambiado desde entonces; en otro caso None.
+
+    Sustituye a pd.read_csv(csv_path), así que el texto se devuelve como
+    texto y no como Categorical: ambos caminos dan los mismos dtypes (con
+    Categorical, groupby/value_counts listarían categorías sin filas).
+    """
+    name = name or os.path.splitext(os.path.basename(csv_path))[0]
+    path = cohort_path(name, directory)
+    if not os.path.exists(path) or not os.path.exists(csv_path):
+        return None
+    header, _ = read_header(path)
+    if header.get('fuente_mtime') != os.path.getmtime(csv_path):
+        return None
+    return attach_cohort(path, text_as_object=True)
+
+
+def unpublish_cohort(name, directory=None):
+    """Elimina un buffer publicado (los procesos adjuntos mantienen su mapeo)"""
+    path = cohort_path(name, directory)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def print_cohort_info(name, directory=None):
+    path = cohort_path(name, directory)
+    header, _ = read_header(path)
+    print(f"📦 Cohorte compartida: {path}")
+    print(f"   • Filas: {header['filas']:,}")
+    print(f"   • Tamaño: {os.path.getsize(path) / 1024:.1f} KB")
+    print(f"   • Fuente: {header.get('fuente')}")
+    print(f"   • Publicado: {header.get('publicado')}")
+    for meta in header['columnas']:
+        extra = f" ({len(meta['categorias'])} categorías)" if meta['tipo'] == 'categoria' else ""
+        print(f"   - {meta['nombre']}: {meta['dtype']}{extra}")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Cohorte limpia en memoria compartida de solo lectura')
+    parser.add_argument('accion', choices=['publish', 'info', 'unpublish'])
+    parser.add_argument('fuente', help='CSV a publicar (publish) o nombre de la cohorte')
+    parser.add_argument('--name', help='Nombre de la cohorte (por defecto, el del CSV)')
+    parser.add_argument('--dir', help='Directorio de publicación (por defecto /dev/shm)')
+    args = parser.parse_args()
+
+    if args.accion == 'publish':
+        name = args.name or os.path.splitext(os.path.basename(args.fuente))[0]
+        df = pd.read_csv(args.fuente)
+        path = publish_cohort(df, name, args.dir, source=os.path.abspath(args.fuente))
+        print(f"✅ Cohorte publicada: {len(df):,} registros → {path}")
+        print_cohort_info(path)
+    elif args.accion == 'info':
+        print_cohort_info(args.name or args.fuente, args.dir)
+    else:
+        unpublish_cohort(args.name or args.fuente, args.dir)
+        print(f"🗑️  Cohorte retirada: {cohort_path(args.name or args.fuente, args.dir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Paquete de análisis inferencial del estudio RCP Transtelefónica.
+
+Contiene la lógica compartida por los notebooks de final_noteboooks/ para
+poder importarla desde ellos o desde scripts.
+"""
+
+from .cohort import (
+    GROUP_ORDER,
+    OUTCOMES,
+    RCP_GROUPS,
+    TCPR_GROUP,
+    asignar_grupo,
+    cpc_favorable,
+    find_root,
+    load_cohort,
+    prepare_cohort,
+    save_json,
+)
+from .bootstrap import (
+    bootstrap_or,
+    bootstrap_risk_difference,
+    get_bootstrap,
+    or_table,
+    quantile_table,
+    rate_table,
+    summarize_cohort,
+)
@@ -0,0 +1,298 @@
+"""
+Motor único de remuestreo bootstrap estratificado.
+
+En lugar de que cada tabla remuestree por su cuenta (o use aproximaciones
+normales/Woolf), se genera una sola vez por cohorte y semilla la matriz de
+remuestreo y se reutiliza (números aleatorios comunes) para todos los
+estadísticos y outcomes: tasas por grupo, diferencias de riesgo, OR,
+medianas e IQR.
+
+La matriz de índices bootstrap (B x n) se guarda en su forma equivalente de
+pesos de frecuencia W (B x n): W[b, i] = veces que el registro i aparece en
+la réplica b. Así cualquier suma sobre una réplica es un producto W @ x y
+todas las réplicas se evalúan a la vez como reducciones vectorizadas:
+
+- conteos y tasas:       W @ (máscara * y)
+- OR / diferencias:      a partir de los conteos 2x2 de cada réplica
+- cuantiles:             acumulado de W sobre los valores ordenados
+
+W se guarda con el dtype entero más pequeño que admite sus conteos (uint8
+en la práctica) y las reducciones se hacen por bloques de réplicas
+(_replicate_blocks), de modo que ni la generación ni los productos crean
+temporales B x n de 4-8 bytes por celda.
+
+El remuestreo es estratificado (por defecto por grupo_rcp): cada réplica
+conserva el tamaño de cada estrato, como en el diseño observado.
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from .cohort import GROUP_ORDER
+
+DEFAULT_B = 2000
+DEFAULT_SEED = 42
+DEFAULT_STRATA = 'grupo_rcp'
+
+# Celdas (réplicas x registros) por bloque en generación y reducciones
+BLOCK_CELLS = 1 << 22
+
+# Caché de matrices por (huella de estratos, B, semilla)
+_BOOTSTRAP_CACHE = {}
+
+
+def bootstrap_weights(strata, B=DEFAULT_B, seed=DEFAULT_SEED):
+    """
+    Matriz de pesos de frecuencia (B x n) de un bootstrap estratificado.
+
+    strata: array de etiquetas de estrato (NaN forma su propio estrato).
+    Las extracciones se generan por bloques de réplicas; el flujo aleatorio
+    es el mismo que en una sola llamada, así que la matriz no depende del
+    tamaño de bloque.
+    """
+    labels = pd.Series(strata).astype(object).where(pd.notna(strata), '__NA__').to_numpy()
+    n = len(labels)
+    rng = np.random.default_rng(seed)
+    weights = np.zeros((B, n), dtype=np.uint8)
+
+    # Orden de estratos fijo para que la matriz dependa solo de datos y semilla
+    for stratum in sorted(set(labels), key=str):
+        idx = np.flatnonzero(labels == stratum)
+        m = len(idx)
+        step = max(1, BLOCK_CELLS // m)
+        for start in range(0, B, step):
+            rows = min(step, B - start)
+            draws = rng.integers(0, m, size=(rows, m))
+            # Conteo por fila sin bucle: desplazar cada réplica a su propio bloque
+            flat = (draws + np.arange(rows)[:, None] * m).ravel()
+            counts = np.bincount(flat, minlength=rows * m).reshape(rows, m)
+            # Un registro repetido más de 255 veces en una réplica: ampliar el dtype
+            if counts.max() > np.iinfo(weights.dtype).max:
+                weights = weights.astype(np.promote_types(weights.dtype, np.min_scalar_type(counts.max())))
+            weights[start:start + rows, idx] = counts
+    return weights
+
+
+def _replicate_blocks(boot, cells_per_row):
+    """Cortes de filas de W con unas BLOCK_CELLS celdas de trabajo cada uno"""
+    step = max(1, BLOCK_CELLS // max(1, cells_per_row))
+    for start in range(0, boot['B'], step):
+        yield slice(start, min(start + step, boot['B']))
+
+
+def _weighted_sums(boot, x):
+    """W @ x (vector de longitud B) sin convertir W entera de golpe"""
+    W = boot['pesos']
+    out = np.empty(boot['B'], dtype=np.result_type(x.dtype, np.int32))
+    for rows in _replicate_blocks(boot, boot['n']):
+        out[rows] = W[rows].astype(out.dtype) @ x
+    return out
+
+
+def get_bootstrap(df, strata_col=DEFAULT_STRATA, B=DEFAULT_B, seed=DEFAULT_SEED):
+    """
+    Devuelve (cacheado) el bootstrap de una cohorte: dict con la matriz de
+    pesos y sus parámetros. Las filas de W siguen el orden de df.
+    """
+    strata = df[strata_col].to_numpy() if strata_col else np.zeros(len(df))
+    digest = hashlib.sha1(pd.util.hash_pandas_object(pd.Series(strata).astype(str), index=False).to_numpy().tobytes()).hexdigest()
+    key = (digest, strata_col, B, seed)
+    if key not in _BOOTSTRAP_CACHE:
+        _BOOTSTRAP_CACHE[key] = {
+            'pesos': bootstrap_weights(strata, B=B, seed=seed),
+            'B': B,
+            'seed': seed,
+            'estratos': strata_col,
+            'n': len(df),
+        }
+    return _BOOTSTRAP_CACHE[key]
+
+
+def clear_bootstrap_cache():
+    _BOOTSTRAP_CACHE.clear()
+
+
+def _as_mask(boot, mask):
+    if mask is None:
+        return np.ones(boot['n'], dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape != (boot['n'],):
+        raise ValueError(f"La máscara debe tener {boot['n']} elementos (una por fila de la cohorte)")
+    return mask
+
+
+def _as_values(boot, values):
+    values = np.asarray(pd.to_numeric(pd.Series(values), errors='coerce'), dtype=float)
+    if values.shape != (boot['n'],):
+        raise ValueError(f"Se esperaban {boot['n']} valores (uno por fila de la cohorte)")
+    return values
+
+
+def percentile_ci(replicates, alpha=0.05):
+    """IC percentil por columnas (o del vector) ignorando réplicas no finitas"""
+    replicates = np.where(np.isfinite(replicates), replicates, np.nan)
+    lcl, ucl = np.nanpercentile(replicates, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return lcl, ucl
+
+
+def event_counts(boot, outcome, mask=None):
+    """
+    Conteos observados y por réplica de un outcome binario en un subgrupo.
+
+    Devuelve ((eventos, total), (eventos_b, total_b)); las réplicas son
+    vectores de longitud B. Los NaN del outcome no cuentan.
+    """
+    y = _as_values(boot, outcome)
+    mask = _as_mask(boot, mask) & ~np.isnan(y)
+    events = (mask & (y == 1)).astype(np.int32)
+    totals = mask.astype(np.int32)
+    return (int(events.sum()), int(totals.sum())), (_weighted_sums(boot, events), _weighted_sums(boot, totals))
+
+
+def _odds_ratio(a, b, c, d):
+    """OR con corrección Haldane-Anscombe donde alguna celda es 0 (vectorizado)"""
+    a, b, c, d = (np.asarray(x, dtype=float) for x in (a, b, c, d))
+    zero = (np.minimum(np.minimum(a, b), np.minimum(c, d)) == 0)
+    a, b, c, d = (np.where(zero, x + 0.5, x) for x in (a, b, c, d))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (a * d) / (b * c)
+
+
+def bootstrap_or(boot, outcome, mask_exposed, mask_reference, alpha=0.05):
+    """
+    OR (evento = 1) de expuestos vs referencia con IC95% bootstrap.
+
+    Sustituye al IC de Woolf de two_by_two_or: la tabla 2x2 se reconstruye en
+    cada réplica. Devuelve (OR, LCL95, UCL95).
+    """
+    (a, n1), (a_b, n1_b) = event_counts(boot, outcome, mask_exposed)
+    (c, n0), (c_b, n0_b) = event_counts(boot, outcome, mask_reference)
+    or_val = _odds_ratio(a, n1 - a, c, n0 - c)
+    lcl, ucl = percentile_ci(np.log(_odds_ratio(a_b, n1_b - a_b, c_b, n0_b - c_b)), alpha)
+    return float(or_val), float(np.exp(lcl)), float(np.exp(ucl))
+
+
+def bootstrap_risk_difference(boot, outcome, mask_exposed, mask_reference, alpha=0.05):
+    """Diferencia de riesgos expuestos - referencia con IC95% bootstrap"""
+    (a, n1), (a_b, n1_b) = event_counts(boot, outcome, mask_exposed)
+    (c, n0), (c_b, n0_b) = event_counts(boot, outcome, mask_reference)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rd = a / n1 - c / n0 if n1 and n0 else np.nan
+        lcl, ucl = percentile_ci(a_b / n1_b - c_b / n0_b, alpha)
+    return float(rd), float(lcl), float(ucl)
+
+
+def weighted_quantiles(boot, values, mask=None, q=(0.25, 0.5, 0.75)):
+    """
+    Cuantiles observados y por réplica (B x len(q)) de una variable continua.
+
+    Se ordenan los valores una sola vez; en cada réplica el cuantil es el
+    primer valor cuyo peso acumulado alcanza q * total (CDF inversa, la misma
+    definición que np.quantile(method='inverted_cdf') para el observado).
+    """
+    x = _as_values(boot, values)
+    mask = _as_mask(boot, mask) & ~np.isnan(x)
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    if not mask.any():
+        return np.full(len(q), np.nan), np.full((boot['B'], len(q)), np.nan)
+
+    idx = np.flatnonzero(mask)
+    order = idx[np.argsort(x[idx], kind='stable')]
+    sorted_x = x[order]
+    positions = np.empty((boot['B'], len(q)), dtype=np.int64)
+    # Acumulado por bloques de réplicas (el total cabe en int32: es como mucho n)
+    for rows in _replicate_blocks(boot, len(order)):
+        cum = np.cumsum(boot['pesos'][rows][:, order], axis=1, dtype=np.int32)
+        targets = q[None, :] * cum[:, -1:]
+        for j in range(len(q)):
+            positions[rows, j] = np.argmax(cum >= np.maximum(targets[:, j:j + 1], 1e-12), axis=1)
+    return np.quantile(sorted_x, q, method='inverted_cdf'), sorted_x[positions]
+
+
+def rate_table(boot, df, group_col, outcome_col, order=None, alpha=0.05):
+    """
+    Proporción de outcome por grupo con IC95% bootstrap.
+
+    Sustituye a proporciones_ci (aproximación normal); mismas columnas:
+    n, p, LCL95, UCL95.
+    """
+    groups = df[group_col].to_numpy()
+    order = order or [g for g in GROUP_ORDER if g in set(groups)]
+    rows = {}
+    for grp in order:
+        (events, total), (events_b, total_b) = event_counts(boot, df[outcome_col], groups == grp)
+        if total == 0:
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lcl, ucl = percentile_ci(events_b / total_b, alpha)
+        rows[grp] = {'n': total, 'p': events / total, 'LCL95': float(lcl), 'UCL95': float(ucl)}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def or_table(boot, df, group_col, outcome_col, ref_label, order=None, alpha=0.05):
+    """
+    OR (IC95% bootstrap) de cada grupo frente a ref_label, con el formato de
+    or_vs_reference: index=grupo, columnas OR, LCL95, UCL95, DR, DR_LCL95, DR_UCL95.
+    """
+    groups = df[group_col].to_numpy()
+    order = order or [g for g in GROUP_ORDER if g in set(groups)]
+    if ref_label not in order:
+        raise ValueError(f"Referencia '{ref_label}' no está en la tabla: {list(order)}")
+    ref_mask = groups == ref_label
+    rows = []
+    for grp in order:
+        if grp == ref_label:
+            rows.append({'grupo': grp, 'OR': 1.0, 'LCL95': 1.0, 'UCL95': 1.0,
+                         'DR': 0.0, 'DR_LCL95': 0.0, 'DR_UCL95': 0.0})
+            continue
+        or_val, lcl, ucl = bootstrap_or(boot, df[outcome_col], groups == grp, ref_mask, alpha)
+        rd, rd_lcl, rd_ucl = bootstrap_risk_difference(boot, df[outcome_col], groups == grp, ref_mask, alpha)
+        rows.append({'grupo': grp, 'OR': or_val, 'LCL95': lcl, 'UCL95': ucl,
+                     'DR': rd, 'DR_LCL95': rd_lcl, 'DR_UCL95': rd_ucl})
+    return pd.DataFrame(rows).set_index('grupo')
+
+
+def quantile_table(boot, df, group_col, value_col, order=None, alpha=0.05):
+    """
+    Mediana e IQR (Q1, Q3) por grupo y en total, cada uno con IC95% bootstrap.
+    """
+    groups = df[group_col].to_numpy()
+    order = order or [g for g in GROUP_ORDER if g in set(groups)]
+    valid = ~np.isnan(_as_values(boot, df[value_col]))
+    rows = {}
+    for grp, mask in [(g, groups == g) for g in order] + [('Total', None)]:
+        point, reps = weighted_quantiles(boot, df[value_col], mask, q=(0.25, 0.5, 0.75))
+        if np.isnan(point).all():
+            continue
+        lcl, ucl = percentile_ci(reps, alpha)
+        iqr_lcl, iqr_ucl = percentile_ci(reps[:, 2] - reps[:, 0], alpha)
+        rows[grp] = {
+            'n': int((_as_mask(boot, mask) & valid).sum()),
+            'mediana': point[1], 'mediana_LCL95': lcl[1], 'mediana_UCL95': ucl[1],
+            'Q1': point[0], 'Q1_LCL95': lcl[0], 'Q1_UCL95': ucl[0],
+            'Q3': point[2], 'Q3_LCL95': lcl[2], 'Q3_UCL95': ucl[2],
+            'IQR': point[2] - point[0], 'IQR_LCL95': float(iqr_lcl), 'IQR_UCL95': float(iqr_ucl),
+        }
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def summarize_cohort(boot, df, outcomes, group_col='grupo_rcp', ref_label='Sin RCP',
+                     value_cols=('Tiempo_llegada', 'Tiempo_Rcp'), order=None, alpha=0.05):
+    """
+    Todas las tablas con IC bootstrap de una pasada y con las mismas réplicas:
+    tasas por grupo, OR y diferencias de riesgo vs referencia por outcome, y
+    mediana/IQR de las variables de tiempo.
+    """
+    resumen = {'tasas': {}, 'or_vs_ref': {}, 'cuantiles': {}}
+    for nombre, col in outcomes.items():
+        if col not in df.columns:
+            continue
+        resumen['tasas'][nombre] = rate_table(boot, df, group_col, col, order, alpha)
+        if ref_label in set(df[group_col]):
+            resumen['or_vs_ref'][nombre] = or_table(boot, df, group_col, col, ref_label, order, alpha)
+    for col in value_cols:
+        if col in df.columns:
+            resumen['cuantiles'][col] = quantile_table(boot, df, group_col, col, order, alpha)
+    return resumen
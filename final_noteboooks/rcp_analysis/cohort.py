@@ -0,0 +1,100 @@
+"""
+Carga y preparación de la cohorte para el análisis inferencial.
+
+Reúne la lógica común de los notebooks (raíz del proyecto, CPC favorable,
+asignación de los 5 grupos de RCP, outcomes) para que los módulos del paquete
+y los notebooks trabajen sobre exactamente la misma cohorte.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATA_FILENAME = 'datos_limpios.xlsx - Sheet 1.csv'
+
+# Outcomes a evaluar: nombre en informes -> columna
+OUTCOMES = {
+    'ROSC': 'ROSC',
+    'Supervivencia': 'Supervivencia_7dias',
+    'CPC_favorable': 'CPC_favorable',
+}
+
+# Orden de presentación de los 5 grupos mutuamente excluyentes
+GROUP_ORDER = ['Sin RCP', 'RCP legos sin telefónica', 'RCP telefónica', 'RCP sanitarios', 'RCP policía/bomberos']
+
+# Grupos con algún tipo de RCP previa (comparativa T-CPR vs no T-CPR)
+RCP_GROUPS = ['RCP telefónica', 'RCP legos sin telefónica', 'RCP sanitarios', 'RCP policía/bomberos']
+TCPR_GROUP = 'RCP telefónica'
+
+
+def find_root():
+    """Descubrir raíz del workspace (para rutas relativas robustas)"""
+    candidates = [Path.cwd(), Path.cwd().parent, Path.cwd().parent.parent]
+    for base in candidates:
+        if (base / 'data' / '3.cleaned_data').exists() and (base / 'final_noteboooks').exists():
+            return base
+    return Path.cwd()
+
+
+def cpc_favorable(x):
+    """CPC 1-2 -> 1, CPC 3-5 -> 0, no interpretable -> NaN"""
+    try:
+        v = int(x)
+        return 1 if v in (1, 2) else 0
+    except Exception:
+        return np.nan
+
+
+def asignar_grupo(row):
+    """
+    Asigna uno de los 5 grupos mutuamente excluyentes. Prioridad:
+    1) Sin RCP previa -> RCP_TESTIGOS == 'falso' y RCP_TRANSTELEFONICA == 0
+    2) RCP CON RCP transtelefónica -> RCP_TRANSTELEFONICA == 1
+    3) RCP legos SIN RCP transtelefónica -> RCP_TESTIGOS == 'lego' y RCP_TRANSTELEFONICA == 0
+    4) RCP por sanitarios -> RCP_TESTIGOS == 'sanitario' y RCP_TRANSTELEFONICA == 0
+    5) RCP por policía/bomberos -> RCP_TESTIGOS in {'policia','bombero'} y RCP_TRANSTELEFONICA == 0
+    """
+    telf = int(row.get('RCP_TRANSTELEFONICA', 0)) if pd.notna(row.get('RCP_TRANSTELEFONICA', np.nan)) else 0
+    testigo = str(row.get('RCP_TESTIGOS', '')).strip().lower()
+    if testigo == 'falso' and telf == 0:
+        return 'Sin RCP'
+    if telf == 1:
+        return 'RCP telefónica'
+    if testigo == 'lego' and telf == 0:
+        return 'RCP legos sin telefónica'
+    if testigo == 'sanitario' and telf == 0:
+        return 'RCP sanitarios'
+    if testigo in {'policia', 'bombero'} and telf == 0:
+        return 'RCP policía/bomberos'
+    return np.nan
+
+
+def prepare_cohort(df):
+    """Normaliza columnas, crea CPC_favorable y grupo_rcp y limpia los outcomes"""
+    df = df.copy()
+    df.columns = [c.strip() for c in df.columns]
+
+    if 'CPC_favorable' not in df.columns:
+        df['CPC_favorable'] = df['CPC'].apply(cpc_favorable)
+
+    # Recalcular siempre para asegurar los 5 grupos
+    df['grupo_rcp'] = df.apply(asignar_grupo, axis=1)
+
+    for col in OUTCOMES.values():
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def load_cohort(data_path=None):
+    """Carga la cohorte limpia (por defecto la del notebook 5) y la prepara"""
+    if data_path is None:
+        data_path = find_root() / 'data' / '3.cleaned_data' / DATA_FILENAME
+    return prepare_cohort(pd.read_csv(data_path))
+
+
+def save_json(obj, path):
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
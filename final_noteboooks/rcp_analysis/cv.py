@@ -0,0 +1,239 @@
+"""
+Harness de validación cruzada para comparar modelos predictivos.
+
+entrenar_modelo_logistico (notebook 3) llamaba a cross_val_score en serie
+para cada outcome y cada familia de modelos se evaluaba en celdas sueltas.
+Aquí:
+
+- Los pliegues estratificados y el preprocesado (imputación por mediana/moda
+  y estandarización de continuas, ajustados solo en el pliegue de
+  entrenamiento) se calculan una vez por outcome y se reutilizan para todos
+  los modelos.
+- Las tareas modelo x outcome x repetición x pliegue se reparten en un pool
+  de procesos; cada worker recibe la caché de pliegues una sola vez al
+  arrancar y las tareas solo llevan claves.
+- Soporta CV repetida (n_repeats) y anidada (nested=True: búsqueda de
+  hiperparámetros con CV interna dentro de cada pliegue externo).
+- Cada resultado registra AUC, tiempo de ajuste y de predicción.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, LogisticRegressionCV
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import GridSearchCV, RepeatedStratifiedKFold, StratifiedKFold
+
+CONTINUOUS_VARIABLES = ['EDAD', 'Tiempo_llegada', 'Tiempo_Rcp']
+
+DEFAULT_MODELS = ['logistica_l2', 'random_forest', 'gradient_boosting']
+
+# Rejillas de hiperparámetros para la CV anidada
+PARAM_GRIDS = {
+    'logistica': {'C': [0.01, 0.1, 1.0, 10.0]},
+    'logistica_l2': {},
+    'random_forest': {'max_depth': [3, 5, None], 'min_samples_leaf': [1, 5, 20]},
+    'gradient_boosting': {'learning_rate': [0.05, 0.1], 'max_depth': [2, 3]},
+}
+
+# Caché de pliegues por proceso (se rellena en el worker con _init_worker)
+_FOLD_CACHE = {}
+
+
+def make_model(name, class_weight=None, seed=42, inner_cv=5):
+    """Crea un estimador nuevo a partir de su nombre (picklable por nombre)"""
+    if name == 'logistica':
+        return LogisticRegression(solver='lbfgs', max_iter=1000, class_weight=class_weight)
+    if name == 'logistica_l2':
+        # Mismo modelo que entrenar_modelo_logistico (C elegido por CV interna)
+        return LogisticRegressionCV(
+            cv=StratifiedKFold(n_splits=inner_cv, shuffle=True, random_state=seed),
+            solver='lbfgs',
+            class_weight=class_weight,
+            random_state=seed,
+            max_iter=1000,
+            scoring='roc_auc',
+        )
+    if name == 'random_forest':
+        return RandomForestClassifier(n_estimators=300, class_weight=class_weight, random_state=seed, n_jobs=1)
+    if name == 'gradient_boosting':
+        return HistGradientBoostingClassifier(class_weight=class_weight, random_state=seed)
+    raise ValueError(f"Modelo desconocido: '{name}'. Opciones: {list(PARAM_GRIDS)}")
+
+
+def _class_weight(y):
+    """'balanced' si hay desbalance > 70/30, como en entrenar_modelo_logistico"""
+    counts = np.bincount(y.astype(int), minlength=2)
+    return 'balanced' if counts.min() / counts.max() < 0.3 else None
+
+
+def _preprocess(X_train, X_test, continuous):
+    """Imputación y escalado ajustados en entrenamiento y aplicados a test"""
+    X_train = X_train.copy()
+    X_test = X_test.copy()
+    for j in range(X_train.shape[1]):
+        col = X_train[:, j]
+        if continuous[j]:
+            fill = np.nanmedian(col)
+        else:
+            values, counts = np.unique(col[~np.isnan(col)], return_counts=True)
+            fill = values[np.argmax(counts)] if len(values) else 0.0
+        X_train[np.isnan(X_train[:, j]), j] = fill
+        X_test[np.isnan(X_test[:, j]), j] = fill
+        if continuous[j]:
+            mean, std = X_train[:, j].mean(), X_train[:, j].std()
+            std = std if std > 0 else 1.0
+            X_train[:, j] = (X_train[:, j] - mean) / std
+            X_test[:, j] = (X_test[:, j] - mean) / std
+    return X_train, X_test
+
+
+def prepare_folds(X, outcomes, n_splits=5, n_repeats=1, seed=42):
+    """
+    Calcula una vez por outcome los pliegues estratificados y las matrices
+    preprocesadas de cada pliegue.
+
+    X: DataFrame de predictoras (sin escalar, puede tener NaN).
+    outcomes: dict {nombre: array/Series binaria alineada con X}.
+    Devuelve {outcome: {'y', 'filas', 'class_weight', 'pliegues': [...]}}.
+    """
+    values = X.to_numpy(dtype=float)
+    continuous = np.array([col in CONTINUOUS_VARIABLES for col in X.columns])
+    cache = {}
+    for name, y in outcomes.items():
+        y = pd.to_numeric(pd.Series(np.asarray(y)), errors='coerce').to_numpy()
+        rows = np.flatnonzero(~np.isnan(y))
+        y_valid = y[rows].astype(int)
+        X_valid = values[rows]
+        splitter = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=seed)
+        folds = []
+        for k, (train, test) in enumerate(splitter.split(X_valid, y_valid)):
+            X_train, X_test = _preprocess(X_valid[train], X_valid[test], continuous)
+            folds.append({
+                'repeticion': k // n_splits,
+                'pliegue': k % n_splits,
+                'train': train,
+                'test': test,
+                'X_train': X_train,
+                'X_test': X_test,
+            })
+        cache[name] = {
+            'y': y_valid,
+            'filas': rows,
+            'class_weight': _class_weight(y_valid),
+            'pliegues': folds,
+        }
+    return cache
+
+
+def _init_worker(cache):
+    global _FOLD_CACHE
+    _FOLD_CACHE = cache
+
+
+def _run_task(task):
+    """Ajusta y evalúa un modelo en un pliegue (se ejecuta en el worker)"""
+    outcome, model_name, fold_id, nested, inner_cv, seed = task
+    entry = _FOLD_CACHE[outcome]
+    fold = entry['pliegues'][fold_id]
+    y_train = entry['y'][fold['train']]
+    y_test = entry['y'][fold['test']]
+
+    model = make_model(model_name, entry['class_weight'], seed, inner_cv)
+    best_params = None
+    if nested and PARAM_GRIDS.get(model_name):
+        model = GridSearchCV(
+            model,
+            PARAM_GRIDS[model_name],
+            cv=StratifiedKFold(n_splits=inner_cv, shuffle=True, random_state=seed),
+            scoring='roc_auc',
+            n_jobs=1,
+        )
+
+    start = time.perf_counter()
+    model.fit(fold['X_train'], y_train)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_proba = model.predict_proba(fold['X_test'])[:, 1]
+    predict_time = time.perf_counter() - start
+
+    if isinstance(model, GridSearchCV):
+        best_params = model.best_params_
+
+    return {
+        'outcome': outcome,
+        'modelo': model_name,
+        'repeticion': fold['repeticion'],
+        'pliegue': fold['pliegue'],
+        'auc': roc_auc_score(y_test, y_proba) if len(np.unique(y_test)) > 1 else np.nan,
+        'tiempo_ajuste_s': fit_time,
+        'tiempo_prediccion_s': predict_time,
+        'n_train': len(y_train),
+        'n_test': len(y_test),
+        'mejores_parametros': best_params,
+        'fold_id': fold_id,
+        'y_proba': y_proba,
+    }
+
+
+def evaluate_models(X, outcomes, models=None, n_splits=5, n_repeats=1, nested=False,
+                    inner_cv=3, n_jobs=None, seed=42, folds=None):
+    """
+    Evalúa modelos x outcomes x pliegues en paralelo.
+
+    Devuelve (resultados, folds): un DataFrame con una fila por tarea (AUC y
+    tiempos) y la caché de pliegues, reutilizable en llamadas posteriores
+    (folds=...) y necesaria para oof_predictions.
+    """
+    models = models or DEFAULT_MODELS
+    if folds is None:
+        folds = prepare_folds(X, outcomes, n_splits, n_repeats, seed)
+
+    tasks = [
+        (outcome, model_name, fold_id, nested, inner_cv, seed)
+        for outcome in folds
+        for model_name in models
+        for fold_id in range(len(folds[outcome]['pliegues']))
+    ]
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    if n_jobs == 1:
+        _init_worker(folds)
+        rows = [_run_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(folds,)) as pool:
+            rows = list(pool.map(_run_task, tasks, chunksize=max(1, len(tasks) // (4 * n_jobs))))
+
+    return pd.DataFrame(rows), folds
+
+
+def summarize_cv(results):
+    """AUC media ± DE y tiempos medios por outcome y modelo"""
+    summary = results.groupby(['outcome', 'modelo']).agg(
+        auc_media=('auc', 'mean'),
+        auc_de=('auc', 'std'),
+        n_pliegues=('auc', 'count'),
+        tiempo_ajuste_medio_s=('tiempo_ajuste_s', 'mean'),
+        tiempo_prediccion_medio_s=('tiempo_prediccion_s', 'mean'),
+        tiempo_ajuste_total_s=('tiempo_ajuste_s', 'sum'),
+    )
+    return summary.reset_index().sort_values(['outcome', 'auc_media'], ascending=[True, False])
+
+
+def oof_predictions(results, folds, outcome, model_name, repeat=0):
+    """
+    Predicciones fuera de pliegue (una por registro) de una repetición, para
+    curvas ROC. Devuelve (y_true, y_proba).
+    """
+    entry = folds[outcome]
+    y_proba = np.full(len(entry['y']), np.nan)
+    subset = results[(results['outcome'] == outcome) & (results['modelo'] == model_name)
+                     & (results['repeticion'] == repeat)]
+    for _, row in subset.iterrows():
+        y_proba[entry['pliegues'][row['fold_id']]['test']] = row['y_proba']
+    return entry['y'], y_proba
@@ -0,0 +1,253 @@
+"""
+Curvas dosis-respuesta: probabilidad de outcome frente a tiempo de RCP y
+tiempo de llegada, por grupo de RCP.
+
+- La cohorte se resume una sola vez en estadísticos suficientes por bin
+  (n, eventos, x medio) con cortes comunes por cuantiles; el ajuste trabaja
+  sobre los bins, así que su coste depende del número de bins y no de n.
+- Cada curva es una logística con P-spline (base B-spline cúbica, penalización
+  de segundas diferencias); lambda se elige por AIC sobre una rejilla.
+- Las bandas de confianza salen de un bootstrap de los bins (remuestreo
+  multinomial de las celdas bin × evento, equivalente a remuestrear
+  pacientes) ajustado por lotes: todas las réplicas en un mismo IRLS.
+- `by` permite repetir las curvas por estrato (año, región, ...) con una sola
+  pasada de agregación.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import BSpline
+
+from .cohort import GROUP_ORDER, OUTCOMES
+
+TIME_COLUMNS = {'Tiempo_Rcp': 'Tiempo de RCP (min)', 'Tiempo_llegada': 'Tiempo de llegada (min)'}
+LAMBDA_GRID = np.logspace(-2, 4, 13)
+# Ridge del Hessiano: con bins vacíos (réplicas bootstrap de grupos pequeños)
+# el Hessiano penalizado puede ser singular
+HESSIAN_RIDGE = 1e-6
+# Mínimos por grupo/estrato para ajustar una curva: pacientes, eventos (y no
+# eventos) y bins con datos
+MIN_N = 50
+MIN_EVENTS = 5
+MIN_BINS = 6
+
+
+def add_year(df, date_col='FECHA_LLAMADA', out_col='anio'):
+    """Añade el año de la llamada como columna de estrato"""
+    df = df.copy()
+    df[out_col] = pd.to_datetime(df[date_col], errors='coerce').dt.year.astype('Int64')
+    return df
+
+
+def bin_statistics(df, x_col, outcome_col, group_col='grupo_rcp', by=None, n_bins=40, scale=60.0):
+    """
+    Estadísticos suficientes por (estrato, grupo, bin): n, eventos y x medio.
+    Los cortes (cuantiles de x en toda la cohorte) son comunes a todos los
+    grupos y estratos. x se divide por `scale` (segundos -> minutos).
+    """
+    by = [by] if isinstance(by, str) else list(by or [])
+    x = pd.to_numeric(df[x_col], errors='coerce') / scale
+    y = pd.to_numeric(df[outcome_col], errors='coerce')
+    mask = x.gt(0) & y.isin([0, 1]) & df[group_col].notna()
+    for col in by:
+        mask &= df[col].notna()
+    data = pd.DataFrame({'x': x[mask], 'y': y[mask]})
+    keys = [group_col] + by
+    for col in keys:
+        data[col] = df.loc[mask, col]
+
+    edges = np.unique(np.quantile(data['x'], np.linspace(0, 1, n_bins + 1)))
+    data['bin'] = np.clip(np.searchsorted(edges, data['x'], side='right') - 1, 0, len(edges) - 2)
+    binned = data.groupby(by + [group_col, 'bin'], observed=True).agg(n=('y', 'size'), eventos=('y', 'sum'),
+                                                                     x=('x', 'mean')).reset_index()
+    binned.attrs['edges'] = edges
+    return binned
+
+
+def spline_basis(x, lo, hi, n_basis=8, degree=3):
+    """Base B-spline con nodos equiespaciados en [lo, hi]"""
+    inner = np.linspace(lo, hi, n_basis - degree + 1)
+    knots = np.r_[[lo] * degree, inner, [hi] * degree]
+    return BSpline.design_matrix(np.clip(x, lo, hi), knots, degree).toarray()
+
+
+def difference_penalty(n_basis, order=2):
+    D = np.diff(np.eye(n_basis), n=order, axis=0)
+    return D.T @ D
+
+
+def fit_pspline_logit(basis, n, events, lam, penalty, maxiter=50, tol=1e-8):
+    """
+    Logística penalizada sobre datos agrupados por IRLS. events (y n) pueden
+    ser (bins,) o (R, bins) para ajustar R réplicas a la vez. Devuelve
+    (coeficientes, grados de libertad efectivos de la primera réplica); las
+    réplicas que no convergen o cuyo sistema es singular quedan en NaN.
+    """
+    events = np.atleast_2d(events).astype(float)
+    n = np.broadcast_to(n, events.shape).astype(float)
+    R, k = events.shape[0], basis.shape[1]
+    beta = np.zeros((R, k))
+    p0 = np.clip(events.sum(axis=1) / np.maximum(n.sum(axis=1), 1), 1e-4, 1 - 1e-4)
+    beta[:] = np.log(p0 / (1 - p0))[:, None]  # la base B-spline suma 1: arranque en la tasa global
+    S = lam * penalty + HESSIAN_RIDGE * np.eye(k)
+    active = np.ones(R, dtype=bool)
+    for _ in range(maxiter):
+        with np.errstate(over='ignore'):
+            mu = 1.0 / (1.0 + np.exp(-(beta @ basis.T)))
+        w = n * mu * (1 - mu)
+        info = np.einsum('ik,ri,ij->rkj', basis, w, basis)
+        hessian = info + S
+        gradient = (events - n * mu) @ basis - beta @ S
+        step = np.zeros_like(beta)
+        try:
+            step[active] = np.linalg.solve(hessian[active], gradient[active, :, None])[..., 0]
+        except np.linalg.LinAlgError:
+            # Réplica a réplica: las singulares se descartan
+            for r in np.flatnonzero(active):
+                try:
+                    step[r] = np.linalg.solve(hessian[r], gradient[r])
+                except np.linalg.LinAlgError:
+                    active[r] = False
+        beta += step
+        active &= np.isfinite(beta).all(axis=1)
+        if not active.any() or np.abs(step[active]).max() < tol:
+            break
+    # Sin converger (separación, bins vacíos): NaN, que nanquantile ignora
+    failed = ~active | (np.abs(step) >= tol).any(axis=1) | ~np.isfinite(beta).all(axis=1)
+    beta[failed] = np.nan
+    edf = np.trace(np.linalg.solve(hessian[0], info[0])) if not failed[0] else np.nan
+    return beta, edf
+
+
+def _binomial_deviance(n, events, mu):
+    mu = np.clip(mu, 1e-12, 1 - 1e-12)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dev = np.where(events > 0, events * np.log(events / (n * mu)), 0.0) \
+            + np.where(n - events > 0, (n - events) * np.log((n - events) / (n * (1 - mu))), 0.0)
+    return 2 * dev.sum()
+
+
+def select_lambda(basis, n, events, penalty, grid=LAMBDA_GRID):
+    """lambda con menor AIC (desviación + 2·gl efectivos)"""
+    best = None
+    for lam in grid:
+        beta, edf = fit_pspline_logit(basis, n, events, lam, penalty)
+        if np.isnan(edf):
+            continue
+        mu = 1.0 / (1.0 + np.exp(-(basis @ beta[0])))
+        aic = _binomial_deviance(n, events, mu) + 2 * edf
+        if best is None or aic < best[0]:
+            best = (aic, lam, beta[0], edf)
+    if best is None:
+        return np.nan, None, np.nan
+    return best[1], best[2], best[3]
+
+
+def fit_curve(cells, n_basis=8, n_grid=100, B=500, alpha=0.05, rng=None):
+    """
+    Curva y banda bootstrap para un conjunto de bins (un grupo/estrato).
+    Devuelve DataFrame con x, prob, LCL, UCL (None si ningún lambda converge).
+    """
+    rng = rng if rng is not None else np.random.default_rng(42)
+    n = cells['n'].to_numpy(float)
+    events = cells['eventos'].to_numpy(float)
+    x = cells['x'].to_numpy(float)
+    lo, hi = x.min(), x.max()
+    basis = spline_basis(x, lo, hi, n_basis)
+    penalty = difference_penalty(n_basis)
+    lam, beta, edf = select_lambda(basis, n, events, penalty)
+    if beta is None:
+        return None
+
+    grid = np.linspace(lo, hi, n_grid)
+    grid_basis = spline_basis(grid, lo, hi, n_basis)
+    prob = 1.0 / (1.0 + np.exp(-(grid_basis @ beta)))
+
+    # Bootstrap de pacientes = multinomial sobre las celdas (bin, evento)
+    total = int(n.sum())
+    cell_probs = np.r_[events, n - events] / total
+    draws = rng.multinomial(total, cell_probs, size=B)
+    n_boot = draws[:, :len(n)] + draws[:, len(n):]
+    beta_boot, _ = fit_pspline_logit(basis, n_boot, draws[:, :len(n)], lam, penalty)
+    curves = 1.0 / (1.0 + np.exp(-(beta_boot @ grid_basis.T)))
+    lcl, ucl = np.nanquantile(curves, [alpha / 2, 1 - alpha / 2], axis=0)
+    return pd.DataFrame({'x': grid, 'prob': prob, 'LCL95': lcl, 'UCL95': ucl, 'n': total, 'lambda': lam,
+                         'gl_efectivos': edf})
+
+
+def dose_response_curves(df, x_cols=tuple(TIME_COLUMNS), outcomes=None, group_col='grupo_rcp', by=None, n_bins=40,
+                         n_basis=8, B=500, min_n=MIN_N, min_events=MIN_EVENTS, min_bins=MIN_BINS, seed=42):
+    """
+    Curvas de probabilidad por (estrato, grupo, outcome, variable de tiempo).
+    Se omiten los grupos/estratos con menos de min_n pacientes, menos de
+    min_events eventos o no eventos, o menos de min_bins bins con datos.
+    Devuelve un DataFrame largo con x (minutos), prob, LCL95 y UCL95.
+    """
+    outcomes = outcomes or OUTCOMES
+    by = [by] if isinstance(by, str) else list(by or [])
+    rng = np.random.default_rng(seed)
+    rows = []
+    for x_col in x_cols:
+        if x_col not in df.columns:
+            continue
+        for name, outcome_col in outcomes.items():
+            if outcome_col not in df.columns:
+                continue
+            binned = bin_statistics(df, x_col, outcome_col, group_col, by, n_bins)
+            for key, cells in binned.groupby(by + [group_col], observed=True):
+                key = key if isinstance(key, tuple) else (key,)
+                total, eventos = cells['n'].sum(), cells['eventos'].sum()
+                if total < min_n or min(eventos, total - eventos) < min_events or len(cells) < min_bins:
+                    continue
+                curve = fit_curve(cells, n_basis=min(n_basis, len(cells)), B=B, rng=rng)
+                if curve is None:
+                    continue
+                curve.insert(0, 'grupo', key[-1])
+                curve.insert(0, 'estrato', '|'.join(f"{c}={v}" for c, v in zip(by, key[:-1])) or 'Global')
+                curve.insert(0, 'outcome', name)
+                curve.insert(0, 'variable', x_col)
+                rows.append(curve)
+    return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+
+
+def plot_dose_response(curves, x_col, outcome, path=None, estrato='Global', order=None, show=False):
+    """Curvas con bandas IC95% por grupo de RCP para una variable y un outcome"""
+    import matplotlib.pyplot as plt
+
+    sub = curves[(curves['variable'] == x_col) & (curves['outcome'] == outcome) & (curves['estrato'] == estrato)]
+    order = [g for g in (order or GROUP_ORDER) if g in set(sub['grupo'])]
+    fig, ax = plt.subplots(figsize=(7, 4.5))
+    for grupo in order:
+        g = sub[sub['grupo'] == grupo]
+        line, = ax.plot(g['x'], g['prob'], label=f"{grupo} (n={g['n'].iloc[0]})")
+        ax.fill_between(g['x'], g['LCL95'], g['UCL95'], color=line.get_color(), alpha=0.15)
+    ax.set_ylim(0, 1)
+    ax.set_xlabel(TIME_COLUMNS.get(x_col, x_col))
+    ax.set_ylabel(f'P({outcome})')
+    ax.set_title(f'{outcome} vs {TIME_COLUMNS.get(x_col, x_col)}' + ('' if estrato == 'Global' else f' — {estrato}'))
+    ax.legend(fontsize=8)
+    plt.tight_layout()
+    if path is not None:
+        plt.savefig(path, dpi=300, bbox_inches='tight', facecolor='white', edgecolor='none')
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+    return fig
+
+
+def run_dose_response(df, outcomes, out_dir, by=None, B=500, seed=42, show=False):
+    """Curvas globales (y por estrato si se pide), CSV y una figura por variable/outcome"""
+    curves = dose_response_curves(df, outcomes=outcomes, B=B, seed=seed)
+    if by:
+        curves = pd.concat([curves, dose_response_curves(df, outcomes=outcomes, by=by, B=B, seed=seed)],
+                           ignore_index=True)
+    out_dir = Path(out_dir)
+    curves.to_csv(out_dir / 'dosis_respuesta_tiempos.csv', index=False)
+    for (x_col, outcome), _ in curves[curves['estrato'] == 'Global'].groupby(['variable', 'outcome']):
+        plot_dose_response(curves, x_col, outcome, out_dir / f'dosis_respuesta_{outcome}_vs_{x_col}.png', show=show)
+    print(f"📈 {curves.groupby(['variable', 'outcome', 'estrato', 'grupo']).ngroups} curvas dosis-respuesta "
+          f"guardadas en {out_dir / 'dosis_respuesta_tiempos.csv'}")
+    return curves
@@ -0,0 +1,371 @@
+"""
+Imputación múltiple por ecuaciones encadenadas (MICE) para la logística
+ajustada T-CPR vs no T-CPR.
+
+La logística ajustada (model_grid, fit_lr_bootstrap) descarta cualquier caso
+con edad, tiempo de llegada o ritmo faltante, y el outcome CPC_favorable
+pierde además a los supervivientes sin CPC. Aquí:
+
+1. Marco de imputación sobre la cohorte con RCP previa: covariables del
+   modelo, tiempo de RCP y outcomes como predictores auxiliares
+   (IMPUTE_METHODS). Los no supervivientes tienen CPC 5 (CPC_favorable = 0)
+   y la CPC solo se imputa entre supervivientes (CONDITIONAL).
+2. Cada imputación recorre las variables N_ITER veces: PMM (predictive mean
+   matching, donante entre los K_DONORS más próximos) para las continuas y
+   logística con coeficientes muestreados de su distribución aproximada para
+   las binarias; todo con numpy sobre la matriz completa.
+3. Las M imputaciones se generan en paralelo (una semilla independiente por
+   imputación) y se guardan como capas: solo los valores de las celdas
+   faltantes, sobre una única copia de la base con NaN.
+4. Cada worker ajusta además la logística de model_grid sobre su conjunto
+   completado; las estimaciones se combinan con las reglas de Rubin
+   (gl de Barnard-Rubin y fracción de información faltante).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .cohort import RCP_GROUPS, TCPR_GROUP
+from .model_grid import TERMS
+
+# Variable del marco -> método de imputación (las que no tengan faltantes se usan solo como predictores)
+IMPUTE_METHODS = {
+    'edad': 'pmm',
+    'sexo_m': 'logistica',
+    't_llegada': 'pmm',
+    't_rcp': 'pmm',
+    'ritmo': 'logistica',
+    'ROSC': 'logistica',
+    'Supervivencia_7dias': 'logistica',
+    'CPC_favorable': 'logistica',
+}
+
+# Variables imputadas solo donde otra vale 1 (donde vale 0 se fija a 0)
+CONDITIONAL = {'CPC_favorable': 'Supervivencia_7dias'}
+
+DEFAULT_M = 20
+N_ITER = 10
+K_DONORS = 5
+RIDGE = 1e-3
+
+# Estado del worker (se rellena con _init_worker)
+_STATE = {}
+
+
+def imputation_frame(df):
+    """
+    Cohorte con RCP previa con TCPR y las variables de IMPUTE_METHODS
+    (numéricas, con NaN donde faltan).
+    """
+    reg = df[df['grupo_rcp'].isin(RCP_GROUPS)]
+    data = pd.DataFrame({
+        'TCPR': (reg['grupo_rcp'] == TCPR_GROUP).astype(float),
+        'edad': pd.to_numeric(reg['EDAD'], errors='coerce'),
+        'sexo_m': reg['SEXO'].map({'Masculino': 1, 'Femenino': 0}).astype(float),
+        't_llegada': pd.to_numeric(reg['Tiempo_llegada'], errors='coerce'),
+        't_rcp': pd.to_numeric(reg.get('Tiempo_Rcp', pd.Series(np.nan, index=reg.index)), errors='coerce'),
+        'ritmo': pd.to_numeric(reg['Desfibrilable_inicial'], errors='coerce'),
+        'ROSC': pd.to_numeric(reg['ROSC'], errors='coerce'),
+        'Supervivencia_7dias': pd.to_numeric(reg['Supervivencia_7dias'], errors='coerce'),
+        'CPC_favorable': pd.to_numeric(reg['CPC_favorable'], errors='coerce'),
+    }, index=reg.index)
+    # No superviviente -> CPC 5 (no favorable), no es un dato faltante
+    data.loc[data['Supervivencia_7dias'].eq(0) & data['CPC_favorable'].isna(), 'CPC_favorable'] = 0.0
+    # Columnas enteramente vacías (p. ej. sin Tiempo_Rcp en el CSV) no se pueden imputar
+    return data.loc[:, data.notna().any()]
+
+
+def _standardize(X):
+    """Estandariza las columnas no constantes (la primera es el intercepto)"""
+    mean = X[:, 1:].mean(axis=0)
+    sd = X[:, 1:].std(axis=0)
+    sd[sd == 0] = 1.0
+    Z = X.copy()
+    Z[:, 1:] = (X[:, 1:] - mean) / sd
+    return Z
+
+
+def _fit_logistic(X, y, ridge=RIDGE, max_iter=25, tol=1e-8):
+    """Newton-Raphson con penalización ridge (no en el intercepto); devuelve (beta, covarianza)"""
+    penalty = np.full(X.shape[1], ridge)
+    penalty[0] = 0.0
+    beta = np.zeros(X.shape[1])
+    for _ in range(max_iter):
+        p = 1.0 / (1.0 + np.exp(-(X @ beta)))
+        w = p * (1 - p)
+        H = (X * w[:, None]).T @ X + np.diag(penalty)
+        step = np.linalg.solve(H, X.T @ (y - p) - penalty * beta)
+        beta += step
+        if np.abs(step).max() < tol:
+            break
+    p = 1.0 / (1.0 + np.exp(-(X @ beta)))
+    H = (X * (p * (1 - p))[:, None]).T @ X + np.diag(penalty)
+    return beta, np.linalg.inv(H)
+
+
+def _draw_logistic(X_obs, y_obs, X_mis, rng):
+    """Imputación binaria: coeficientes muestreados de N(beta, cov) y Bernoulli"""
+    if y_obs.min() == y_obs.max():
+        # Sin variación entre los observados (el intercepto no converge): mismo valor
+        return np.full(len(X_mis), y_obs[0])
+    beta, cov = _fit_logistic(X_obs, y_obs)
+    beta_star = rng.multivariate_normal(beta, cov, method='cholesky')
+    p = 1.0 / (1.0 + np.exp(-(X_mis @ beta_star)))
+    return (rng.random(len(p)) < p).astype(float)
+
+
+def _draw_pmm(X_obs, y_obs, X_mis, rng, k=K_DONORS):
+    """
+    Predictive mean matching: predicción con coeficientes muestreados
+    (regresión lineal bayesiana) y donante al azar entre los k observados con
+    predicción más próxima (búsqueda por bisección sobre las predicciones
+    ordenadas).
+    """
+    n, p = X_obs.shape
+    XtX_inv = np.linalg.pinv(X_obs.T @ X_obs)
+    beta = XtX_inv @ X_obs.T @ y_obs
+    rss = float(((y_obs - X_obs @ beta) ** 2).sum())
+    sigma2 = rss / rng.chisquare(max(n - p, 1))
+    beta_star = rng.multivariate_normal(beta, sigma2 * XtX_inv, method='eigh')
+
+    pred_obs = X_obs @ beta
+    order = np.argsort(pred_obs, kind='stable')
+    sorted_pred = pred_obs[order]
+    pred_mis = X_mis @ beta_star
+    k = min(k, n)
+    # Ventana de 2k candidatos alrededor de la posición de inserción
+    pos = np.searchsorted(sorted_pred, pred_mis)
+    window = np.clip(pos[:, None] + np.arange(-k, k)[None, :], 0, n - 1)
+    distance = np.abs(sorted_pred[window] - pred_mis[:, None])
+    nearest = np.argpartition(distance, k - 1, axis=1)[:, :k]
+    chosen = nearest[np.arange(len(pred_mis)), rng.integers(0, k, len(pred_mis))]
+    return y_obs[order[window[np.arange(len(pred_mis)), chosen]]]
+
+
+def impute_once(values, missing, columns, seed, n_iter=N_ITER):
+    """
+    Una imputación por ecuaciones encadenadas. values: matriz n x k con NaN,
+    missing: máscara de faltantes. Devuelve {columna: valores imputados}
+    (en el orden de las filas faltantes).
+    """
+    rng = np.random.default_rng(seed)
+    data = values.copy()
+    col_index = {c: j for j, c in enumerate(columns)}
+    targets = [c for c in columns if c in IMPUTE_METHODS and missing[:, col_index[c]].any()]
+
+    # Arranque: valores observados al azar
+    for c in targets:
+        j = col_index[c]
+        observed = values[~missing[:, j], j]
+        data[missing[:, j], j] = rng.choice(observed, missing[:, j].sum())
+
+    for _ in range(n_iter if targets else 0):
+        for c in targets:
+            j = col_index[c]
+            rows_mis = missing[:, j]
+            rows_obs = ~rows_mis
+            condition = CONDITIONAL.get(c)
+            if condition in col_index:
+                active = data[:, col_index[condition]] == 1
+                data[rows_mis & ~active, j] = 0.0
+                rows_mis = rows_mis & active
+                rows_obs = rows_obs & active
+                if not rows_mis.any():
+                    continue
+            X = np.column_stack([np.ones(len(data)), np.delete(data, j, axis=1)])
+            X = _standardize(X)
+            y_obs = data[rows_obs, j]
+            if IMPUTE_METHODS[c] == 'pmm':
+                data[rows_mis, j] = _draw_pmm(X[rows_obs], y_obs, X[rows_mis], rng)
+            else:
+                data[rows_mis, j] = _draw_logistic(X[rows_obs], y_obs, X[rows_mis], rng)
+
+    return {c: data[missing[:, col_index[c]], col_index[c]].astype(np.float32) for c in targets}
+
+
+def apply_overlay(values, missing, columns, overlay):
+    """Conjunto completado: base + valores imputados de una capa"""
+    data = values.copy()
+    for c, imputed in overlay.items():
+        j = columns.index(c)
+        data[missing[:, j], j] = imputed
+    return data
+
+
+def design_matrix(data, columns):
+    """Matriz de la logística de model_grid (TERMS) desde el marco completado"""
+    col = {c: data[:, j] for j, c in enumerate(columns)}
+    return np.column_stack([np.ones(len(data)), col['TCPR'], col['edad'], col['sexo_m'],
+                            col['t_llegada'] / 100.0, col['ritmo']])
+
+
+def fit_models(data, columns, outcomes, maxiter=200):
+    """Logística por outcome sobre un conjunto completado: {outcome: (coef, var, n, convergió)}"""
+    import warnings
+
+    import statsmodels.api as sm
+
+    X = design_matrix(data, columns)
+    fits = {}
+    for nombre, col in outcomes.items():
+        y = data[:, columns.index(col)]
+        valid = ~np.isnan(y) & ~np.isnan(X).any(axis=1)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                result = sm.Logit(y[valid], X[valid]).fit(disp=False, maxiter=maxiter)
+            fits[nombre] = (np.asarray(result.params), np.asarray(result.bse) ** 2, int(valid.sum()),
+                            bool(result.mle_retvals.get('converged', False)))
+        except Exception:
+            fits[nombre] = (np.full(len(TERMS), np.nan), np.full(len(TERMS), np.nan), int(valid.sum()), False)
+    return fits
+
+
+def _init_worker(values, missing, columns, outcomes, n_iter):
+    import warnings
+    warnings.filterwarnings('ignore')
+    _STATE.update({'values': values, 'missing': missing, 'columns': columns, 'outcomes': outcomes, 'n_iter': n_iter})
+
+
+def _impute_and_fit(seed):
+    """Una imputación y los modelos sobre su conjunto completado (en el worker)"""
+    values, missing, columns = _STATE['values'], _STATE['missing'], _STATE['columns']
+    overlay = impute_once(values, missing, columns, seed, _STATE['n_iter'])
+    fits = fit_models(apply_overlay(values, missing, columns, overlay), columns, _STATE['outcomes'])
+    return overlay, fits
+
+
+def rubin_pool(estimates, variances, df_complete):
+    """
+    Reglas de Rubin para M estimaciones escalares (por término).
+    Devuelve estimación, EE total, gl de Barnard-Rubin y fracción de
+    información faltante.
+    """
+    estimates, variances = np.asarray(estimates, dtype=float), np.asarray(variances, dtype=float)
+    m = len(estimates)
+    q_bar = estimates.mean(axis=0)
+    within = variances.mean(axis=0)
+    between = estimates.var(axis=0, ddof=1) if m > 1 else np.zeros_like(q_bar)
+    total = within + (1 + 1 / m) * between
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lam = np.where(total > 0, (1 + 1 / m) * between / total, 0.0)
+        df_old = np.where(lam > 0, (m - 1) / lam ** 2, np.inf)
+        df_obs = (df_complete + 1) / (df_complete + 3) * df_complete * (1 - lam)
+        df = np.where(np.isinf(df_old), df_obs, df_old * df_obs / (df_old + df_obs))
+        r = np.where(within > 0, (1 + 1 / m) * between / within, 0.0)
+        fmi = np.where(np.isinf(df_old), 0.0, (r + 2 / (df_old + 3)) / (1 + r))
+    return {'estimacion': q_bar, 'ee': np.sqrt(total), 'gl': df, 'fmi': fmi}
+
+
+def run_mice(df, outcomes, M=DEFAULT_M, n_iter=N_ITER, seed=42, n_jobs=None):
+    """
+    M imputaciones en paralelo y logística ajustada combinada por Rubin.
+
+    Devuelve (tabla combinada, imputaciones). imputaciones es un dict con la
+    base ('valores', con NaN), la máscara 'faltantes', 'columnas', el 'indice'
+    de la cohorte y las M 'capas' ({columna: valores imputados}).
+    """
+    frame = imputation_frame(df)
+    columns = list(frame.columns)
+    values = frame.to_numpy(dtype=float)
+    missing = np.isnan(values)
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(M)]
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, M)
+    if n_jobs == 1:
+        _init_worker(values, missing, columns, outcomes, n_iter)
+        results = [_impute_and_fit(s) for s in seeds]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(values, missing, columns, outcomes, n_iter)) as pool:
+            results = list(pool.map(_impute_and_fit, seeds))
+
+    imputaciones = {'valores': values, 'faltantes': missing, 'columnas': columns, 'indice': frame.index,
+                    'capas': [overlay for overlay, _ in results]}
+
+    # Casos completos de la logística (lo que usa model_grid) para comparar
+    complete_covs = ~np.isnan(design_matrix(values, columns)).any(axis=1)
+    rows = []
+    for nombre, col in outcomes.items():
+        fits = [fit[nombre] for _, fit in results]
+        ok = [f for f in fits if not np.isnan(f[0]).any()]
+        n = fits[0][2]
+        base = {
+            'outcome': nombre,
+            'n': n,
+            'n_completos': int((complete_covs & ~np.isnan(values[:, columns.index(col)])).sum()),
+            'M': len(ok),
+            'convergieron': sum(f[3] for f in fits),
+        }
+        if not ok:
+            rows.append({**base, 'term': None})
+            continue
+        pooled = rubin_pool([f[0] for f in ok], [f[1] for f in ok], df_complete=n - len(TERMS))
+        for j, term in enumerate(TERMS):
+            q, se, gl = pooled['estimacion'][j], pooled['ee'][j], pooled['gl'][j]
+            t_crit = stats.t.ppf(0.975, gl)
+            rows.append({
+                **base,
+                'term': term,
+                'coef': q,
+                'se': se,
+                'aOR': np.exp(q),
+                'LCL95': np.exp(q - t_crit * se),
+                'UCL95': np.exp(q + t_crit * se),
+                'p_value': 2 * stats.t.sf(abs(q) / se, gl),
+                'gl': gl,
+                'fmi': pooled['fmi'][j],
+            })
+    return pd.DataFrame(rows), imputaciones
+
+
+def completed_frame(imputaciones, m):
+    """DataFrame completado de la imputación m (índice de la cohorte)"""
+    data = apply_overlay(imputaciones['valores'], imputaciones['faltantes'], imputaciones['columnas'],
+                         imputaciones['capas'][m])
+    return pd.DataFrame(data, columns=imputaciones['columnas'], index=imputaciones['indice'])
+
+
+def imputation_diagnostics(imputaciones):
+    """Por variable: % faltante, media observada y media de los valores imputados (promedio de las M capas)"""
+    values, missing, columns = imputaciones['valores'], imputaciones['faltantes'], imputaciones['columnas']
+    rows = []
+    for c in imputaciones['capas'][0] if imputaciones['capas'] else []:
+        j = columns.index(c)
+        imputed = np.stack([capa[c] for capa in imputaciones['capas']])
+        rows.append({
+            'variable': c,
+            'metodo': IMPUTE_METHODS[c],
+            'n_faltantes': int(missing[:, j].sum()),
+            'pct_faltantes': 100 * missing[:, j].mean(),
+            'media_observada': np.nanmean(values[:, j]),
+            'media_imputada': float(imputed.mean()),
+            'de_entre_imputaciones': float(imputed.mean(axis=1).std(ddof=1)) if len(imputed) > 1 else 0.0,
+        })
+    return pd.DataFrame(rows)
+
+
+def overlay_nbytes(imputaciones):
+    """Memoria de las capas frente a M copias completas del marco"""
+    capas = sum(v.nbytes for capa in imputaciones['capas'] for v in capa.values())
+    copias = imputaciones['valores'].nbytes * len(imputaciones['capas'])
+    return capas, copias
+
+
+def pooled_to_json(pooled):
+    """Formato de logistica_ajustada_mi_tcp_vs_notcp.json: {outcome: {'n', 'n_completos', 'M', 'resultados'}}"""
+    out = {}
+    for outcome, rows in pooled.groupby('outcome', sort=False):
+        first = rows.iloc[0]
+        rows = rows[rows['term'].notna()]
+        out[outcome] = {
+            'n': int(first['n']),
+            'n_completos': int(first['n_completos']),
+            'M': int(first['M']),
+            'resultados': rows[['term', 'aOR', 'LCL95', 'UCL95', 'p_value', 'fmi']].to_dict(orient='records'),
+        }
+    return out
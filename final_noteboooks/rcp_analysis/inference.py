@@ -0,0 +1,550 @@
+"""
+Análisis inferencial del notebook 5 como funciones importables.
+
+Cada bloque del notebook (análisis principal, comparaciones pareadas, matriz
+T-CPR vs no T-CPR, estratos, logística ajustada, bootstrap de la logística,
+emparejamiento por PS, tiempos y gráficas) es una función que recibe la
+cohorte preparada, el bootstrap común y el directorio de salida, escribe los
+mismos ficheros que el notebook y devuelve los resultados en memoria.
+
+Las funciones no dependen entre sí (salvo las gráficas, que reciben los
+resultados ya calculados), de modo que el runner (python -m rcp_analysis)
+puede ejecutarlas en paralelo y el notebook puede seguir llamándolas celda
+a celda.
+"""
+
+from pathlib import Path
+from typing import Dict
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .bootstrap import bootstrap_or, or_table, quantile_table, rate_table
+from .cohort import GROUP_ORDER, RCP_GROUPS, TCPR_GROUP, save_json
+from .exact import conditional_or_ci, freeman_halton
+
+NO_TCPR_LABEL = 'Sin telefónica'
+NO_TCPR_GROUPS = [g for g in RCP_GROUPS if g != TCPR_GROUP]
+PLOT_OUTCOMES = ['ROSC', 'Supervivencia', 'CPC_favorable']
+
+
+def _save_figure(path, show=False):
+    """Guarda la figura actual con el formato de outputs_inferencia"""
+    plt.tight_layout()
+    plt.savefig(path, dpi=300, bbox_inches='tight', facecolor='white', edgecolor='none')
+    if show:
+        plt.show()
+    else:
+        plt.close()
+
+
+def chisq_or_fisher(table: np.ndarray, precision=1e-3) -> Dict[str, float]:
+    """
+    Ejecuta Chi-cuadrado sobre 2xk o 2x2; si hay expectativas <5 usa Fisher
+    exacto (2x2) o Freeman-Halton (r×c, rcp_analysis.exact).
+    Retorna dict con test, chi2, p_value (y método del exacto r×c).
+    """
+    chi2, p, dof, exp = stats.chi2_contingency(table, correction=False)
+    if not (exp < 5).any():
+        return {"test": "Chi2", "chi2": float(chi2), "p_value": float(p)}
+    if table.shape == (2, 2):
+        _, p_fisher = stats.fisher_exact(table)
+        return {"test": "Fisher", "chi2": float(chi2), "p_value": float(p_fisher)}
+    exacto = freeman_halton(table, precision=precision)
+    return {"test": "Freeman-Halton", "chi2": float(chi2), "p_value": float(exacto['p_value']),
+            "metodo": exacto['metodo'], "error_estandar": exacto['error_estandar']}
+
+
+def build_contingency(df_in: pd.DataFrame, group_col: str, outcome_col: str) -> pd.DataFrame:
+    """Devuelve tabla de contingencia (grupos x outcome_binario)"""
+    sub = df_in[[group_col, outcome_col]].dropna()
+    sub[outcome_col] = sub[outcome_col].astype(int)
+    ct = pd.crosstab(sub[group_col], sub[outcome_col]).rename(columns={0: 'No', 1: 'Sí'})
+    # Asegurar columnas 'No' y 'Sí' aunque alguna falte
+    for col in ['No', 'Sí']:
+        if col not in ct.columns:
+            ct[col] = 0
+    ct = ct[['No', 'Sí']]
+    return ct
+
+
+def or_vs_reference(boot, df_in: pd.DataFrame, outcome_col: str, ref_label: str, order=None) -> pd.DataFrame:
+    """
+    Calcula OR con IC95% bootstrap (motor común boot) para cada grupo vs ref_label.
+    df_in debe ser la cohorte completa (las filas de boot siguen su orden).
+    """
+    return or_table(boot, df_in, 'grupo_rcp', outcome_col, ref_label, order=order)
+
+
+def forest_plot(or_df: pd.DataFrame, title: str, filename: str, out_dir, show=False):
+    """Forest plot de OR (columnas OR, LCL95, UCL95; índice = etiquetas)"""
+    labels = or_df.index.tolist()
+    ors = or_df['OR'].values
+    lcl = or_df['LCL95'].values
+    ucl = or_df['UCL95'].values
+    y = np.arange(len(labels))
+
+    fig, ax = plt.subplots(figsize=(8, 0.6*len(labels) + 1))
+    ax.errorbar(ors, y, xerr=[ors - lcl, ucl - ors], fmt='o', color='black', capsize=4)
+    ax.axvline(1.0, color='red', linestyle='--', alpha=0.7)
+    ax.set_yticks(y)
+    ax.set_yticklabels(labels)
+    ax.set_xlabel('Odds Ratio (IC 95%)')
+    ax.set_title(title)
+    out_path = Path(out_dir) / filename
+    _save_figure(out_path, show)
+    print(f"Guardado: {out_path}")
+
+
+def tcpr_comparison(boot, df, outcome_col, row_mask=None):
+    """
+    Tabla 2x2, OR bootstrap, OR condicional con IC exacto y Fisher de T-CPR
+    vs No T-CPR (legos sin telefónica + sanitarios + policía/bomberos),
+    opcionalmente en un estrato.
+    """
+    row_mask = np.ones(len(df), dtype=bool) if row_mask is None else np.asarray(row_mask)
+    mask_tcpr = row_mask & (df['grupo_rcp'] == TCPR_GROUP).to_numpy()
+    mask_no_tcpr = row_mask & df['grupo_rcp'].isin(NO_TCPR_GROUPS).to_numpy()
+
+    sub = df.loc[mask_tcpr | mask_no_tcpr, [outcome_col, 'grupo_rcp']].dropna()
+    if sub.empty:
+        return None
+    telf_vs_no = np.where(sub['grupo_rcp'] == TCPR_GROUP, TCPR_GROUP, NO_TCPR_LABEL)
+    ct = pd.crosstab(pd.Series(telf_vs_no, index=sub.index, name='telf_vs_no'),
+                     sub[outcome_col].astype(int)).rename(columns={0: 'No', 1: 'Sí'})
+
+    def cell(group, value):
+        return int(ct.loc[group, value]) if group in ct.index and value in ct.columns else 0
+
+    a, b = cell(TCPR_GROUP, 'Sí'), cell(TCPR_GROUP, 'No')
+    c, d = cell(NO_TCPR_LABEL, 'Sí'), cell(NO_TCPR_LABEL, 'No')
+    or_val, lcl, ucl = bootstrap_or(boot, df[outcome_col], mask_tcpr, mask_no_tcpr)
+    or_cond, lcl_exact, ucl_exact = conditional_or_ci(a, b, c, d)
+    _, p_fisher = stats.fisher_exact(np.array([[a, b], [c, d]]))
+    return {
+        'tabla': ct.to_dict(),
+        'OR_TCPR_vs_NoT': or_val,
+        'LCL95': lcl,
+        'UCL95': ucl,
+        'OR_condicional': or_cond,
+        'LCL95_exacto': lcl_exact,
+        'UCL95_exacto': ucl_exact,
+        'p_fisher': float(p_fisher),
+        'n_TCPR': int(a+b),
+        'n_NoT': int(c+d)
+    }
+
+
+def run_main_analysis(df, boot, outcomes, out_dir, order=None, show=False):
+    """Tablas de contingencia, χ²/Fisher global y forest de OR vs 'Sin RCP' por outcome"""
+    order = order or GROUP_ORDER
+    resultados = {}
+    for nombre, col in outcomes.items():
+        print(f"\n=== Outcome: {nombre} ({col}) ===")
+        sub = df[[col, 'grupo_rcp']].dropna()
+        sub = sub[sub['grupo_rcp'].isin(order)].copy()
+        ct = build_contingency(sub, 'grupo_rcp', col)
+        # Reordenar (puede que falte algún grupo si n=0)
+        ct = ct.reindex([g for g in order if g in ct.index])
+        print(ct)
+
+        # χ² global para 2×k
+        chi2_res = chisq_or_fisher(ct.values)
+        print('Test:', chi2_res)
+
+        # OR vs referencia (Sin RCP)
+        if 'Sin RCP' in ct.index:
+            or_df = or_vs_reference(boot, df, col, ref_label='Sin RCP', order=list(ct.index))
+            print(or_df)
+            forest_plot(or_df, title=f"{nombre}: OR vs 'Sin RCP'", filename=f"forest_{col}_vs_sinrcp.png",
+                        out_dir=out_dir, show=show)
+        else:
+            print("No hay grupo de referencia 'Sin RCP' en los datos; se omite forest plot.")
+            or_df = pd.DataFrame()
+
+        resultados[nombre] = {
+            'contingencia': ct.to_dict(),
+            'test': chi2_res,
+            'or_vs_ref': (or_df.reset_index().to_dict(orient='records') if not or_df.empty else [])
+        }
+
+    save_json(resultados, Path(out_dir) / 'resultados_inferencia_5_statistical_analysis.json')
+    print('Resultados guardados en JSON.')
+    return resultados
+
+
+def run_pairwise(df, boot, outcomes, out_dir, ref_label=TCPR_GROUP, order=None, show=False):
+    """OR (ref vs g) con IC95% bootstrap y Fisher exacto de la referencia frente a cada grupo"""
+    order = order or GROUP_ORDER
+    pairwise_results = {}
+    for nombre, col in outcomes.items():
+        sub = df[[col, 'grupo_rcp']].dropna()
+        grupos_presentes = [g for g in order if g in sub['grupo_rcp'].unique() and g != ref_label]
+        rows = []
+        for g in grupos_presentes:
+            ct = build_contingency(sub[sub['grupo_rcp'].isin([ref_label, g])], 'grupo_rcp', col)
+            ct = ct.reindex([ref_label, g])
+            # OR de ref vs g: OR>1 a favor de la referencia
+            a = int(ct.loc[ref_label, 'Sí']); b = int(ct.loc[ref_label, 'No'])
+            c = int(ct.loc[g, 'Sí']); d = int(ct.loc[g, 'No'])
+            or_val, lcl, ucl = bootstrap_or(boot, df[col], df['grupo_rcp'] == ref_label, df['grupo_rcp'] == g)
+            or_cond, lcl_exact, ucl_exact = conditional_or_ci(a, b, c, d)
+            _, p_fisher = stats.fisher_exact(np.array([[a, b], [c, d]]))
+            rows.append({
+                'comparado_con': g,
+                'OR_ref_vs_g': or_val,
+                'LCL95': lcl,
+                'UCL95': ucl,
+                'OR_condicional': or_cond,
+                'LCL95_exacto': lcl_exact,
+                'UCL95_exacto': ucl_exact,
+                'p_fisher': float(p_fisher),
+                'n_ref': int(a+b),
+                'n_g': int(c+d)
+            })
+        df_rows = pd.DataFrame(rows).set_index('comparado_con') if rows else pd.DataFrame()
+        pairwise_results[nombre] = df_rows.reset_index().to_dict(orient='records') if not df_rows.empty else []
+
+        if not df_rows.empty:
+            or_plot = df_rows[['OR_ref_vs_g', 'LCL95', 'UCL95']].copy()
+            or_plot.index = [f"{ref_label} vs {ix}" for ix in or_plot.index]
+            or_plot.columns = ['OR', 'LCL95', 'UCL95']
+            forest_plot(or_plot, title=f"{nombre}: {ref_label} vs otros", filename=f"forest_{col}_ref_telefonica.png",
+                        out_dir=out_dir, show=show)
+
+    save_json(pairwise_results, Path(out_dir) / 'pairwise_ref_telefonica_5_statistical_analysis.json')
+    print('Comparaciones pareadas guardadas en JSON.')
+    return pairwise_results
+
+
+def run_tcpr_matrix(df, boot, outcomes, out_dir):
+    """Matriz T-CPR vs No T-CPR (excluye 'Sin RCP') por outcome"""
+    matriz = {}
+    for nombre, col in outcomes.items():
+        res = tcpr_comparison(boot, df, col)
+        if res is not None:
+            matriz[nombre] = res
+    save_json(matriz, Path(out_dir) / 'matriz_tcp_vs_notcp.json')
+    print('Matriz T-CPR vs no T-CPR guardada (JSON).')
+    return matriz
+
+
+def strata_labels(df):
+    """
+    Estratos del notebook 5: edad (<=65 vs >65), tiempo de llegada (<= mediana
+    vs > mediana) y ritmo inicial. Devuelve ({variable: etiquetas}, {variable: niveles}).
+    """
+    labels, levels = {}, {}
+    if 'EDAD' in df.columns:
+        edad = pd.to_numeric(df['EDAD'], errors='coerce')
+        labels['edad_cat'] = pd.Series(np.where(edad <= 65, '<=65', '>65'), index=df.index)
+        levels['edad_cat'] = ['<=65', '>65']
+    if 'Tiempo_llegada' in df.columns:
+        llegada = pd.to_numeric(df['Tiempo_llegada'], errors='coerce')
+        mediana_llegada = llegada.median()
+        labels['llegada_cat'] = pd.Series(np.where(llegada <= mediana_llegada, f'≤{int(mediana_llegada)}s',
+                                                   f'>{int(mediana_llegada)}s'), index=df.index)
+        levels['llegada_cat'] = [f'≤{int(mediana_llegada)}s', f'>{int(mediana_llegada)}s']
+    if 'Desfibrilable_inicial' in df.columns:
+        ritmo = pd.to_numeric(df['Desfibrilable_inicial'], errors='coerce')
+        labels['ritmo_cat'] = ritmo.map({1: 'Desfibrilable', 0: 'No desfibrilable'})
+        levels['ritmo_cat'] = ['Desfibrilable', 'No desfibrilable']
+    return labels, levels
+
+
+def run_strata(df, boot, outcomes, out_dir):
+    """Comparativa T-CPR vs No T-CPR en cada nivel de cada estratificación"""
+    labels, levels = strata_labels(df)
+    estrato_resultados = {}
+    for estrato_col, niveles in levels.items():
+        estrato_resultados[estrato_col] = {}
+        for lvl in niveles:
+            mask_lvl = (labels[estrato_col] == lvl).to_numpy()
+            if not (mask_lvl & df['grupo_rcp'].isin(RCP_GROUPS).to_numpy()).any():
+                continue
+            estrato_resultados[estrato_col][lvl] = {}
+            for nombre, col in outcomes.items():
+                res = tcpr_comparison(boot, df, col, row_mask=mask_lvl)
+                if res is not None:
+                    estrato_resultados[estrato_col][lvl][nombre] = res
+
+    save_json(estrato_resultados, Path(out_dir) / 'estratos_tcp_vs_notcp.json')
+    print('Resultados de estratificaciones guardados.')
+    return estrato_resultados
+
+
+def run_adjusted_grid(df, outcomes, out_dir, strata=None, n_jobs=None):
+    """
+    Rejilla de logísticas ajustadas (rcp_analysis.model_grid): global y por
+    estratos. Devuelve (ajustados, ajustados_estratos, tabla de la rejilla).
+    """
+    from .model_grid import STRATA, grid_to_json, run_model_grid
+
+    strata = STRATA if strata is None else strata
+    grid_resultados, _ = run_model_grid(df, outcomes, strata=strata, n_jobs=n_jobs)
+
+    ajustados = grid_to_json(grid_resultados)
+    save_json(ajustados, Path(out_dir) / 'logistica_ajustada_tcp_vs_notcp.json')
+    ajustados_estratos = {var: grid_to_json(grid_resultados, var) for var in strata}
+    save_json(ajustados_estratos, Path(out_dir) / 'logistica_ajustada_estratos_tcp_vs_notcp.json')
+    grid_resultados.to_csv(Path(out_dir) / 'logistica_rejilla_resultados.csv', index=False)
+
+    no_convergen = grid_resultados[~grid_resultados['convergio']]
+    if not no_convergen.empty:
+        print('⚠️ Modelos sin convergencia:')
+        print(no_convergen[['estrato_var', 'estrato', 'outcome', 'error']].drop_duplicates())
+    return ajustados, ajustados_estratos, grid_resultados
+
+
+LR_COVARIATES = ['TCPR', 'edad', 'sexo_m', 't_llegada', 'ritmo']
+
+
+def regression_frame(df):
+    """Casos con algún tipo de RCP y covariables de la logística con bootstrap"""
+    reg = df[df['grupo_rcp'].isin(RCP_GROUPS)].copy()
+    reg['TCPR'] = (reg['grupo_rcp'] == TCPR_GROUP).astype(int)
+    reg['edad'] = pd.to_numeric(reg['EDAD'], errors='coerce')
+    reg['sexo_m'] = reg['SEXO'].map({'Masculino': 1, 'Femenino': 0})
+    reg['t_llegada'] = pd.to_numeric(reg['Tiempo_llegada'], errors='coerce')
+    reg['ritmo'] = pd.to_numeric(reg['Desfibrilable_inicial'], errors='coerce')
+    return reg
+
+
+def fit_lr_bootstrap(reg, outcome_col, B=1000, C=1.0, covs=None, random_state=None):
+    """Logística (scikit-learn) con IC95% por percentiles de B remuestreos"""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.utils import resample
+
+    covs = covs or LR_COVARIATES
+    data = reg[covs + [outcome_col]].dropna().copy()
+    y = data[outcome_col].astype(int).values
+    X = data[covs].values
+    # Modelo base
+    base = LogisticRegression(max_iter=1000, solver='lbfgs', C=C)
+    base.fit(X, y)
+    coef_base = base.coef_[0]
+    # Bootstrap percentiles
+    rng = np.random.RandomState(random_state) if random_state is not None else None
+    coefs = []
+    for _ in range(B):
+        Xb, yb = resample(X, y, replace=True, n_samples=len(y), random_state=rng)
+        m = LogisticRegression(max_iter=1000, solver='lbfgs', C=C)
+        try:
+            m.fit(Xb, yb)
+            coefs.append(m.coef_[0])
+        except Exception:
+            continue
+    coefs = np.array(coefs)
+    # OR e IC95% por percentil
+    results = []
+    for j, term in enumerate(covs):
+        or_hat = np.exp(coef_base[j])
+        if coefs.size > 0:
+            lcl = np.exp(np.percentile(coefs[:, j], 2.5))
+            ucl = np.exp(np.percentile(coefs[:, j], 97.5))
+        else:
+            lcl = np.nan
+            ucl = np.nan
+        results.append({'term': term, 'aOR': float(or_hat), 'LCL95': float(lcl), 'UCL95': float(ucl)})
+    return results, len(y)
+
+
+def run_lr_bootstrap(df, outcomes, out_dir, B=1000, random_state=None):
+    """aOR con IC95% bootstrap por outcome (logistica_ajustada_bootstrap_*)"""
+    reg = regression_frame(df)
+    ajustados_boot = {}
+    for nombre, col in outcomes.items():
+        res, n = fit_lr_bootstrap(reg, col, B=B, random_state=random_state)
+        ajustados_boot[nombre] = {'n': n, 'resultados': res}
+
+    save_json(ajustados_boot, Path(out_dir) / 'logistica_ajustada_bootstrap_tcp_vs_notcp.json')
+    pd.DataFrame([{'Outcome': k, **{r['term']: r['aOR'] for r in v['resultados']}, 'n': v['n']}
+                  for k, v in ajustados_boot.items()]).to_csv(Path(out_dir) / 'logistica_ajustada_bootstrap_resumen.csv', index=False)
+    return ajustados_boot
+
+
+def run_multiple_imputation(df, outcomes, out_dir, M=20, seed=42, n_jobs=None):
+    """
+    Logística ajustada sobre M imputaciones (rcp_analysis.imputation) en vez
+    de casos completos, combinada con las reglas de Rubin
+    (logistica_ajustada_mi_*, imputacion_diagnostico.csv).
+    """
+    from .imputation import imputation_diagnostics, overlay_nbytes, pooled_to_json, run_mice
+
+    pooled, imputaciones = run_mice(df, outcomes, M=M, seed=seed, n_jobs=n_jobs)
+    ajustados_mi = pooled_to_json(pooled)
+    save_json(ajustados_mi, Path(out_dir) / 'logistica_ajustada_mi_tcp_vs_notcp.json')
+    pooled.to_csv(Path(out_dir) / 'logistica_ajustada_mi_resultados.csv', index=False)
+    imputation_diagnostics(imputaciones).to_csv(Path(out_dir) / 'imputacion_diagnostico.csv', index=False)
+
+    capas, copias = overlay_nbytes(imputaciones)
+    for nombre, res in ajustados_mi.items():
+        print(f"   • {nombre}: n={res['n']} (casos completos: {res['n_completos']}), M={res['M']}")
+    print(f"   • Capas de imputación: {capas / 1e3:.0f} kB (frente a {copias / 1e3:.0f} kB de {M} copias)")
+    return ajustados_mi
+
+
+def psm_to_json(psm):
+    """Estructura de psm_tcp_vs_notcp.json"""
+    return {
+        'resumen': psm['resumen'],
+        'balance': psm['balance'].to_dict(orient='records'),
+        'or_emparejados': psm['or'].to_dict(orient='records'),
+    }
+
+
+def run_psm(df, outcomes, out_dir, caliper=0.2, exact=('edad_banda', 'ritmo'), B=2000, seed=42, n_jobs=None,
+            show=False):
+    """Emparejamiento por PS (rcp_analysis.matching), love plot y forest de OR emparejados"""
+    from .matching import run_matching_analysis
+
+    out_dir = Path(out_dir)
+    psm = run_matching_analysis(df, outcomes, caliper=caliper, exact=exact, B=B, seed=seed, n_jobs=n_jobs)
+    print('Resumen del emparejamiento:', psm['resumen'])
+    print(psm['balance'][['covariable', 'SMD_antes', 'SMD_despues', 'razon_var_antes', 'razon_var_despues']].round(3))
+    print(psm['or'].round(3))
+
+    save_json(psm_to_json(psm), out_dir / 'psm_tcp_vs_notcp.json')
+    psm['balance'].to_csv(out_dir / 'psm_balance.csv', index=False)
+
+    # Love plot: |SMD| antes y después del emparejamiento
+    bal = psm['balance'].set_index('covariable')
+    y = np.arange(len(bal))
+    fig, ax = plt.subplots(figsize=(6, 0.5*len(bal) + 1.5))
+    ax.scatter(bal['SMD_antes'].abs(), y, color='grey', label='Antes')
+    ax.scatter(bal['SMD_despues'].abs(), y, color='black', label='Después')
+    ax.axvline(0.1, color='red', linestyle='--', alpha=0.7)
+    ax.set_yticks(y)
+    ax.set_yticklabels(bal.index)
+    ax.set_xlabel('|Diferencia de medias estandarizada|')
+    ax.set_title('Balance de covariables (PSM)')
+    ax.legend()
+    _save_figure(out_dir / 'love_plot_psm.png', show)
+
+    forest_plot(psm['or'].set_index('Outcome')[['OR_emparejado', 'LCL95', 'UCL95']].rename(columns={'OR_emparejado': 'OR'}),
+                title='T-CPR vs No T-CPR (pares emparejados por PS)', filename='forest_psm_TCPR_vs_NoTCPR.png',
+                out_dir=out_dir, show=show)
+    return psm
+
+
+def run_time_quantiles(df, boot, out_dir, columns=('Tiempo_llegada', 'Tiempo_Rcp')):
+    """Mediana e IQR por grupo con IC95% bootstrap (mismas réplicas)"""
+    cuantiles_tiempos = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        tabla_q = quantile_table(boot, df, 'grupo_rcp', col)
+        cuantiles_tiempos[col] = tabla_q.reset_index(names='grupo').to_dict(orient='records')
+        tabla_q.to_csv(Path(out_dir) / f"mediana_iqr_{col}_por_grupo.csv", index_label='grupo')
+        print(f"\n{col}:")
+        print(tabla_q[['n', 'mediana', 'mediana_LCL95', 'mediana_UCL95', 'IQR', 'IQR_LCL95', 'IQR_UCL95']].round(1))
+
+    save_json(cuantiles_tiempos, Path(out_dir) / 'mediana_iqr_tiempos_bootstrap.json')
+    return cuantiles_tiempos
+
+
+def plot_tcpr_outcomes(matriz, out_dir, show=False):
+    """Gráfica 1: forest de OR T-CPR vs No T-CPR por outcome"""
+    m_df = pd.DataFrame([
+        {'Outcome': k, 'OR': v.get('OR', v.get('OR_TCPR_vs_NoT', np.nan)), 'LCL95': v['LCL95'], 'UCL95': v['UCL95']}
+        for k, v in matriz.items()
+    ]).set_index('Outcome').loc[[o for o in PLOT_OUTCOMES if o in matriz]]
+
+    labels = m_df.index.tolist()
+    ors = m_df['OR'].values
+    lcl = m_df['LCL95'].values
+    ucl = m_df['UCL95'].values
+    y = np.arange(len(labels))
+    fig, ax = plt.subplots(figsize=(6, 3.5))
+    ax.errorbar(ors, y, xerr=[ors-lcl, ucl-ors], fmt='o', color='black', capsize=4)
+    ax.axvline(1.0, color='red', linestyle='--', alpha=0.7)
+    ax.set_yticks(y)
+    ax.set_yticklabels(labels)
+    ax.set_xlabel('OR (IC 95%) — T-CPR vs No T-CPR')
+    ax.set_title('T-CPR vs No T-CPR por outcome')
+    _save_figure(Path(out_dir) / 'forest_TCPR_vs_NoTCPR_outcomes.png', show)
+
+
+def plot_group_rates(df, boot, outcomes, out_dir, order=None, show=False):
+    """Gráfica 2: barras con IC95% bootstrap de proporciones por grupo"""
+    import seaborn as sns
+
+    order = order or GROUP_ORDER
+    for nombre, col in outcomes.items():
+        stats_grp = rate_table(boot, df, 'grupo_rcp', col)
+        stats_grp = stats_grp.loc[[g for g in order if g in stats_grp.index]]
+        fig, ax = plt.subplots(figsize=(8, 4))
+        x = np.arange(len(stats_grp))
+        ax.bar(x, stats_grp['p'].values,
+               yerr=[stats_grp['p'].values - stats_grp['LCL95'].values, stats_grp['UCL95'].values - stats_grp['p'].values],
+               capsize=4, color=sns.color_palette('Set2', n_colors=len(stats_grp)))
+        ax.set_xticks(x)
+        ax.set_xticklabels(stats_grp.index, rotation=20, ha='right')
+        ax.set_ylim(0, 1)
+        ax.set_ylabel(f"Proporción de {nombre}")
+        ax.set_title(f"{nombre} por grupo (IC 95% bootstrap)")
+        for i, (n_i, p_i) in enumerate(zip(stats_grp['n'].values, stats_grp['p'].values)):
+            ax.text(i, p_i + 0.03, f"n={n_i}", ha='center', va='bottom', fontsize=9)
+        _save_figure(Path(out_dir) / f"barras_{col}_por_grupo.png", show)
+
+
+def plot_aor_tcpr(outcomes, ajustados_boot, out_dir, show=False):
+    """Gráfica 3: forest de aOR (TCPR) por outcome del modelo con bootstrap"""
+    rows = []
+    for nombre in outcomes:
+        res = ajustados_boot.get(nombre, {})
+        term_tcp = next((t for t in res.get('resultados', []) if t['term'] == 'TCPR'), None)
+        if term_tcp is None:
+            continue
+        rows.append({'Outcome': nombre, 'aOR': term_tcp['aOR'], 'LCL95': term_tcp['LCL95'], 'UCL95': term_tcp['UCL95']})
+    if not rows:
+        print('No hay resultados de aOR para TCPR')
+        return
+    dfp = pd.DataFrame(rows).set_index('Outcome')
+    dfp = dfp.loc[[o for o in PLOT_OUTCOMES if o in dfp.index]]
+    labels = dfp.index.tolist()
+    ors = dfp['aOR'].values
+    lcl = dfp['LCL95'].values
+    ucl = dfp['UCL95'].values
+    y = np.arange(len(labels))
+    fig, ax = plt.subplots(figsize=(6, 3.5))
+    ax.errorbar(ors, y, xerr=[ors-lcl, ucl-ors], fmt='o', color='black', capsize=4)
+    ax.axvline(1.0, color='red', linestyle='--', alpha=0.7)
+    ax.set_yticks(y)
+    ax.set_yticklabels(labels)
+    ax.set_xlabel('aOR (IC 95%) — TCPR vs No TCPR (ajustado)')
+    ax.set_title('aOR de TCPR por outcome (bootstrap)')
+    _save_figure(Path(out_dir) / 'forest_aOR_TCPR_outcomes.png', show)
+
+
+def plot_strata(estratos, out_dir, outcomes=('Supervivencia', 'CPC_favorable'), show=False):
+    """
+    Gráfica 4: forest de T-CPR vs No T-CPR por estratos. estratos es un
+    DataFrame del almacén (query_results) o el dict de estratos_tcp_vs_notcp.
+    """
+    if isinstance(estratos, dict):
+        estratos = pd.DataFrame([
+            {'outcome': outcome, 'estrato': f"{estrato_col}|{lvl}", 'estimacion': r['OR_TCPR_vs_NoT'],
+             'lcl95': r['LCL95'], 'ucl95': r['UCL95']}
+            for estrato_col, niveles in estratos.items()
+            for lvl, res_map in niveles.items()
+            for outcome, r in res_map.items()
+        ], columns=['outcome', 'estrato', 'estimacion', 'lcl95', 'ucl95'])
+    for outcome in outcomes:
+        dfp = estratos[estratos['outcome'] == outcome]
+        if dfp.empty:
+            continue
+        dfp = dfp.assign(Estrato=dfp['estrato'].str.replace('|', ': ', regex=False), OR=dfp['estimacion'],
+                         LCL95=dfp['lcl95'], UCL95=dfp['ucl95'])
+        dfp = dfp.sort_values('Estrato')
+        y = np.arange(len(dfp))
+        fig, ax = plt.subplots(figsize=(8, 0.5*len(dfp)+1))
+        ax.errorbar(dfp['OR'], y, xerr=[dfp['OR']-dfp['LCL95'], dfp['UCL95']-dfp['OR']], fmt='o', color='black', capsize=4)
+        ax.axvline(1.0, color='red', linestyle='--', alpha=0.7)
+        ax.set_yticks(y)
+        ax.set_yticklabels(dfp['Estrato'])
+        ax.set_xlabel('OR (IC 95%) — T-CPR vs No T-CPR')
+        ax.set_title(f'T-CPR vs No T-CPR por estratos — {outcome}')
+        _save_figure(Path(out_dir) / f"forest_TCPR_vs_NoTCPR_{outcome}_estratos.png", show)
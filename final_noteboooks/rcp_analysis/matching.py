@@ -0,0 +1,288 @@
+"""
+Emparejamiento por propensity score: T-CPR vs no T-CPR.
+
+Complementa al ajuste por regresión (matriz_tcp_vs_notcp.json,
+logistica_ajustada_bootstrap_tcp_vs_notcp.json) con un análisis emparejado:
+
+1. Propensity score por regresión logística con las mismas covariables que
+   fit_logit (edad, sexo, tiempo de llegada, ritmo desfibrilable).
+2. Emparejamiento 1:1 sin reemplazo al vecino más cercano en logit(PS) con
+   caliper (por defecto 0.2 DE del logit), opcionalmente exacto en banda de
+   edad y ritmo desfibrilable. Los controles de cada bloque se ordenan una
+   vez y cada tratado busca por bisección (np.searchsorted); los controles ya
+   usados se saltan con punteros "siguiente libre" con compresión de
+   caminos, de modo que el coste es O(n log n) y no O(n_t x n_c).
+3. Diagnóstico de balance: diferencias de medias estandarizadas (SMD) y
+   razón de varianzas antes y después.
+4. OR emparejado (condicional, pares discordantes) y OR marginal de la
+   muestra emparejada por outcome, con IC95% bootstrap sobre pares
+   calculado en paralelo.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+from .cohort import RCP_GROUPS, TCPR_GROUP
+
+COVARIATES = ['edad', 'sexo_m', 't_llegada', 'ritmo']
+
+# Bandas de edad para el emparejamiento exacto (mismo corte que los estratos)
+AGE_BANDS = [-np.inf, 65, np.inf]
+AGE_LABELS = ['<=65', '>65']
+
+DEFAULT_CALIPER = 0.2
+DEFAULT_B = 2000
+
+
+def build_matching_frame(df):
+    """
+    Cohorte con RCP previa, exposición TCPR y covariables (como en fit_logit).
+    Elimina filas con covariables faltantes.
+    """
+    data = df[df['grupo_rcp'].isin(RCP_GROUPS)].copy()
+    data['TCPR'] = (data['grupo_rcp'] == TCPR_GROUP).astype(int)
+    data['edad'] = pd.to_numeric(data['EDAD'], errors='coerce')
+    data['sexo_m'] = data['SEXO'].map({'Masculino': 1, 'Femenino': 0})
+    data['t_llegada'] = pd.to_numeric(data['Tiempo_llegada'], errors='coerce')
+    data['ritmo'] = pd.to_numeric(data['Desfibrilable_inicial'], errors='coerce')
+    data = data.dropna(subset=COVARIATES)
+    data['edad_banda'] = pd.cut(data['edad'], AGE_BANDS, labels=AGE_LABELS, right=True).astype(str)
+    return data
+
+
+def estimate_propensity(data, covariates=COVARIATES):
+    """Propensity score (P(TCPR=1 | X)) y su logit"""
+    X = data[covariates].to_numpy(dtype=float)
+    X = (X - X.mean(axis=0)) / np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+    model = LogisticRegression(C=1e6, solver='lbfgs', max_iter=1000)
+    model.fit(X, data['TCPR'].to_numpy())
+    ps = np.clip(model.predict_proba(X)[:, 1], 1e-6, 1 - 1e-6)
+    return ps, np.log(ps / (1 - ps))
+
+
+def _find(pointers, i):
+    """Raíz (primer libre) con compresión de caminos"""
+    root = i
+    while pointers[root] != root:
+        root = pointers[root]
+    while pointers[i] != root:
+        pointers[i], i = root, pointers[i]
+    return root
+
+
+def _match_block(treated_scores, control_scores, caliper, rng):
+    """
+    Emparejamiento voraz 1:1 sin reemplazo dentro de un bloque.
+
+    Devuelve lista de (posición tratado, posición control). Los tratados se
+    procesan en orden aleatorio (semilla fija) para no favorecer extremos.
+    """
+    if len(treated_scores) == 0 or len(control_scores) == 0:
+        return []
+    order = np.argsort(control_scores, kind='stable')
+    sorted_scores = control_scores[order]
+    m = len(sorted_scores)
+    # right[i]: primer control libre en posición >= i (m = ninguno)
+    # left[i + 1]: último control libre en posición <= i (0 = ninguno)
+    right = list(range(m + 1))
+    left = list(range(m + 1))
+
+    pairs = []
+    for t in rng.permutation(len(treated_scores)):
+        score = treated_scores[t]
+        pos = int(np.searchsorted(sorted_scores, score))
+        candidates = []
+        r = _find(right, pos)
+        if r < m:
+            candidates.append(r)
+        l = _find(left, pos) - 1
+        if l >= 0:
+            candidates.append(l)
+        if not candidates:
+            break
+        best = min(candidates, key=lambda c: abs(sorted_scores[c] - score))
+        if abs(sorted_scores[best] - score) > caliper:
+            continue
+        # Marcar el control como usado
+        right[best] = best + 1
+        left[best + 1] = best
+        pairs.append((t, order[best]))
+    return pairs
+
+
+def match_pairs(data, logit_ps, caliper=DEFAULT_CALIPER, exact=('edad_banda', 'ritmo'), seed=42):
+    """
+    Empareja tratados (TCPR=1) con controles por logit(PS).
+
+    caliper se expresa en desviaciones estándar del logit(PS).
+    exact: columnas de emparejamiento exacto (None o () para desactivarlo).
+    Devuelve DataFrame de pares con las etiquetas de índice de data.
+    """
+    rng = np.random.default_rng(seed)
+    caliper_abs = caliper * np.std(logit_ps)
+    treated = data['TCPR'].to_numpy() == 1
+    index = data.index.to_numpy()
+    exact = list(exact or [])
+
+    if exact:
+        blocks = data.groupby(exact, sort=True).indices.items()
+    else:
+        blocks = [('todos', np.arange(len(data)))]
+
+    rows = []
+    for block, positions in blocks:
+        t_pos = positions[treated[positions]]
+        c_pos = positions[~treated[positions]]
+        for t, c in _match_block(logit_ps[t_pos], logit_ps[c_pos], caliper_abs, rng):
+            rows.append({
+                'tratado': index[t_pos[t]],
+                'control': index[c_pos[c]],
+                'bloque': block if not isinstance(block, tuple) else '|'.join(map(str, block)),
+                'distancia': abs(logit_ps[t_pos[t]] - logit_ps[c_pos[c]]),
+            })
+    return pd.DataFrame(rows, columns=['tratado', 'control', 'bloque', 'distancia'])
+
+
+def _smd(x_t, x_c):
+    pooled = np.sqrt((np.var(x_t, ddof=1) + np.var(x_c, ddof=1)) / 2) if len(x_t) > 1 and len(x_c) > 1 else np.nan
+    return (np.mean(x_t) - np.mean(x_c)) / pooled if pooled and pooled > 0 else 0.0
+
+
+def balance_table(data, pairs, covariates=COVARIATES, ps=None):
+    """SMD y razón de varianzas de cada covariable antes y después de emparejar"""
+    columns = list(covariates)
+    frame = data[columns].copy()
+    if ps is not None:
+        frame['propensity_score'] = ps
+        columns.append('propensity_score')
+    treated = data['TCPR'].to_numpy() == 1
+    matched_t = frame.loc[pairs['tratado']]
+    matched_c = frame.loc[pairs['control']]
+
+    rows = []
+    for col in columns:
+        x = frame[col].to_numpy(dtype=float)
+        x_t, x_c = x[treated], x[~treated]
+        m_t, m_c = matched_t[col].to_numpy(dtype=float), matched_c[col].to_numpy(dtype=float)
+        rows.append({
+            'covariable': col,
+            'media_TCPR_antes': x_t.mean(),
+            'media_NoTCPR_antes': x_c.mean(),
+            'SMD_antes': _smd(x_t, x_c),
+            'razon_var_antes': np.var(x_t, ddof=1) / np.var(x_c, ddof=1) if np.var(x_c, ddof=1) > 0 else np.nan,
+            'media_TCPR_despues': m_t.mean() if len(m_t) else np.nan,
+            'media_NoTCPR_despues': m_c.mean() if len(m_c) else np.nan,
+            'SMD_despues': _smd(m_t, m_c) if len(m_t) else np.nan,
+            'razon_var_despues': (np.var(m_t, ddof=1) / np.var(m_c, ddof=1)
+                                  if len(m_c) > 1 and np.var(m_c, ddof=1) > 0 else np.nan),
+        })
+    return pd.DataFrame(rows)
+
+
+def _pair_ors(y_t, y_c, weights):
+    """OR condicional (n10/n01) y marginal para cada fila de pesos de pares"""
+    n10 = weights @ ((y_t == 1) & (y_c == 0)).astype(np.int32)
+    n01 = weights @ ((y_t == 0) & (y_c == 1)).astype(np.int32)
+    a = weights @ (y_t == 1).astype(np.int32)
+    c = weights @ (y_c == 1).astype(np.int32)
+    n = weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conditional = (n10 + 0.5 * ((n10 == 0) | (n01 == 0))) / (n01 + 0.5 * ((n10 == 0) | (n01 == 0)))
+        b, d = n - a, n - c
+        zero = (np.minimum(np.minimum(a, b), np.minimum(c, d)) == 0) * 0.5
+        marginal = ((a + zero) * (d + zero)) / ((b + zero) * (c + zero))
+    return conditional, marginal
+
+
+def _bootstrap_chunk(args):
+    """Réplicas bootstrap sobre pares para un bloque (se ejecuta en el worker)"""
+    y_t, y_c, size, seed_seq = args
+    rng = np.random.default_rng(seed_seq)
+    n = len(y_t)
+    draws = rng.integers(0, n, size=(size, n))
+    flat = (draws + np.arange(size)[:, None] * n).ravel()
+    weights = np.bincount(flat, minlength=size * n).reshape(size, n)
+    return _pair_ors(y_t, y_c, weights)
+
+
+def matched_outcome_ors(data, pairs, outcomes, B=DEFAULT_B, seed=42, n_jobs=None, alpha=0.05):
+    """
+    OR emparejados por outcome con IC95% bootstrap sobre pares.
+
+    Las réplicas se reparten en bloques entre un pool de procesos, cada uno
+    con su propia subsemilla (SeedSequence.spawn) para que el resultado no
+    dependa del número de workers.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    chunk = 250
+    sizes = [min(chunk, B - start) for start in range(0, B, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    jobs = {}
+    for nombre, col in outcomes.items():
+        y_t = pd.to_numeric(data.loc[pairs['tratado'], col], errors='coerce').to_numpy()
+        y_c = pd.to_numeric(data.loc[pairs['control'], col], errors='coerce').to_numpy()
+        valid = ~np.isnan(y_t) & ~np.isnan(y_c)
+        jobs[nombre] = (y_t[valid].astype(int), y_c[valid].astype(int))
+
+    tasks = [(y_t, y_c, size, s) for (y_t, y_c) in jobs.values() for size, s in zip(sizes, seeds)]
+    if n_jobs == 1:
+        chunks = [_bootstrap_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            chunks = list(pool.map(_bootstrap_chunk, tasks))
+
+    rows = []
+    for k, (nombre, (y_t, y_c)) in enumerate(jobs.items()):
+        parts = chunks[k * len(sizes):(k + 1) * len(sizes)]
+        conditional_b = np.concatenate([p[0] for p in parts])
+        marginal_b = np.concatenate([p[1] for p in parts])
+        conditional, marginal = _pair_ors(y_t, y_c, np.ones((1, len(y_t)), dtype=np.int32))
+        q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+        c_lcl, c_ucl = np.exp(np.nanpercentile(np.log(conditional_b[np.isfinite(conditional_b)]), q))
+        m_lcl, m_ucl = np.exp(np.nanpercentile(np.log(marginal_b[np.isfinite(marginal_b)]), q))
+        rows.append({
+            'Outcome': nombre,
+            'n_pares': int(len(y_t)),
+            'pares_discordantes_TCPR': int(((y_t == 1) & (y_c == 0)).sum()),
+            'pares_discordantes_NoT': int(((y_t == 0) & (y_c == 1)).sum()),
+            'OR_emparejado': float(conditional[0]),
+            'LCL95': float(c_lcl),
+            'UCL95': float(c_ucl),
+            'OR_marginal': float(marginal[0]),
+            'OR_marginal_LCL95': float(m_lcl),
+            'OR_marginal_UCL95': float(m_ucl),
+        })
+    return pd.DataFrame(rows)
+
+
+def run_matching_analysis(df, outcomes, caliper=DEFAULT_CALIPER, exact=('edad_banda', 'ritmo'),
+                          B=DEFAULT_B, seed=42, n_jobs=None):
+    """
+    Análisis completo: PS, emparejamiento, balance y OR emparejados.
+    Devuelve un dict con 'datos', 'pares', 'balance', 'or' y 'resumen'.
+    """
+    data = build_matching_frame(df)
+    ps, logit_ps = estimate_propensity(data)
+    pairs = match_pairs(data, logit_ps, caliper=caliper, exact=exact, seed=seed)
+    balance = balance_table(data, pairs, ps=ps)
+    ors = matched_outcome_ors(data, pairs, outcomes, B=B, seed=seed, n_jobs=n_jobs)
+    n_treated = int(data['TCPR'].sum())
+    resumen = {
+        'n_TCPR': n_treated,
+        'n_NoTCPR': int(len(data) - n_treated),
+        'n_pares': int(len(pairs)),
+        'TCPR_sin_pareja': n_treated - int(len(pairs)),
+        'caliper_DE_logit': caliper,
+        'caliper_absoluto': float(caliper * np.std(logit_ps)),
+        'exacto': list(exact or []),
+        'max_SMD_despues': float(balance['SMD_despues'].abs().max()) if len(pairs) else None,
+        'B': B,
+        'seed': seed,
+    }
+    data['propensity_score'] = ps
+    return {'datos': data, 'pares': pairs, 'balance': balance, 'or': ors, 'resumen': resumen}
@@ -0,0 +1,249 @@
+"""
+Rejilla de modelos logísticos ajustados: outcomes x estratos.
+
+fit_logit y los análisis estratificados reconstruían la matriz de
+covariables y reajustaban desde cero cada combinación outcome x estrato, una
+tras otra. Aquí:
+
+- La matriz de diseño (Intercept, TCPR, edad, sexo_m, t_llegada_100, ritmo)
+  se construye una vez por cohorte.
+- Para cada variable de estratificación se ordenan las filas una vez por
+  estrato; cada nivel es entonces un bloque contiguo y se ajusta sobre una
+  vista (slice) de la matriz, sin copiarla.
+- Dentro de cada celda de la rejilla los outcomes se ajustan en cadena con
+  arranque en caliente (start_params del outcome anterior).
+- Las celdas (variable, nivel) se reparten en un pool de procesos; la matriz
+  se envía a cada worker una sola vez.
+- Coeficientes, EE, IC95%, p-valores e información de convergencia se
+  recogen en una única tabla.
+
+Añadir una estratificación es añadir una entrada a STRATA (nombre de columna
+o función que devuelve las etiquetas por fila).
+"""
+
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+
+from .cohort import RCP_GROUPS, TCPR_GROUP
+
+TERMS = ['Intercept', 'TCPR', 'edad', 'sexo_m', 't_llegada_100', 'ritmo']
+
+GLOBAL_STRATUM = 'global'
+
+
+def _edad_cat(df):
+    edad = pd.to_numeric(df['EDAD'], errors='coerce')
+    return pd.Series(np.where(edad <= 65, '<=65', '>65'), index=df.index).where(edad.notna())
+
+
+def _llegada_cat(df):
+    llegada = pd.to_numeric(df['Tiempo_llegada'], errors='coerce')
+    mediana = llegada.median()
+    labels = np.where(llegada <= mediana, f'≤{int(mediana)}s', f'>{int(mediana)}s')
+    return pd.Series(labels, index=df.index).where(llegada.notna())
+
+
+def _ritmo_cat(df):
+    ritmo = pd.to_numeric(df['Desfibrilable_inicial'], errors='coerce')
+    return ritmo.map({1: 'Desfibrilable', 0: 'No desfibrilable'})
+
+
+# Variables de estratificación (mismas definiciones que el notebook 5).
+# Las etiquetas se calculan sobre la cohorte completa (p. ej. la mediana de llegada).
+STRATA = {
+    'edad_cat': _edad_cat,
+    'llegada_cat': _llegada_cat,
+    'ritmo_cat': _ritmo_cat,
+}
+
+# Diseño compartido en cada worker (se rellena con _init_worker)
+_DESIGN = None
+_SORTED = {}
+
+
+def build_design(df, outcomes, strata=None):
+    """
+    Construye una vez la matriz de diseño y las etiquetas de estrato.
+
+    Devuelve dict con 'X' (n x p, float64 contiguo), 'terminos', 'outcomes'
+    ({nombre: array con NaN}), 'estratos' ({variable: array de etiquetas}).
+    """
+    strata = STRATA if strata is None else strata
+    labels = {}
+    for name, spec in strata.items():
+        values = df[spec] if isinstance(spec, str) else spec(df)
+        labels[name] = values.astype(object).where(values.notna(), None)
+
+    reg = df[df['grupo_rcp'].isin(RCP_GROUPS)]
+    covariates = pd.DataFrame({
+        'Intercept': 1.0,
+        'TCPR': (reg['grupo_rcp'] == TCPR_GROUP).astype(float),
+        'edad': pd.to_numeric(reg['EDAD'], errors='coerce'),
+        'sexo_m': reg['SEXO'].map({'Masculino': 1, 'Femenino': 0}),
+        't_llegada_100': pd.to_numeric(reg['Tiempo_llegada'], errors='coerce') / 100.0,
+        'ritmo': pd.to_numeric(reg['Desfibrilable_inicial'], errors='coerce'),
+    }, index=reg.index)
+    complete = covariates.notna().all(axis=1)
+    index = covariates.index[complete]
+
+    return {
+        'X': np.ascontiguousarray(covariates.loc[index, TERMS].to_numpy(dtype=float)),
+        'terminos': list(TERMS),
+        'outcomes': {nombre: pd.to_numeric(df.loc[index, col], errors='coerce').to_numpy(dtype=float)
+                     for nombre, col in outcomes.items()},
+        'estratos': {name: values.loc[index].to_numpy() for name, values in labels.items()},
+        'n': len(index),
+    }
+
+
+def _init_worker(design):
+    global _DESIGN, _SORTED
+    _DESIGN = design
+    _SORTED = {}
+
+
+def _sorted_design(variable):
+    """
+    Diseño reordenado por niveles de una variable (una vez por variable y
+    worker). Devuelve (X ordenada, {outcome: y ordenado}, {nivel: (inicio, fin)}).
+    """
+    if variable not in _SORTED:
+        if variable == GLOBAL_STRATUM:
+            _SORTED[variable] = (_DESIGN['X'], _DESIGN['outcomes'], {GLOBAL_STRATUM: (0, _DESIGN['n'])})
+        else:
+            labels = _DESIGN['estratos'][variable]
+            keys = np.array(['' if v is None else str(v) for v in labels])
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            blocks = {}
+            for level in dict.fromkeys(sorted_keys):
+                if level == '':
+                    continue
+                start = int(np.searchsorted(sorted_keys, level, side='left'))
+                stop = int(np.searchsorted(sorted_keys, level, side='right'))
+                blocks[level] = (start, stop)
+            _SORTED[variable] = (
+                np.ascontiguousarray(_DESIGN['X'][order]),
+                {name: y[order] for name, y in _DESIGN['outcomes'].items()},
+                blocks,
+            )
+    return _SORTED[variable]
+
+
+def _fit_cell(task):
+    """Ajusta todos los outcomes de una celda (variable, nivel) con arranque en caliente"""
+    variable, level, maxiter = task
+    X_sorted, outcomes, blocks = _sorted_design(variable)
+    start, stop = blocks[level]
+    X_block = X_sorted[start:stop]  # vista, sin copia
+    terms = np.array(_DESIGN['terminos'])
+
+    rows = []
+    previous = None
+    for outcome, y_sorted in outcomes.items():
+        y_block = y_sorted[start:stop]
+        valid = ~np.isnan(y_block)
+        X = X_block if valid.all() else X_block[valid]
+        y = y_block[valid]
+        # Covariables constantes dentro del estrato (p. ej. ritmo en ritmo_cat)
+        keep = np.ones(X.shape[1], dtype=bool)
+        keep[1:] = X[:, 1:].std(axis=0) > 0
+        X_fit = X if keep.all() else X[:, keep]
+
+        base = {
+            'estrato_var': variable,
+            'estrato': level,
+            'outcome': outcome,
+            'n': int(len(y)),
+            'eventos': int(y.sum()),
+        }
+        start_params = previous[keep] if previous is not None and len(previous) == keep.size else None
+        tic = time.perf_counter()
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                result = sm.Logit(y, X_fit).fit(disp=False, maxiter=maxiter, start_params=start_params)
+            elapsed = time.perf_counter() - tic
+            info = result.mle_retvals
+            conf = result.conf_int()
+            for j, term in enumerate(terms[keep]):
+                rows.append({
+                    **base,
+                    'term': term,
+                    'coef': result.params[j],
+                    'se': result.bse[j],
+                    'aOR': np.exp(result.params[j]),
+                    'LCL95': np.exp(conf[j, 0]),
+                    'UCL95': np.exp(conf[j, 1]),
+                    'p_value': result.pvalues[j],
+                    'convergio': bool(info.get('converged', False)),
+                    'iteraciones': int(info.get('iterations', -1)),
+                    'arranque_caliente': start_params is not None,
+                    'tiempo_s': elapsed,
+                    'error': None,
+                })
+            full = np.zeros(keep.size)
+            full[keep] = result.params
+            previous = full
+        except Exception as exc:
+            rows.append({
+                **base,
+                'term': None,
+                'convergio': False,
+                'arranque_caliente': start_params is not None,
+                'tiempo_s': time.perf_counter() - tic,
+                'error': f"{type(exc).__name__}: {exc}",
+            })
+    return rows
+
+
+def run_model_grid(df, outcomes, strata=None, include_global=True, n_jobs=None, maxiter=200, design=None):
+    """
+    Ajusta outcome ~ TCPR + edad + sexo_m + t_llegada_100 + ritmo en la
+    cohorte global y en cada nivel de cada variable de estratificación.
+
+    Devuelve (tabla de resultados, diseño). El diseño puede reutilizarse en
+    otra llamada (design=...) para no reconstruir la matriz.
+    """
+    design = design or build_design(df, outcomes, strata)
+    tasks = [(GLOBAL_STRATUM, GLOBAL_STRATUM, maxiter)] if include_global else []
+    for variable, labels in design['estratos'].items():
+        levels = sorted({str(v) for v in labels if v is not None})
+        tasks.extend((variable, level, maxiter) for level in levels)
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1:
+        _init_worker(design)
+        cells = [_fit_cell(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(design,)) as pool:
+            cells = list(pool.map(_fit_cell, tasks))
+
+    results = pd.DataFrame([row for cell in cells for row in cell])
+    return results, design
+
+
+def grid_to_json(results, stratum_var=GLOBAL_STRATUM):
+    """
+    Formato de logistica_ajustada_tcp_vs_notcp.json para una variable:
+    {outcome: {'n', 'resultados': [...]}} o {nivel: {outcome: ...}}.
+    """
+    subset = results[results['estrato_var'] == stratum_var]
+    out = {}
+    for (level, outcome), rows in subset.groupby(['estrato', 'outcome'], sort=False):
+        rows = rows[rows['term'].notna()]
+        entry = {
+            'n': int(rows['n'].iloc[0]) if len(rows) else 0,
+            'resultados': rows[['term', 'aOR', 'LCL95', 'UCL95', 'p_value']].to_dict(orient='records'),
+        }
+        if stratum_var == GLOBAL_STRATUM:
+            out[outcome] = entry
+        else:
+            out.setdefault(level, {})[outcome] = entry
+    return out
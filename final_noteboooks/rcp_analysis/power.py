@@ -0,0 +1,353 @@
+"""
+Simulación Monte Carlo de potencia y tamaño muestral.
+
+Reproduce el generador de datos simulados del notebook 3
+(generate_mock_data / calculate_outcome_prob: tamaños de grupo, probabilidades
+base, OR por grupo, efecto de edad >= 65 y de llegada > mediana) pero
+generando B cohortes a la vez como arrays (réplicas x pacientes), y aplica
+a cada una las pruebas del estudio:
+
+- fisher: T-CPR vs No T-CPR (grupos con RCP previa), Fisher exacto 2x2
+  vectorizado sobre la hipergeométrica
+- chi2: χ² global de los 4 grupos × outcome
+- logistica: outcome ~ TCPR + edad>=65 + llegada alta en los grupos con RCP,
+  Wald del coeficiente de TCPR (IRLS por lotes sobre todas las réplicas)
+
+El tamaño de efecto (tcpr_or) es lo que estiman fisher y logistica: el OR
+de T-CPR frente al comparador agrupado sin T-CPR (primeros respondientes y
+testigos legos). El generador traduce ese OR marginal al multiplicador de
+odds del grupo T-CPR (tcpr_group_or); con tcpr_or = 1 la tasa de rechazo es
+alpha. El escenario del notebook 3 (OR 1.8 frente a Sin RCP) equivale a un
+OR de ~0.8 frente al comparador.
+
+Los lotes de réplicas se reparten en un pool de procesos con semillas
+independientes (SeedSequence.spawn). power_curve devuelve la potencia por
+tamaño muestral (o meses de registro) y tamaño de efecto.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.optimize import brentq
+from scipy.special import gammaln
+
+# Grupos y tamaños del generador del notebook 3 (500 casos en 24 meses)
+GROUPS = ['Sin RCP previa', 'RCP por primeros respondientes', 'RCP Transtelefónica', 'RCP por testigos legos']
+GROUP_SIZES = np.array([166, 144, 113, 77])
+TCPR_INDEX = 2
+REFERENCE_INDEX = 0
+CASES_PER_MONTH = GROUP_SIZES.sum() / 24
+
+# Probabilidad base (grupo Sin RCP) y OR por grupo
+BASE_PROB = {'ROSC': 0.35, 'Supervivencia': 0.15, 'CPC_favorable': 0.10}
+GROUP_OR = np.array([1.0, 2.3, 1.8, 2.0])
+AGE_OR = 0.6      # edad >= 65
+ARRIVAL_OR = 0.7  # llegada > mediana
+AGE_MEAN, AGE_SD = 66.1, 16.3
+
+TESTS = ['fisher', 'chi2', 'logistica']
+
+
+def group_counts(n):
+    """Pacientes por grupo para un tamaño total n (proporciones del estudio)"""
+    counts = np.floor(GROUP_SIZES / GROUP_SIZES.sum() * n).astype(int)
+    counts[np.argsort(-(GROUP_SIZES / GROUP_SIZES.sum() * n - counts))[:n - counts.sum()]] += 1
+    return counts
+
+
+def _marginal_prob(outcome, group_or):
+    """Probabilidad de outcome de un grupo con ese OR frente a Sin RCP, promediada sobre edad y llegada"""
+    p65 = stats.norm.sf(65, AGE_MEAN, AGE_SD)
+    base = BASE_PROB[outcome]
+    prob = 0.0
+    for age_or, w_age in ((AGE_OR, p65), (1.0, 1 - p65)):
+        for arrival_or in (ARRIVAL_OR, 1.0):  # llegada > mediana: la mitad
+            odds = base / (1 - base) * group_or * age_or * arrival_or
+            prob += w_age * 0.5 * np.clip(odds / (1 + odds), 0.01, 0.95)
+    return prob
+
+
+def tcpr_group_or(tcpr_or, outcome='CPC_favorable'):
+    """
+    OR del grupo T-CPR frente a Sin RCP en el generador para que su OR
+    marginal frente al comparador agrupado (resto de grupos con RCP previa,
+    ponderados por tamaño) sea tcpr_or.
+    """
+    others = [i for i in range(len(GROUPS)) if i not in (TCPR_INDEX, REFERENCE_INDEX)]
+    weights = GROUP_SIZES[others] / GROUP_SIZES[others].sum()
+    p_comp = sum(w * _marginal_prob(outcome, GROUP_OR[i]) for w, i in zip(weights, others))
+    odds = tcpr_or * p_comp / (1 - p_comp)
+    target = odds / (1 + odds)
+    lo, hi = _marginal_prob(outcome, np.exp(-20)), _marginal_prob(outcome, np.exp(20))
+    if not lo < target < hi:
+        raise ValueError(f"OR {tcpr_or:g} frente al comparador inalcanzable para {outcome} "
+                         f"(probabilidades acotadas a [0.01, 0.95])")
+    return float(np.exp(brentq(lambda g: _marginal_prob(outcome, np.exp(g)) - target, -20, 20, xtol=1e-12)))
+
+
+def simulate_cohorts(rng, n, B, outcome='CPC_favorable', tcpr_or=None):
+    """
+    B cohortes simuladas de n pacientes. Devuelve dict de arrays:
+    'grupo' (n,), 'edad65' (B, n), 'llegada_alta' (B, n), 'y' (B, n).
+    tcpr_or: OR de T-CPR frente al comparador agrupado sin T-CPR (lo que
+    estiman las pruebas); None deja el generador del notebook 3.
+    """
+    group = np.repeat(np.arange(len(GROUPS)), group_counts(n))
+    effects = GROUP_OR.copy()
+    if tcpr_or is not None:
+        effects[TCPR_INDEX] = tcpr_group_or(tcpr_or, outcome)
+
+    edad = rng.normal(AGE_MEAN, AGE_SD, size=(B, n)).astype(int)
+    edad65 = edad >= 65
+    llegada = rng.exponential(8.4 * 60, size=(B, n))
+    llegada_alta = llegada > np.median(llegada, axis=1, keepdims=True)
+
+    base = BASE_PROB[outcome]
+    odds = (base / (1 - base)) * effects[group][None, :] * np.where(edad65, AGE_OR, 1.0) \
+        * np.where(llegada_alta, ARRIVAL_OR, 1.0)
+    prob = np.clip(odds / (1 + odds), 0.01, 0.95)
+    y = rng.random((B, n)) < prob
+    return {'grupo': group, 'edad65': edad65, 'llegada_alta': llegada_alta, 'y': y}
+
+
+def fisher_2x2_p(a, n_row1, events, n_total):
+    """
+    p-valor bilateral de Fisher para B tablas 2x2 con n_row1 y n_total fijos.
+    a: éxitos en la fila 1 (B,), events: éxitos totales (B,).
+    """
+    x = np.arange(n_row1 + 1)[None, :]
+    events = np.asarray(events)[:, None]
+    valid = (x <= events) & (events - x <= n_total - n_row1)
+    log_pmf = (gammaln(n_row1 + 1) - gammaln(x + 1) - gammaln(n_row1 - x + 1)
+               + gammaln(n_total - n_row1 + 1) - gammaln(events - x + 1) - gammaln(n_total - n_row1 - events + x + 1)
+               - (gammaln(n_total + 1) - gammaln(events + 1) - gammaln(n_total - events + 1)))
+    log_pmf = np.where(valid, log_pmf, -np.inf)
+    observed = np.take_along_axis(log_pmf, np.asarray(a)[:, None], axis=1)
+    extreme = log_pmf <= observed + np.log1p(1e-7)
+    return np.minimum(np.where(extreme, np.exp(log_pmf), 0.0).sum(axis=1), 1.0)
+
+
+def chi2_groups_p(y, group):
+    """χ² global grupos × outcome para B réplicas (sin corrección)"""
+    n_groups = group.max() + 1
+    onehot = np.eye(n_groups, dtype=float)[group]          # (n, g)
+    events = y.astype(float) @ onehot                       # (B, g)
+    totals = onehot.sum(axis=0)[None, :]
+    table = np.stack([events, totals - events], axis=2)     # (B, g, 2)
+    expected = table.sum(axis=2, keepdims=True) * table.sum(axis=1, keepdims=True) / table.sum(axis=(1, 2), keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stat = np.where(expected > 0, (table - expected) ** 2 / expected, 0.0).sum(axis=(1, 2))
+    return stats.chi2.sf(stat, df=n_groups - 1)
+
+
+def logistic_wald_p(X, y, term=1, maxiter=25, tol=1e-8):
+    """
+    Logística por IRLS para B réplicas a la vez. X (B, m, p), y (B, m).
+    Devuelve (p-valor de Wald del término, convergió) por réplica; las
+    réplicas con separación o sin convergencia devuelven p = 1.
+    """
+    B, m, p = X.shape
+    beta = np.zeros((B, p))
+    converged = np.zeros(B, dtype=bool)
+    ridge = 1e-10 * np.eye(p)
+    for _ in range(maxiter):
+        eta = np.einsum('bmp,bp->bm', X, beta)
+        mu = 1.0 / (1.0 + np.exp(-eta))
+        w = mu * (1 - mu)
+        hessian = np.einsum('bmp,bm,bmq->bpq', X, w, X) + ridge
+        gradient = np.einsum('bmp,bm->bp', X, y - mu)
+        step = np.linalg.solve(hessian, gradient[..., None])[..., 0]
+        beta = beta + step
+        converged = np.abs(step).max(axis=1) < tol
+        if converged.all():
+            break
+    eta = np.einsum('bmp,bp->bm', X, beta)
+    mu = 1.0 / (1.0 + np.exp(-eta))
+    hessian = np.einsum('bmp,bm,bmq->bpq', X, mu * (1 - mu), X) + ridge
+    se = np.sqrt(np.linalg.inv(hessian)[:, term, term])
+    z = beta[:, term] / se
+    p_value = 2 * stats.norm.sf(np.abs(z))
+    ok = converged & np.isfinite(p_value) & (np.abs(beta[:, term]) < 15)
+    return np.where(ok, p_value, 1.0), ok
+
+
+def run_tests(cohorts, tests=TESTS):
+    """Aplica las pruebas del estudio a cada réplica. Devuelve {test: p-valores (B,)}"""
+    group, y = cohorts['grupo'], cohorts['y']
+    results = {}
+    rcp = group != REFERENCE_INDEX
+    tcpr = group[rcp] == TCPR_INDEX
+    if 'fisher' in tests:
+        y_rcp = y[:, rcp]
+        a = y_rcp[:, tcpr].sum(axis=1)
+        results['fisher'] = fisher_2x2_p(a, int(tcpr.sum()), y_rcp.sum(axis=1), int(rcp.sum()))
+    if 'chi2' in tests:
+        results['chi2'] = chi2_groups_p(y, group)
+    if 'logistica' in tests:
+        B, m = y.shape[0], int(rcp.sum())
+        X = np.empty((B, m, 4))
+        X[:, :, 0] = 1.0
+        X[:, :, 1] = tcpr[None, :]
+        X[:, :, 2] = cohorts['edad65'][:, rcp]
+        X[:, :, 3] = cohorts['llegada_alta'][:, rcp]
+        results['logistica'], results['logistica_convergio'] = logistic_wald_p(X, y[:, rcp].astype(float))
+    return results
+
+
+def _simulate_chunk(task):
+    """Un lote de réplicas para una combinación (n, efecto); se ejecuta en el worker"""
+    n, tcpr_or, B, outcome, tests, alpha, seed_seq = task
+    rng = np.random.default_rng(seed_seq)
+    p_values = run_tests(simulate_cohorts(rng, n, B, outcome, tcpr_or), tests)
+    out = {'n': n, 'tcpr_or': tcpr_or, 'B': B}
+    for test in tests:
+        out[test] = int(np.count_nonzero(p_values[test] < alpha))
+    if 'logistica' in tests:
+        out['logistica_convergio'] = int(p_values['logistica_convergio'].sum())
+    return out
+
+
+def power_curve(sample_sizes=None, effects=(1.8,), months=None, B=1000, outcome='CPC_favorable', tests=TESTS,
+                alpha=0.05, n_jobs=None, seed=42, chunk=250):
+    """
+    Potencia por tamaño muestral (o meses de registro) y OR de T-CPR.
+
+    sample_sizes: lista de n; months: alternativa en meses (CASES_PER_MONTH
+    casos por mes). effects: OR de T-CPR frente al comparador agrupado sin
+    T-CPR (el que estiman las pruebas; 1 = hipótesis nula).
+
+    Devuelve DataFrame con n, meses, tcpr_or y potencia (y su error
+    estándar Monte Carlo) por prueba.
+    """
+    if sample_sizes is None:
+        months = months if months is not None else [12, 24, 36, 48, 60]
+        sample_sizes = [int(round(m * CASES_PER_MONTH)) for m in months]
+    tests = list(tests)
+
+    tasks = []
+    seeds = np.random.SeedSequence(seed).spawn(len(sample_sizes) * len(effects))
+    for (n, tcpr_or), seed_seq in zip([(n, e) for n in sample_sizes for e in effects], seeds):
+        chunk_seeds = seed_seq.spawn(int(np.ceil(B / chunk)))
+        for i, chunk_seed in enumerate(chunk_seeds):
+            size = min(chunk, B - i * chunk)
+            tasks.append((int(n), float(tcpr_or), size, outcome, tests, alpha, chunk_seed))
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    tic = time.perf_counter()
+    if n_jobs == 1:
+        parts = [_simulate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(_simulate_chunk, tasks))
+
+    summary = pd.DataFrame(parts).groupby(['n', 'tcpr_or'], as_index=False).sum()
+    summary.insert(1, 'meses', summary['n'] / CASES_PER_MONTH)
+    for test in tests:
+        power = summary[test] / summary['B']
+        summary[f'potencia_{test}'] = power
+        summary[f'ee_{test}'] = np.sqrt(power * (1 - power) / summary['B'])
+    summary = summary.drop(columns=tests)
+    summary.attrs['tiempo_s'] = time.perf_counter() - tic
+    return summary
+
+
+def required_sample_size(curve, test='fisher', target=0.8):
+    """
+    Menor n (y meses) con potencia >= target por efecto, interpolando
+    linealmente entre los tamaños simulados. NaN si no se alcanza.
+    """
+    rows = []
+    for tcpr_or, sub in curve.sort_values('n').groupby('tcpr_or'):
+        power = sub[f'potencia_{test}'].to_numpy()
+        n = sub['n'].to_numpy()
+        above = np.flatnonzero(power >= target)
+        if not len(above):
+            n_req = np.nan
+        elif above[0] == 0:
+            n_req = n[0]
+        else:
+            i = above[0]
+            n_req = n[i - 1] + (target - power[i - 1]) * (n[i] - n[i - 1]) / (power[i] - power[i - 1])
+        rows.append({'tcpr_or': tcpr_or, 'test': test, 'potencia_objetivo': target,
+                     'n_necesario': n_req, 'meses_necesarios': n_req / CASES_PER_MONTH})
+    return pd.DataFrame(rows)
+
+
+def check_null_size(n=1500, B=2000, outcome='CPC_favorable', alpha=0.05, seed=42, n_jobs=None):
+    """
+    Con tcpr_or = 1 las pruebas de T-CPR (fisher, logistica) deben rechazar
+    en torno a alpha (Fisher, algo menos por ser conservador). Lanza
+    AssertionError si la tasa supera alpha en más de 3 errores estándar o
+    queda por debajo de alpha / 2.
+    """
+    curve = power_curve(sample_sizes=[n], effects=(1.0,), B=B, outcome=outcome, tests=['fisher', 'logistica'],
+                        alpha=alpha, n_jobs=n_jobs, seed=seed)
+    limit = alpha + 3 * np.sqrt(alpha * (1 - alpha) / B)
+    for test in ('fisher', 'logistica'):
+        rate = float(curve[f'potencia_{test}'].iloc[0])
+        if not alpha / 2 <= rate <= limit:
+            raise AssertionError(f"{test}: tasa de rechazo {rate:.3f} con OR 1 (alpha {alpha})")
+
+
+def plot_power_curves(curve, test='fisher', path=None, target=0.8):
+    """Curvas de potencia frente a meses de registro, una por OR de T-CPR"""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(7, 4))
+    for tcpr_or, sub in curve.sort_values('n').groupby('tcpr_or'):
+        ax.errorbar(sub['meses'], sub[f'potencia_{test}'], yerr=1.96 * sub[f'ee_{test}'], marker='o', capsize=3,
+                    label=f'OR T-CPR vs otra RCP = {tcpr_or:g}')
+    ax.axhline(target, color='red', linestyle='--', alpha=0.7)
+    ax.set_ylim(0, 1)
+    ax.set_xlabel('Meses de registro')
+    ax.set_ylabel('Potencia')
+    ax.set_title(f'Potencia ({test})')
+    ax.legend()
+    plt.tight_layout()
+    if path is not None:
+        plt.savefig(path, dpi=300, bbox_inches='tight', facecolor='white', edgecolor='none')
+    return fig
+
+
+def main(argv=None):
+    import argparse
+
+    from .cohort import find_root
+
+    parser = argparse.ArgumentParser(description='Potencia y tamaño muestral por simulación Monte Carlo')
+    parser.add_argument('--outcome', choices=list(BASE_PROB), default='CPC_favorable')
+    parser.add_argument('--effects', nargs='+', type=float, default=[1.0, 1.5, 2.0, 2.5], help='OR de T-CPR vs el comparador agrupado sin T-CPR (1 = nula)')
+    parser.add_argument('--months', nargs='+', type=float, default=[24, 36, 48, 60, 72])
+    parser.add_argument('--B', type=int, default=1000, help='Cohortes simuladas por combinación')
+    parser.add_argument('--tests', nargs='+', choices=TESTS, default=TESTS)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--target', type=float, default=0.8)
+    parser.add_argument('--jobs', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out-dir', help='Directorio de salida (por defecto outputs_inferencia)')
+    args = parser.parse_args(argv)
+
+    curve = power_curve(months=args.months, effects=args.effects, B=args.B, outcome=args.outcome, tests=args.tests,
+                        alpha=args.alpha, n_jobs=args.jobs, seed=args.seed)
+    print(f"⏱️ {len(curve)} combinaciones x {args.B} cohortes en {curve.attrs['tiempo_s']:.1f}s")
+    print(curve.round(3).to_string(index=False))
+
+    necesarios = pd.concat([required_sample_size(curve, test, args.target) for test in args.tests], ignore_index=True)
+    print(f"\n🎯 Tamaño necesario para potencia {args.target:.0%}:")
+    print(necesarios.round(1).to_string(index=False))
+
+    out_dir = args.out_dir or find_root() / 'final_noteboooks' / 'outputs_inferencia'
+    os.makedirs(out_dir, exist_ok=True)
+    curve.to_csv(os.path.join(out_dir, f'potencia_{args.outcome}.csv'), index=False)
+    necesarios.to_csv(os.path.join(out_dir, f'tamano_muestral_{args.outcome}.csv'), index=False)
+    plot_power_curves(curve, args.tests[0], os.path.join(out_dir, f'potencia_{args.outcome}.png'), args.target)
+    print(f"💾 Resultados guardados en {out_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
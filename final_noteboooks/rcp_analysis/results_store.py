@@ -0,0 +1,286 @@
+"""
+Almacén único de resultados (SQLite embebido) para outputs_inferencia.
+
+outputs_inferencia acumula más de 20 JSON con contenido solapado, cada uno
+reescrito entero, y el borrador del paper tendría que abrir y parsear cada
+uno. Aquí todos los resultados viven en una base indexada:
+
+    clave = (run_id, analisis, outcome, estrato, comparacion)
+    valor = dict de métricas (JSON) + columnas numéricas habituales
+            (estimacion, LCL95, UCL95, p_value, n) para consultas rápidas
+
+- upsert_results / ingest_json: inserción incremental (INSERT ... ON CONFLICT)
+- query_results: DataFrame filtrado por cualquier parte de la clave
+  (por defecto la última ejecución de cada análisis)
+- export_json / export_csv: regeneran los ficheros actuales con su misma
+  estructura a partir del almacén (LAYOUTS describe el anidamiento de cada uno)
+- ingest_legacy_files: importa los JSON existentes de outputs_inferencia
+
+Los estratos anidados (variable -> nivel) se guardan como una ruta
+'variable|nivel' en la columna estrato.
+"""
+
+import json
+import sqlite3
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STORE_FILENAME = 'resultados.sqlite'
+STRATUM_SEP = '|'
+
+# Anidamiento de cada JSON: niveles de claves de dict y, opcionalmente, una
+# hoja lista ('lista', campo del registro que hace de comparación)
+LAYOUTS = {
+    'resultados_inferencia_5_statistical_analysis': ['outcome'],
+    'pairwise_ref_telefonica_5_statistical_analysis': ['outcome', ('lista', 'comparado_con')],
+    'matriz_tcp_vs_notcp': ['outcome'],
+    'estratos_tcp_vs_notcp': ['estrato', 'estrato', 'outcome'],
+    'logistica_ajustada_tcp_vs_notcp': ['outcome'],
+    'logistica_ajustada_bootstrap_tcp_vs_notcp': ['outcome'],
+    'logistica_ajustada_mi_tcp_vs_notcp': ['outcome'],
+    'logistica_ajustada_estratos_tcp_vs_notcp': ['estrato', 'estrato', 'outcome'],
+    'mediana_iqr_tiempos_bootstrap': ['outcome', ('lista', 'grupo')],
+    'psm_tcp_vs_notcp': [],
+}
+
+# Claves del payload que se copian a las columnas numéricas indexables
+ESTIMATE_KEYS = ['OR', 'OR_TCPR_vs_NoT', 'OR_ref_vs_g', 'aOR', 'OR_emparejado', 'p', 'mediana']
+P_VALUE_KEYS = ['p_value', 'p_fisher']
+N_KEYS = ['n', 'n_pares']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ejecuciones (
+    run_id TEXT PRIMARY KEY,
+    creado TEXT NOT NULL,
+    descripcion TEXT,
+    parametros TEXT
+);
+CREATE TABLE IF NOT EXISTS resultados (
+    run_id TEXT NOT NULL,
+    analisis TEXT NOT NULL,
+    outcome TEXT NOT NULL DEFAULT '',
+    estrato TEXT NOT NULL DEFAULT '',
+    comparacion TEXT NOT NULL DEFAULT '',
+    estimacion REAL,
+    lcl95 REAL,
+    ucl95 REAL,
+    p_value REAL,
+    n INTEGER,
+    payload TEXT NOT NULL,
+    actualizado TEXT NOT NULL,
+    PRIMARY KEY (run_id, analisis, outcome, estrato, comparacion)
+);
+CREATE INDEX IF NOT EXISTS idx_resultados_analisis ON resultados (analisis, outcome, estrato, comparacion);
+CREATE INDEX IF NOT EXISTS idx_resultados_comparacion ON resultados (comparacion, outcome);
+"""
+
+
+def _to_builtin(obj):
+    """Convierte tipos numpy/pandas para json.dumps"""
+    if isinstance(obj, dict):
+        return {str(k): _to_builtin(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_builtin(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    # NaN/inf (numpy o Python) no son JSON válido: se guardan como null
+    if isinstance(obj, float) and not np.isfinite(obj):
+        return None
+    return obj
+
+
+def _first(payload, keys):
+    if not isinstance(payload, dict):
+        return None
+    for key in keys:
+        value = payload.get(key)
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+def open_store(path=None):
+    """Abre (o crea) el almacén; por defecto outputs_inferencia/resultados.sqlite"""
+    if path is None:
+        from .cohort import find_root
+        path = find_root() / 'final_noteboooks' / 'outputs_inferencia' / STORE_FILENAME
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def start_run(conn, descripcion=None, parametros=None, run_id=None):
+    """Registra una ejecución y devuelve su run_id"""
+    run_id = run_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO ejecuciones (run_id, creado, descripcion, parametros) VALUES (?, ?, ?, ?)",
+            (run_id, datetime.now().isoformat(timespec='seconds'), descripcion,
+             json.dumps(_to_builtin(parametros or {}), ensure_ascii=False)),
+        )
+    return run_id
+
+
+def upsert_results(conn, run_id, analisis, rows):
+    """
+    Inserta o actualiza resultados. rows: iterable de dicts con claves
+    opcionales 'outcome', 'estrato', 'comparacion' y 'payload' (dict de métricas).
+    """
+    now = datetime.now().isoformat(timespec='seconds')
+    records = []
+    for row in rows:
+        payload = _to_builtin(row.get('payload', {}))
+        records.append((
+            run_id, analisis,
+            str(row.get('outcome') or ''), str(row.get('estrato') or ''), str(row.get('comparacion') or ''),
+            _first(payload, ESTIMATE_KEYS), _first(payload, ['LCL95']), _first(payload, ['UCL95']),
+            _first(payload, P_VALUE_KEYS), _first(payload, N_KEYS),
+            json.dumps(payload, ensure_ascii=False), now,
+        ))
+    with conn:
+        conn.executemany("""
+            INSERT INTO resultados (run_id, analisis, outcome, estrato, comparacion,
+                                    estimacion, lcl95, ucl95, p_value, n, payload, actualizado)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (run_id, analisis, outcome, estrato, comparacion) DO UPDATE SET
+                estimacion = excluded.estimacion, lcl95 = excluded.lcl95, ucl95 = excluded.ucl95,
+                p_value = excluded.p_value, n = excluded.n,
+                payload = excluded.payload, actualizado = excluded.actualizado
+        """, records)
+    return len(records)
+
+
+def _flatten(obj, layout, keys=None):
+    """Recorre un JSON anidado según su layout y produce filas con clave"""
+    keys = dict(keys or {})
+    if not layout:
+        yield {**keys, 'payload': obj}
+        return
+    level, rest = layout[0], layout[1:]
+    if isinstance(level, tuple):
+        _, field = level
+        for record in obj:
+            yield {**keys, 'comparacion': record.get(field), 'payload': record}
+        return
+    for key, value in obj.items():
+        new_keys = dict(keys)
+        if level == 'estrato' and new_keys.get('estrato'):
+            new_keys['estrato'] = f"{new_keys['estrato']}{STRATUM_SEP}{key}"
+        else:
+            new_keys[level] = key
+        yield from _flatten(value, rest, new_keys)
+
+
+def ingest_json(conn, run_id, analisis, obj, layout=None):
+    """Guarda un resultado con la estructura de su JSON (ver LAYOUTS)"""
+    layout = LAYOUTS.get(analisis, []) if layout is None else layout
+    return upsert_results(conn, run_id, analisis, _flatten(obj, layout))
+
+
+def latest_run(conn, analisis):
+    row = conn.execute(
+        "SELECT run_id FROM resultados WHERE analisis = ? ORDER BY actualizado DESC, run_id DESC LIMIT 1",
+        (analisis,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def query_results(conn, analisis=None, outcome=None, estrato=None, comparacion=None, run_id='latest',
+                  expand=True):
+    """
+    Consulta resultados como DataFrame. run_id='latest' toma la última
+    ejecución de cada análisis; None devuelve todas. Con expand=True las
+    métricas escalares del payload se añaden como columnas.
+    """
+    clauses, params = [], []
+    for column, value in [('analisis', analisis), ('outcome', outcome), ('estrato', estrato), ('comparacion', comparacion)]:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f"r.{column} IN ({', '.join('?' * len(value))})")
+            params.extend(value)
+        else:
+            clauses.append(f"r.{column} = ?")
+            params.append(value)
+    if run_id == 'latest':
+        clauses.append("""r.run_id = (SELECT r2.run_id FROM resultados r2 WHERE r2.analisis = r.analisis
+                          ORDER BY r2.actualizado DESC, r2.run_id DESC LIMIT 1)""")
+    elif run_id is not None:
+        clauses.append("r.run_id = ?")
+        params.append(run_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    df = pd.read_sql_query(f"SELECT r.* FROM resultados r {where} ORDER BY r.rowid", conn, params=params)
+    df['payload'] = df['payload'].map(json.loads)
+    if expand and not df.empty:
+        scalars = pd.DataFrame([
+            {k: v for k, v in p.items() if not isinstance(v, (dict, list))} if isinstance(p, dict) else {}
+            for p in df['payload']
+        ], index=df.index)
+        # El payload manda sobre las columnas indexadas con el mismo nombre (p. ej. n)
+        df = pd.concat([df.drop(columns=[c for c in scalars.columns if c in df.columns]), scalars], axis=1)
+    return df
+
+
+def _nest(rows, layout):
+    if not layout:
+        return rows[0]['payload'] if rows else {}
+    level, rest = layout[0], layout[1:]
+    if isinstance(level, tuple):
+        return [r['payload'] for r in rows]
+    out = {}
+    depth = sum(1 for lv in layout if lv == 'estrato')
+    for row in rows:
+        if level == 'estrato':
+            parts = row['estrato'].split(STRATUM_SEP)
+            key = parts[len(parts) - depth]
+        else:
+            key = row[level]
+        out.setdefault(key, []).append(row)
+    return {key: _nest(group, rest) for key, group in out.items()}
+
+
+def export_json(conn, analisis, path, run_id='latest'):
+    """Regenera el JSON de un análisis desde el almacén con su estructura original"""
+    df = query_results(conn, analisis=analisis, run_id=run_id, expand=False)
+    obj = _nest(df.to_dict(orient='records'), LAYOUTS.get(analisis, []))
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def export_csv(conn, analisis, path, columns=None, rename=None, run_id='latest'):
+    """
+    Exporta a CSV las métricas escalares de un análisis (más las claves).
+    columns/rename permiten reproducir la cabecera de los CSV existentes.
+    """
+    df = query_results(conn, analisis=analisis, run_id=run_id)
+    df = df.drop(columns=['run_id', 'analisis', 'payload', 'actualizado', 'estimacion', 'lcl95', 'ucl95'], errors='ignore')
+    # Claves e índices vacíos (p. ej. sin estrato) no se exportan
+    df = df.drop(columns=[c for c in ['estrato', 'comparacion', 'p_value', 'n'] if c in df.columns and
+                          df[c].replace('', np.nan).isna().all()])
+    if rename:
+        df = df.rename(columns=rename)
+    if columns:
+        df = df[columns]
+    df.to_csv(path, index=False)
+    return path
+
+
+def ingest_legacy_files(conn, out_dir, run_id=None):
+    """
+    Importa los JSON existentes de outputs_inferencia. Los que no tienen
+    layout conocido se guardan enteros (una fila por fichero).
+    """
+    run_id = run_id or start_run(conn, descripcion=f'Importación de {out_dir}')
+    counts = {}
+    for path in sorted(Path(out_dir).glob('*.json')):
+        with open(path) as f:
+            obj = json.load(f)
+        counts[path.stem] = ingest_json(conn, run_id, path.stem, obj)
+    return run_id, counts
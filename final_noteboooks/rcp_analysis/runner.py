@@ -0,0 +1,263 @@
+"""
+Ejecución sin kernel y en paralelo de los análisis de los notebooks 2, 3 y 5.
+
+- Los bloques del notebook 5 (rcp_analysis.inference) son tareas
+  independientes sobre la misma cohorte y el mismo bootstrap común; cada
+  worker carga la cohorte una vez al arrancar.
+- Los notebooks 2 (descriptivo) y 3 (modelos predictivos) se ejecutan celda a
+  celda en un worker, con backend Agg y el directorio final_noteboooks como
+  directorio de trabajo, de modo que escriben los mismos ficheros.
+- Al terminar, los resultados inferenciales se registran en el almacén de
+  resultados (rcp_analysis.results_store) con un run_id y se exporta el CSV
+  de la matriz T-CPR vs no T-CPR.
+
+Uso: python -m rcp_analysis [--tasks ...] [--jobs N] [--data CSV] [--out-dir DIR]
+"""
+
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+from .cohort import OUTCOMES, find_root, load_cohort
+
+# Notebooks que se ejecutan enteros (sin equivalente en el paquete)
+NOTEBOOK_TASKS = {
+    'descriptiva': '2.descriptive_statistics.ipynb',
+    'exploratoria': '3.exploratory_analysis.ipynb',
+}
+
+# Bloques del notebook 5 -> nombre de análisis en el almacén de resultados
+INFERENCE_TASKS = {
+    'principal': 'resultados_inferencia_5_statistical_analysis',
+    'pareadas': 'pairwise_ref_telefonica_5_statistical_analysis',
+    'matriz': 'matriz_tcp_vs_notcp',
+    'estratos': 'estratos_tcp_vs_notcp',
+    'rejilla': None,
+    'logistica_bootstrap': 'logistica_ajustada_bootstrap_tcp_vs_notcp',
+    'imputacion_multiple': 'logistica_ajustada_mi_tcp_vs_notcp',
+    'psm': 'psm_tcp_vs_notcp',
+    'tiempos': 'mediana_iqr_tiempos_bootstrap',
+    'proporciones': None,
+    'dosis_respuesta': None,
+    'subgrupos': None,
+}
+
+ALL_TASKS = list(INFERENCE_TASKS) + list(NOTEBOOK_TASKS)
+
+# Estado del worker (se rellena con _init_worker)
+_STATE = {}
+
+
+def _init_worker(data_path, out_dir, inner_jobs, boot_b, seed):
+    import matplotlib
+    matplotlib.use('Agg')
+    import warnings
+    warnings.filterwarnings('ignore')
+    _STATE.update({
+        'data_path': data_path,
+        'out_dir': Path(out_dir),
+        'inner_jobs': inner_jobs,
+        'boot_b': boot_b,
+        'seed': seed,
+        'df': None,
+    })
+
+
+def _cohort():
+    if _STATE['df'] is None:
+        _STATE['df'] = load_cohort(_STATE['data_path'])
+    return _STATE['df']
+
+
+def _boot(df):
+    from .bootstrap import get_bootstrap
+    return get_bootstrap(df, strata_col='grupo_rcp', B=_STATE['boot_b'], seed=_STATE['seed'])
+
+
+def run_notebook_cells(path, workdir=None):
+    """
+    Ejecuta las celdas de código de un notebook en un espacio de nombres nuevo
+    (sin kernel). Se ignoran las líneas mágicas (%) y de shell (!).
+    """
+    import matplotlib.pyplot as plt
+
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        nb = json.load(f)
+    previous = Path.cwd()
+    os.chdir(workdir or path.parent)
+    namespace = {'__name__': '__main__'}
+    try:
+        for i, cell in enumerate(nb['cells']):
+            if cell['cell_type'] != 'code':
+                continue
+            source = ''.join(cell['source'])
+            source = '\n'.join(line for line in source.split('\n') if not line.lstrip().startswith(('%', '!')))
+            exec(compile(source, f'{path.name}[{i}]', 'exec'), namespace)
+            plt.close('all')
+    finally:
+        os.chdir(previous)
+    return namespace
+
+
+def _run_inference_task(name):
+    from . import inference
+
+    df = _cohort()
+    out_dir = _STATE['out_dir']
+    jobs = _STATE['inner_jobs']
+    if name == 'principal':
+        return inference.run_main_analysis(df, _boot(df), OUTCOMES, out_dir)
+    if name == 'pareadas':
+        return inference.run_pairwise(df, _boot(df), OUTCOMES, out_dir)
+    if name == 'matriz':
+        matriz = inference.run_tcpr_matrix(df, _boot(df), OUTCOMES, out_dir)
+        inference.plot_tcpr_outcomes(matriz, out_dir)
+        return matriz
+    if name == 'estratos':
+        estratos = inference.run_strata(df, _boot(df), OUTCOMES, out_dir)
+        inference.plot_strata(estratos, out_dir)
+        return estratos
+    if name == 'rejilla':
+        ajustados, ajustados_estratos, _ = inference.run_adjusted_grid(df, OUTCOMES, out_dir, n_jobs=jobs)
+        return {'logistica_ajustada_tcp_vs_notcp': ajustados,
+                'logistica_ajustada_estratos_tcp_vs_notcp': ajustados_estratos}
+    if name == 'logistica_bootstrap':
+        ajustados_boot = inference.run_lr_bootstrap(df, OUTCOMES, out_dir, B=1000)
+        inference.plot_aor_tcpr(OUTCOMES, ajustados_boot, out_dir)
+        return ajustados_boot
+    if name == 'imputacion_multiple':
+        return inference.run_multiple_imputation(df, OUTCOMES, out_dir, seed=_STATE['seed'], n_jobs=jobs)
+    if name == 'psm':
+        psm = inference.run_psm(df, OUTCOMES, out_dir, B=_STATE['boot_b'], seed=_STATE['seed'], n_jobs=jobs)
+        return inference.psm_to_json(psm)
+    if name == 'tiempos':
+        return inference.run_time_quantiles(df, _boot(df), out_dir)
+    if name == 'proporciones':
+        inference.plot_group_rates(df, _boot(df), OUTCOMES, out_dir)
+        return None
+    if name == 'dosis_respuesta':
+        from .dose_response import add_year, run_dose_response
+        if 'FECHA_LLAMADA' in df.columns:
+            run_dose_response(add_year(df), OUTCOMES, out_dir, by='anio', seed=_STATE['seed'])
+        else:
+            run_dose_response(df, OUTCOMES, out_dir, seed=_STATE['seed'])
+        return None
+    if name == 'subgrupos':
+        from .subgroups import run_subgroup_scan
+        run_subgroup_scan(df, OUTCOMES, out_dir)
+        return None
+    raise ValueError(f"Tarea desconocida: '{name}'. Opciones: {ALL_TASKS}")
+
+
+def _run_task(name):
+    """Ejecuta una tarea en el worker; captura la salida y los errores"""
+    log = StringIO()
+    tic = time.perf_counter()
+    try:
+        with redirect_stdout(log):
+            if name in NOTEBOOK_TASKS:
+                notebook_dir = find_root() / 'final_noteboooks'
+                run_notebook_cells(notebook_dir / NOTEBOOK_TASKS[name], workdir=notebook_dir)
+                result = None
+            else:
+                result = _run_inference_task(name)
+        error = None
+    except Exception:
+        result, error = None, traceback.format_exc()
+    return {'tarea': name, 'resultado': result, 'error': error, 'log': log.getvalue(),
+            'tiempo_s': time.perf_counter() - tic}
+
+
+def register_results(outputs, out_dir, descripcion='rcp_analysis runner', parametros=None):
+    """Inserta en el almacén los resultados inferenciales y exporta el CSV de la matriz"""
+    from .results_store import export_csv, ingest_json, open_store, start_run
+
+    conn = open_store(Path(out_dir) / 'resultados.sqlite')
+    run_id = start_run(conn, descripcion=descripcion, parametros=parametros)
+    for name, output in outputs.items():
+        if output['error'] or output['resultado'] is None:
+            continue
+        analisis = INFERENCE_TASKS.get(name)
+        if analisis:
+            ingest_json(conn, run_id, analisis, output['resultado'])
+        elif name == 'rejilla':
+            for analisis, obj in output['resultado'].items():
+                ingest_json(conn, run_id, analisis, obj)
+    if 'matriz' in outputs and not outputs['matriz']['error']:
+        export_csv(conn, 'matriz_tcp_vs_notcp', Path(out_dir) / 'matriz_tcp_vs_notcp.csv', rename={'outcome': 'Outcome'},
+                   columns=['Outcome', 'OR_TCPR_vs_NoT', 'LCL95', 'UCL95', 'p_fisher', 'n_TCPR', 'n_NoT'], run_id=run_id)
+    conn.close()
+    return run_id
+
+
+def run_all(tasks=None, jobs=None, data_path=None, out_dir=None, boot_b=2000, seed=42, store=True, verbose=False):
+    """
+    Ejecuta las tareas en un pool de procesos (las más largas primero) y
+    devuelve {tarea: {'resultado', 'error', 'log', 'tiempo_s'}}.
+    """
+    tasks = tasks or ALL_TASKS
+    unknown = [t for t in tasks if t not in ALL_TASKS]
+    if unknown:
+        raise ValueError(f"Tareas desconocidas: {unknown}. Opciones: {ALL_TASKS}")
+    out_dir = Path(out_dir) if out_dir else find_root() / 'final_noteboooks' / 'outputs_inferencia'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    jobs = min(jobs, len(tasks))
+    inner_jobs = max(1, (os.cpu_count() or 1) // jobs)
+    # Notebooks y modelos primero: son las tareas más largas
+    long_tasks = ('rejilla', 'psm', 'logistica_bootstrap', 'imputacion_multiple')
+    ordered = sorted(tasks, key=lambda t: (t not in NOTEBOOK_TASKS, t not in long_tasks))
+
+    initargs = (data_path, str(out_dir), inner_jobs, boot_b, seed)
+    outputs = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as pool:
+        futures = {pool.submit(_run_task, name): name for name in ordered}
+        for future in as_completed(futures):
+            output = future.result()
+            outputs[output['tarea']] = output
+            status = '❌' if output['error'] else '✅'
+            print(f"{status} {output['tarea']} ({output['tiempo_s']:.1f}s)")
+            if verbose and output['log']:
+                print(output['log'])
+            if output['error']:
+                print(output['error'])
+
+    if store and any(name in INFERENCE_TASKS for name in outputs):
+        run_id = register_results(outputs, out_dir, parametros={'tareas': tasks, 'B': boot_b, 'seed': seed})
+        print(f"📦 Resultados registrados en el almacén (run_id={run_id})")
+    return outputs
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ejecución sin kernel de los análisis de los notebooks 2, 3 y 5')
+    parser.add_argument('--tasks', nargs='+', choices=ALL_TASKS, help='Tareas a ejecutar (por defecto, todas)')
+    parser.add_argument('--skip', nargs='+', choices=ALL_TASKS, default=[], help='Tareas a omitir')
+    parser.add_argument('--jobs', type=int, help='Procesos en paralelo (por defecto, núcleos disponibles)')
+    parser.add_argument('--data', help='CSV de la cohorte limpia (por defecto, el del notebook 5)')
+    parser.add_argument('--out-dir', help='Directorio de salida inferencial (por defecto outputs_inferencia)')
+    parser.add_argument('--boot', type=int, default=2000, help='Réplicas bootstrap (B)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-store', action='store_true', help='No registrar resultados en el almacén')
+    parser.add_argument('--verbose', action='store_true', help='Mostrar la salida de cada tarea')
+    args = parser.parse_args(argv)
+
+    tasks = [t for t in (args.tasks or ALL_TASKS) if t not in args.skip]
+    print(f"🚀 Ejecutando {len(tasks)} tareas: {', '.join(tasks)}")
+    tic = time.perf_counter()
+    outputs = run_all(tasks, jobs=args.jobs, data_path=args.data, out_dir=args.out_dir, boot_b=args.boot,
+                      seed=args.seed, store=not args.no_store, verbose=args.verbose)
+    failed = [name for name, output in outputs.items() if output['error']]
+    print(f"⏱️ Tiempo total: {time.perf_counter() - tic:.1f}s")
+    if failed:
+        print(f"❌ Tareas con error: {', '.join(failed)}")
+        return 1
+    print('✅ Todas las tareas completadas')
+    return 0
@@ -0,0 +1,369 @@
+"""
+Análisis de sensibilidad sobre las decisiones metodológicas de la limpieza.
+
+Cada escenario de SCENARIOS es una variante de las reglas de cleaning.py
+(CLEANING_RULES) y/o de sus listas de palabras clave (KEYWORD_LISTS):
+ventana de emparejamiento SVA/SVB, lista de trauma, respondiente no
+identificado y CPC de supervivientes sin CPC explícito.
+
+- El export se lee, valida y deduplica una sola vez (esas etapas no dependen
+  de las reglas) y cada worker lo recibe una vez al arrancar.
+- Cada escenario (en paralelo) fusiona SVA/SVB y procesa con sus reglas,
+  aplica el paso de process_data.py (casilla Excluido de la revisión manual
+  y separación CPC válido / excluidos: add_derived_flags + split_datasets),
+  prepara la cohorte como el notebook 5 y calcula los análisis principales
+  T-CPR vs no T-CPR: OR bootstrap (inference.tcpr_comparison) y aOR de la
+  logística ajustada (model_grid, cohorte global).
+- Se devuelve una tabla comparativa: tamaño de cohorte y grupos, y OR/aOR
+  por outcome y escenario, con el cambio del aOR respecto al escenario base.
+- check_base_scenario comprueba que el escenario base reproduce la cohorte
+  publicada del notebook 5 (n, OR y aOR); main lo ejecuta si existe.
+
+Uso: python -m rcp_analysis.sensitivity [--raw CSV] [--escenarios ...] [--jobs N] [--boot B]
+"""
+
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .cohort import DATA_FILENAME, OUTCOMES, TCPR_GROUP, find_root, load_cohort, prepare_cohort
+
+# Columnas de la salida de cleaning.py -> esquema de la cohorte del notebook 5
+CLEANED_TO_NOTEBOOK = {
+    'n_informe': 'NUM INFORME', 'fecha': 'FECHA_LLAMADA', 'edad': 'EDAD', 'sexo': 'SEXO',
+    'rcp_transtelefonica': 'RCP_TRANSTELEFONICA', 'desa_externo': 'DESA_EXTERNO', 'tiempo_llegada': 'Tiempo_llegada',
+    'tiempo_rcp': 'Tiempo_Rcp', 'ritmo_desfibrilable': 'Desfibrilable_inicial', 'rosc': 'ROSC',
+    'supervivencia_7dias': 'Supervivencia_7dias', 'cpc': 'CPC',
+}
+
+# Escenario -> descripción, reglas (CLEANING_RULES) y palabras clave (KEYWORD_LISTS)
+# que sustituye. Las listas de palabras clave se dan como (añadir, quitar)
+# sobre la lista original.
+SCENARIOS = {
+    'base': {'descripcion': 'Reglas del pipeline', 'reglas': {}, 'palabras_clave': {}},
+    'ventana_1h': {'descripcion': 'Emparejamiento SVA/SVB ±1 h', 'reglas': {'ventana_svb_sva_horas': 1},
+                   'palabras_clave': {}},
+    'ventana_4h': {'descripcion': 'Emparejamiento SVA/SVB ±4 h', 'reglas': {'ventana_svb_sva_horas': 4},
+                   'palabras_clave': {}},
+    'trauma_estricto': {'descripcion': 'Trauma sin términos ambiguos (caída, casual, choque, moto)', 'reglas': {},
+                        'palabras_clave': {'trauma': ([], ['caida', 'casual', 'choque', 'moto', 'motocicle'])}},
+    'trauma_amplio': {'descripcion': 'Trauma + golpe, intoxicación, electrocución', 'reglas': {},
+                      'palabras_clave': {'trauma': (['golpe', 'intoxica', 'electrocu'], [])}},
+    'respondiente_excluido': {'descripcion': 'Respondiente no identificado fuera de los grupos',
+                              'reglas': {'respondiente_desconocido': np.nan}, 'palabras_clave': {}},
+    'cpc_favorable': {'descripcion': 'Supervivientes sin CPC -> CPC 1 (mejor caso)',
+                      'reglas': {'cpc_superviviente_sin_dato': 1}, 'palabras_clave': {}},
+    'cpc_desfavorable': {'descripcion': 'Supervivientes sin CPC -> CPC 3 (peor caso)',
+                         'reglas': {'cpc_superviviente_sin_dato': 3}, 'palabras_clave': {}},
+}
+
+BASE_SCENARIO = 'base'
+DEFAULT_B = 1000
+
+# Estado del worker (se rellena con _init_worker)
+_STATE = {}
+
+
+def cleaning_dir():
+    return find_root() / 'data' / '2.Data_cleaning'
+
+
+def _import_cleaning():
+    """Módulos de limpieza (data/2.Data_cleaning usa imports entre ficheros hermanos)"""
+    path = str(cleaning_dir())
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    import cleaning
+    import deduplication
+    return cleaning, deduplication
+
+
+def _import_process_data():
+    """process_data.py (separación CPC válido / excluidos del notebook 5)"""
+    _import_cleaning()
+    import process_data
+    return process_data
+
+
+def manual_exclusions(path=None):
+    """
+    Casilla Excluido de la revisión manual (hoja que lee process_data.py)
+    indexada por NUM INFORME; None si la hoja no existe o no tiene la casilla
+    """
+    path = Path(path) if path else cleaning_dir() / _import_process_data().INPUT_FILE
+    if not path.exists():
+        return None
+    sheet = pd.read_csv(path, usecols=lambda c: c in ('NUM INFORME', 'Excluido'))
+    if 'Excluido' not in sheet.columns or 'NUM INFORME' not in sheet.columns:
+        return None
+    sheet = sheet.drop_duplicates('NUM INFORME')
+    return pd.Series(sheet['Excluido'].to_numpy(), index=sheet['NUM INFORME'].astype(str))
+
+
+def scenario_keywords(spec, keyword_lists):
+    """Listas de palabras clave del escenario a partir de los cambios (añadir, quitar)"""
+    keywords = {}
+    for name, (add, remove) in spec.get('palabras_clave', {}).items():
+        keywords[name] = [k for k in keyword_lists[name] if k not in remove] + [k for k in add
+                                                                               if k not in keyword_lists[name]]
+    return keywords
+
+
+def load_shared_input(raw_path):
+    """Lectura, validación y deduplicación del export (comunes a todos los escenarios)"""
+    cleaning, deduplication = _import_cleaning()
+    with redirect_stdout(io.StringIO()):
+        raw = cleaning.read_raw_data(str(raw_path))
+        data = deduplication.remove_duplicates(raw)
+    data.attrs = {}
+    return data
+
+
+def to_notebook_cohort(final_data, exclusions=None):
+    """
+    Salida de cleaning.py -> cohorte del notebook 5 (grupo_rcp, CPC_favorable...).
+    Pasa por el mismo paso que process_data.py: casilla Excluido
+    (exclusions, de manual_exclusions; sin ella nadie queda excluido) y
+    solo los registros con CPC válido que no están excluidos, sin las
+    columnas auxiliares, como en datos_con_cpc_valido.csv.
+    """
+    process_data = _import_process_data()
+    df = final_data.rename(columns=CLEANED_TO_NOTEBOOK).copy()
+    # RCP_TESTIGOS del notebook: tipo de respondiente o 'falso' si no hubo RCP de testigos
+    tipo = final_data['tipo_respondiente']
+    df['RCP_TESTIGOS'] = tipo.where(tipo.isna() | tipo.astype(str).str.strip().ne(''), 'falso').to_numpy()
+    df['Excluido'] = df['NUM INFORME'].astype(str).map(exclusions).to_numpy() if exclusions is not None else ''
+
+    valid, _ = process_data.split_datasets(process_data.add_derived_flags(df))
+    valid = valid.drop(columns=process_data.FLAG_COLUMNS + ['Excluido'])
+    # Enteros con NA -> float, como al leer el CSV publicado
+    valid = valid.astype({c: 'float64' for c in valid.columns if str(valid[c].dtype) == 'Int64'})
+    return prepare_cohort(valid.reset_index(drop=True))
+
+
+def _init_worker(data, boot_b, seed, exclusions=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    import warnings
+    warnings.filterwarnings('ignore')
+    _STATE.update({'datos': data, 'boot_b': boot_b, 'seed': seed, 'exclusiones': exclusions})
+
+
+def run_scenario(name, spec, data, boot_b=DEFAULT_B, seed=42, exclusions=None):
+    """Limpieza con las reglas del escenario y análisis principales; devuelve filas de la tabla"""
+    from .bootstrap import get_bootstrap
+    from .inference import tcpr_comparison
+    from .model_grid import run_model_grid
+
+    cleaning, _ = _import_cleaning()
+    keywords = scenario_keywords(spec, cleaning.KEYWORD_LISTS)
+    rules = spec.get('reglas', {})
+
+    with redirect_stdout(io.StringIO()):
+        merged = cleaning.merge_svb_sva(data.copy(), rules=rules)
+        processed = cleaning.process_data(merged, keywords=keywords, rules=rules)
+        final = cleaning.select_final_columns(processed)
+        df = to_notebook_cohort(final, exclusions)
+
+    boot = get_bootstrap(df, strata_col='grupo_rcp', B=boot_b, seed=seed)
+    grid, _ = run_model_grid(df, OUTCOMES, strata={}, n_jobs=1)
+    tcpr_terms = grid[grid['term'] == 'TCPR'].set_index('outcome')
+
+    base = {
+        'escenario': name,
+        'descripcion': spec.get('descripcion', ''),
+        'n_export': len(data),
+        'n_fusionados': len(merged),
+        'n_cohorte': len(df),
+        'n_TCPR': int((df['grupo_rcp'] == TCPR_GROUP).sum()),
+        'n_sin_grupo': int(df['grupo_rcp'].isna().sum()),
+    }
+    rows = []
+    for outcome, col in OUTCOMES.items():
+        crude = tcpr_comparison(boot, df, col) or {}
+        adjusted = tcpr_terms.loc[outcome] if outcome in tcpr_terms.index else None
+        rows.append({
+            **base,
+            'outcome': outcome,
+            'n_NoT': crude.get('n_NoT'),
+            'OR': crude.get('OR_TCPR_vs_NoT', np.nan),
+            'OR_LCL95': crude.get('LCL95', np.nan),
+            'OR_UCL95': crude.get('UCL95', np.nan),
+            'p_fisher': crude.get('p_fisher', np.nan),
+            'aOR': np.nan if adjusted is None else adjusted['aOR'],
+            'aOR_LCL95': np.nan if adjusted is None else adjusted['LCL95'],
+            'aOR_UCL95': np.nan if adjusted is None else adjusted['UCL95'],
+            'n_ajustado': np.nan if adjusted is None else adjusted['n'],
+        })
+    return rows
+
+
+def _run_task(name):
+    """Ejecuta un escenario en el worker; captura errores"""
+    tic = time.perf_counter()
+    try:
+        rows = run_scenario(name, SCENARIOS[name], _STATE['datos'], _STATE['boot_b'], _STATE['seed'],
+                            _STATE.get('exclusiones'))
+        error = None
+    except Exception:
+        rows, error = [], traceback.format_exc()
+    return {'escenario': name, 'filas': rows, 'error': error, 'tiempo_s': time.perf_counter() - tic}
+
+
+def comparison_table(rows):
+    """Tabla larga (escenario × outcome) con el cambio relativo del aOR frente al escenario base"""
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+    order = {name: i for i, name in enumerate(list(SCENARIOS) + list(OUTCOMES))}
+    table = table.sort_values(['outcome', 'escenario'], key=lambda s: s.map(order))
+    base = table[table['escenario'] == BASE_SCENARIO].set_index('outcome')['aOR']
+    table['cambio_aOR_pct'] = 100 * (table['aOR'] / table['outcome'].map(base) - 1)
+    return table.reset_index(drop=True)
+
+
+def summary_table(table):
+    """Una fila por escenario: tamaños de cohorte y OR/aOR [IC95%] por outcome"""
+    rows = []
+    for name, group in table.groupby('escenario', sort=False):
+        first = group.iloc[0]
+        row = {'escenario': name, 'n_cohorte': first['n_cohorte'], 'n_TCPR': first['n_TCPR']}
+        for r in group.itertuples():
+            row[f'OR {r.outcome}'] = f"{r.OR:.2f} [{r.OR_LCL95:.2f}-{r.OR_UCL95:.2f}]"
+            row[f'aOR {r.outcome}'] = f"{r.aOR:.2f} [{r.aOR_LCL95:.2f}-{r.aOR_UCL95:.2f}]"
+        rows.append(row)
+    order = {name: i for i, name in enumerate(SCENARIOS)}
+    return pd.DataFrame(rows).sort_values('escenario', key=lambda s: s.map(order)).reset_index(drop=True)
+
+
+def run_sensitivity(raw_path=None, scenarios=None, jobs=None, boot_b=DEFAULT_B, seed=42, out_dir=None,
+                    review_path=None):
+    """
+    Ejecuta los escenarios en un pool de procesos sobre la misma entrada
+    deduplicada y la misma casilla Excluido (review_path: hoja de revisión
+    manual; por defecto la de process_data.py). Devuelve la tabla
+    comparativa (larga) y la guarda en out_dir/sensibilidad_escenarios.csv.
+    """
+    scenarios = scenarios or list(SCENARIOS)
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Escenarios desconocidos: {unknown}. Opciones: {list(SCENARIOS)}")
+    raw_path = raw_path or find_root() / 'data' / '1.raw_imported' / 'rawdata_2year.csv'
+    out_dir = Path(out_dir) if out_dir else find_root() / 'final_noteboooks' / 'outputs_inferencia'
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    tic = time.perf_counter()
+    data = load_shared_input(raw_path)
+    print(f"📂 Entrada común: {len(data):,} registros validados y deduplicados ({time.perf_counter() - tic:.1f}s)")
+    exclusions = manual_exclusions(review_path)
+    if exclusions is None:
+        print("⚠️  Sin hoja de revisión manual: ningún registro con casilla Excluido")
+    else:
+        print(f"📋 Casilla Excluido de la revisión manual: {int(exclusions.notna().sum()):,} informes")
+
+    jobs = min(jobs or os.cpu_count() or 1, len(scenarios))
+    rows = []
+    if jobs == 1:
+        _init_worker(data, boot_b, seed, exclusions)
+        outputs = [_run_task(name) for name in scenarios]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(data, boot_b, seed, exclusions)) as pool:
+            futures = [pool.submit(_run_task, name) for name in scenarios]
+            outputs = [future.result() for future in as_completed(futures)]
+    for output in outputs:
+        status = '❌' if output['error'] else '✅'
+        print(f"{status} {output['escenario']} ({output['tiempo_s']:.1f}s)")
+        if output['error']:
+            print(output['error'])
+        rows.extend(output['filas'])
+
+    table = comparison_table(rows)
+    path = out_dir / 'sensibilidad_escenarios.csv'
+    table.to_csv(path, index=False)
+    print(f"💾 Tabla de sensibilidad guardada en: {path}")
+    return table
+
+
+def check_base_scenario(table, reference_path=None, rtol=1e-6, boot_b=20, seed=42):
+    """
+    Comprueba que el escenario base reproduce la cohorte del notebook 5
+    (por defecto cohort.DATA_FILENAME): n de la cohorte y de T-CPR, OR
+    crudo y aOR de la logística por outcome. Lanza AssertionError con las
+    diferencias.
+    """
+    from .bootstrap import get_bootstrap
+    from .inference import tcpr_comparison
+    from .model_grid import run_model_grid
+
+    reference = load_cohort(reference_path)
+    boot = get_bootstrap(reference, strata_col='grupo_rcp', B=boot_b, seed=seed)
+    grid, _ = run_model_grid(reference, OUTCOMES, strata={}, n_jobs=1)
+    tcpr_terms = grid[grid['term'] == 'TCPR'].set_index('outcome')
+    base = table[table['escenario'] == BASE_SCENARIO].set_index('outcome')
+    if base.empty:
+        raise AssertionError('La tabla no tiene el escenario base')
+
+    problems = []
+    expected = {'n_cohorte': len(reference), 'n_TCPR': int((reference['grupo_rcp'] == TCPR_GROUP).sum())}
+    for key, value in expected.items():
+        if int(base[key].iloc[0]) != value:
+            problems.append(f"{key}: base {int(base[key].iloc[0])} vs notebook 5 {value}")
+    for outcome, col in OUTCOMES.items():
+        crude = tcpr_comparison(boot, reference, col) or {}
+        checks = {'OR': crude.get('OR_TCPR_vs_NoT', np.nan),
+                  'aOR': tcpr_terms.loc[outcome, 'aOR'] if outcome in tcpr_terms.index else np.nan}
+        for key, value in checks.items():
+            got = base.loc[outcome, key] if outcome in base.index else np.nan
+            if not np.isclose(got, value, rtol=rtol, equal_nan=True):
+                problems.append(f"{key} {outcome}: base {got:.6g} vs notebook 5 {value:.6g}")
+    if problems:
+        raise AssertionError('El escenario base no reproduce el notebook 5:\n  ' + '\n  '.join(problems))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Análisis de sensibilidad sobre las reglas de limpieza')
+    parser.add_argument('--raw', help='Export crudo (por defecto data/1.raw_imported/rawdata_2year.csv)')
+    parser.add_argument('--escenarios', nargs='+', choices=list(SCENARIOS), help='Escenarios (por defecto, todos)')
+    parser.add_argument('--jobs', type=int, help='Procesos en paralelo (por defecto, núcleos disponibles)')
+    parser.add_argument('--boot', type=int, default=DEFAULT_B, help='Réplicas bootstrap del OR (B)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out-dir', help='Directorio de salida (por defecto outputs_inferencia)')
+    parser.add_argument('--revision', help='Hoja de revisión manual con la casilla Excluido (por defecto la de process_data.py)')
+    parser.add_argument('--referencia', help=f'Cohorte del notebook 5 para verificar el escenario base (por defecto {DATA_FILENAME})')
+    args = parser.parse_args(argv)
+
+    scenarios = args.escenarios or list(SCENARIOS)
+    if BASE_SCENARIO not in scenarios:
+        scenarios = [BASE_SCENARIO] + scenarios
+    table = run_sensitivity(args.raw, scenarios, args.jobs, args.boot, args.seed, args.out_dir, args.revision)
+    if table.empty:
+        return 1
+    print("\n📊 SENSIBILIDAD: COHORTE Y OR T-CPR vs NO T-CPR [IC95%]")
+    print(summary_table(table).to_string(index=False))
+
+    reference = Path(args.referencia) if args.referencia else find_root() / 'data' / '3.cleaned_data' / DATA_FILENAME
+    if not reference.exists():
+        print(f"⚠️  Sin cohorte del notebook 5 ({reference}): no se verifica el escenario base")
+        return 0
+    try:
+        check_base_scenario(table, reference)
+    except AssertionError as exc:
+        print(f"❌ {exc}")
+        return 1
+    print("✅ El escenario base reproduce la cohorte del notebook 5 (n, OR y aOR)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+Búsqueda de subgrupos con efecto heterogéneo de la T-CPR.
+
+En lugar de estratificar a mano variable a variable, se recorren todas las
+conjunciones de hasta 3 condiciones (edad, sexo, ritmo, tipo de
+respondiente, tercil de llegada, mes...) y se calcula en cada una el OR
+T-CPR vs no T-CPR de cada outcome:
+
+1. Cada nivel de cada variable (SUBGROUP_FEATURES) se codifica como bitset
+   empaquetado sobre los registros (1 bit por registro, palabras uint64).
+2. Los subgrupos se generan por niveles de profundidad: un hijo es el AND
+   de su padre con un nivel de una variable posterior (sin repetir
+   variable). Los subgrupos con menos de min_arm casos en algún brazo se
+   podan y no generan hijos (el tamaño solo puede bajar al añadir
+   condiciones).
+3. Las tablas 2×2 de todos los outcomes salen de popcounts del bitset del
+   subgrupo AND las máscaras T-CPR/no T-CPR × válido/evento, para todos los
+   candidatos de una profundidad a la vez (np.bitwise_count, por bloques).
+4. Por subgrupo: OR con IC95% (Woolf, +0.5 si hay celdas a 0), p de Wald,
+   OR condicional con IC95% exacto (Cornfield/Fisher o mid-p, todas las
+   tablas a la vez con rcp_analysis.exact), p de interacción frente al complemento (¿el OR del subgrupo difiere del
+   resto?) y corrección por multiplicidad (Benjamini-Hochberg y Bonferroni)
+   sobre todos los subgrupos evaluados de cada outcome.
+
+Uso: python -m rcp_analysis.subgroups [--data CSV] [--profundidad 3] [--min-arm 15] [--top 20] [--mid-p]
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .cohort import OUTCOMES, RCP_GROUPS, TCPR_GROUP, find_root, load_cohort
+from .exact import conditional_or_ci
+
+MESES = ['ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic']
+EDAD_CORTES = [-np.inf, 50, 65, 80, np.inf]
+EDAD_BANDAS = ['<50', '50-64', '65-79', '≥80']
+
+DEFAULT_DEPTH = 3
+DEFAULT_MIN_ARM = 15
+
+
+def _edad_banda(df):
+    edad = pd.to_numeric(df['EDAD'], errors='coerce')
+    return pd.cut(edad, EDAD_CORTES, labels=EDAD_BANDAS, right=False).astype(object)
+
+
+def _sexo(df):
+    return df['SEXO'].where(df['SEXO'].isin(['Masculino', 'Femenino']))
+
+
+def _ritmo(df):
+    ritmo = pd.to_numeric(df['Desfibrilable_inicial'], errors='coerce')
+    return ritmo.map({1: 'Desfibrilable', 0: 'No desfibrilable'})
+
+
+def _respondiente(df):
+    testigos = df['RCP_TESTIGOS'].astype(str).str.strip().str.lower()
+    return testigos.where(df['RCP_TESTIGOS'].notna() & ~testigos.isin(['', 'nan']))
+
+
+def _llegada_tercil(df):
+    llegada = pd.to_numeric(df['Tiempo_llegada'], errors='coerce')
+    cortes = llegada.quantile([1 / 3, 2 / 3]).to_numpy()
+    labels = np.select([llegada <= cortes[0], llegada <= cortes[1]],
+                       [f'T1 (≤{cortes[0]:.0f}s)', f'T2 (≤{cortes[1]:.0f}s)'], f'T3 (>{cortes[1]:.0f}s)')
+    return pd.Series(labels, index=df.index).where(llegada.notna())
+
+
+def _mes(df):
+    fecha = pd.to_datetime(df['FECHA_LLAMADA'], errors='coerce', dayfirst=True)
+    return fecha.dt.month.map(lambda m: MESES[int(m) - 1] if pd.notna(m) else np.nan)
+
+
+# Variable -> función que devuelve la etiqueta de cada registro (NaN = sin dato).
+# Como en model_grid.STRATA, las etiquetas se calculan sobre la cohorte completa.
+SUBGROUP_FEATURES = {
+    'edad': (_edad_banda, 'EDAD'),
+    'sexo': (_sexo, 'SEXO'),
+    'ritmo': (_ritmo, 'Desfibrilable_inicial'),
+    'respondiente': (_respondiente, 'RCP_TESTIGOS'),
+    'llegada': (_llegada_tercil, 'Tiempo_llegada'),
+    'mes': (_mes, 'FECHA_LLAMADA'),
+}
+
+
+def pack(mask):
+    """Máscara booleana -> bitset (uint64, 1 bit por registro)"""
+    packed = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+    padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+def build_bitsets(df, outcomes, features=None):
+    """
+    Bitsets de cada nivel y máscaras de las tablas 2×2.
+
+    Devuelve dict con 'niveles' (matriz L × palabras), 'variable' (índice de
+    variable de cada nivel), 'etiquetas' ('variable=nivel'), 'variables',
+    'mascaras' (por outcome: T-CPR válido, T-CPR evento, no T-CPR válido,
+    no T-CPR evento -> matriz 4·O × palabras) y 'brazos' (T-CPR, no T-CPR)
+    para la poda.
+    """
+    features = SUBGROUP_FEATURES if features is None else features
+    in_population = df['grupo_rcp'].isin(RCP_GROUPS).to_numpy()
+    tcpr = (df['grupo_rcp'] == TCPR_GROUP).to_numpy()
+    no_tcpr = in_population & ~tcpr
+
+    masks = []
+    for col in outcomes.values():
+        y = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+        valid = ~np.isnan(y)
+        event = valid & (y == 1)
+        masks.extend([tcpr & valid, tcpr & event, no_tcpr & valid, no_tcpr & event])
+
+    bitsets, variable, labels, variables = [], [], [], []
+    for name, (func, column) in features.items():
+        if column not in df.columns:
+            continue
+        values = func(df)
+        levels = sorted(values.dropna().unique(), key=str)
+        if len(levels) < 2:
+            continue
+        variables.append(name)
+        for level in levels:
+            bitsets.append(pack((values == level).to_numpy() & in_population))
+            variable.append(len(variables) - 1)
+            labels.append(f'{name}={level}')
+
+    return {
+        'niveles': np.vstack(bitsets),
+        'variable': np.array(variable),
+        'etiquetas': labels,
+        'variables': variables,
+        'mascaras': np.vstack([pack(m) for m in masks]),
+        'brazos': np.vstack([pack(tcpr), pack(no_tcpr)]),
+        'outcomes': list(outcomes),
+        'n': len(df),
+    }
+
+
+if hasattr(np, 'bitwise_count'):
+    _bitcount = np.bitwise_count
+else:  # numpy < 2.0: tabla de 256 valores sobre los bytes
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _bitcount(words):
+        return _BYTE_COUNTS[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint64)
+
+
+def _popcounts(sets, masks, max_words=1 << 22):
+    """popcount(sets[i] AND masks[j]) para todos los pares -> matriz K × M (por bloques de ~32 MB)"""
+    out = np.empty((len(sets), len(masks)), dtype=np.int64)
+    chunk = max(1, max_words // max(masks.size, 1))
+    for start in range(0, len(sets), chunk):
+        block = sets[start:start + chunk]
+        out[start:start + chunk] = _bitcount(block[:, None, :] & masks[None, :, :]).sum(axis=2)
+    return out
+
+
+def enumerate_subgroups(bits, max_depth=DEFAULT_DEPTH, min_arm=DEFAULT_MIN_ARM):
+    """
+    Genera los subgrupos por profundidad con poda por tamaño de brazo.
+    Devuelve (combinaciones [tuplas de niveles], matriz de conteos K × 4·O).
+    """
+    levels, level_var = bits['niveles'], bits['variable']
+    combos, counts = [], []
+
+    # Profundidad 1
+    frontier_sets = levels
+    frontier_combos = np.arange(len(levels))[:, None]
+    for depth in range(1, max_depth + 1):
+        if depth > 1:
+            # Hijos: padre AND nivel de una variable posterior a la última del padre
+            last_var = level_var[frontier_combos[:, -1]]
+            parent, child = np.nonzero(level_var[None, :] > last_var[:, None])
+            if not len(parent):
+                break
+            frontier_sets = frontier_sets[parent] & levels[child]
+            frontier_combos = np.column_stack([frontier_combos[parent], child])
+        arms = _popcounts(frontier_sets, bits['brazos'])
+        keep = (arms >= min_arm).all(axis=1)
+        frontier_sets, frontier_combos = frontier_sets[keep], frontier_combos[keep]
+        if not len(frontier_combos):
+            break
+        combos.extend(tuple(c) for c in frontier_combos)
+        counts.append(_popcounts(frontier_sets, bits['mascaras']))
+    return combos, (np.vstack(counts) if counts else np.empty((0, len(bits['mascaras'])), dtype=np.int64))
+
+
+def _log_or(a, b, c, d):
+    """log OR y EE de Woolf (+0.5 en las tablas con alguna celda a 0)"""
+    cells = np.stack([a, b, c, d]).astype(float)
+    cells += 0.5 * (cells == 0).any(axis=0)
+    log_or = np.log(cells[0] * cells[3] / (cells[1] * cells[2]))
+    se = np.sqrt((1.0 / cells).sum(axis=0))
+    return log_or, se
+
+
+def benjamini_hochberg(p):
+    """q-valores de Benjamini-Hochberg (NaN se ignoran)"""
+    p = np.asarray(p, dtype=float)
+    q = np.full_like(p, np.nan)
+    ok = ~np.isnan(p)
+    m = ok.sum()
+    if not m:
+        return q
+    order = np.argsort(p[ok])
+    ranked = p[ok][order] * m / np.arange(1, m + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    values = np.empty(m)
+    values[order] = np.minimum(ranked, 1.0)
+    q[ok] = values
+    return q
+
+
+def score_subgroups(bits, combos, counts, mid_p=False):
+    """
+    Tabla de subgrupos × outcomes con OR (Woolf y condicional exacto),
+    interacción frente al complemento y p corregidas
+    """
+    totals = _bitcount(bits['mascaras']).sum(axis=1).astype(np.int64)
+    labels = np.array(bits['etiquetas'], dtype=object)
+    names = [' & '.join(labels[list(c)]) for c in combos]
+    depth = [len(c) for c in combos]
+
+    tables = []
+    for o, outcome in enumerate(bits['outcomes']):
+        n_t, e_t, n_n, e_n = (counts[:, 4 * o + k] for k in range(4))
+        tot_n_t, tot_e_t, tot_n_n, tot_e_n = totals[4 * o:4 * o + 4]
+        log_or, se = _log_or(e_t, n_t - e_t, e_n, n_n - e_n)
+        or_cond, lcl_exact, ucl_exact = conditional_or_ci(e_t, n_t - e_t, e_n, n_n - e_n, mid_p=mid_p)
+        # Complemento dentro de la población T-CPR / no T-CPR
+        log_or_c, se_c = _log_or(tot_e_t - e_t, (tot_n_t - n_t) - (tot_e_t - e_t),
+                                 tot_e_n - e_n, (tot_n_n - n_n) - (tot_e_n - e_n))
+        z = log_or / se
+        z_int = (log_or - log_or_c) / np.sqrt(se ** 2 + se_c ** 2)
+        p = 2 * stats.norm.sf(np.abs(z))
+        p_int = 2 * stats.norm.sf(np.abs(z_int))
+        m = len(p)
+        tables.append(pd.DataFrame({
+            'outcome': outcome,
+            'subgrupo': names,
+            'profundidad': depth,
+            'n_TCPR': n_t,
+            'eventos_TCPR': e_t,
+            'n_NoT': n_n,
+            'eventos_NoT': e_n,
+            'OR': np.exp(log_or),
+            'LCL95': np.exp(log_or - 1.959964 * se),
+            'UCL95': np.exp(log_or + 1.959964 * se),
+            'OR_condicional': or_cond,
+            'LCL95_exacto': lcl_exact,
+            'UCL95_exacto': ucl_exact,
+            'p': p,
+            'q_BH': benjamini_hochberg(p),
+            'p_bonferroni': np.minimum(p * m, 1.0),
+            'OR_complemento': np.exp(log_or_c),
+            'ratio_OR': np.exp(log_or - log_or_c),
+            'p_interaccion': p_int,
+            'q_interaccion': benjamini_hochberg(p_int),
+        }))
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+
+def scan_subgroups(df, outcomes=None, max_depth=DEFAULT_DEPTH, min_arm=DEFAULT_MIN_ARM, features=None,
+                   sort_by='efecto', mid_p=False):
+    """
+    Subgrupos de hasta max_depth condiciones con al menos min_arm casos en
+    cada brazo, ordenados por tamaño de efecto (|log OR|, 'efecto'), por
+    heterogeneidad frente al complemento ('interaccion') o por p ('p').
+    mid_p: IC exacto mid-p en lugar de Cornfield/Fisher.
+    """
+    outcomes = OUTCOMES if outcomes is None else outcomes
+    tic = time.perf_counter()
+    bits = build_bitsets(df, outcomes, features)
+    combos, counts = enumerate_subgroups(bits, max_depth, min_arm)
+    table = score_subgroups(bits, combos, counts, mid_p=mid_p)
+    table.attrs['subgrupos'] = len(combos)
+    table.attrs['niveles'] = len(bits['etiquetas'])
+    table.attrs['tiempo_s'] = time.perf_counter() - tic
+    if table.empty:
+        return table
+    key = {'efecto': lambda t: -np.abs(np.log(t['OR'])),
+           'interaccion': lambda t: t['p_interaccion'],
+           'p': lambda t: t['p']}[sort_by]
+    table = table.assign(_orden=key(table)).sort_values(['outcome', '_orden']).drop(columns='_orden')
+    return table.reset_index(drop=True)
+
+
+def run_subgroup_scan(df, outcomes, out_dir, max_depth=DEFAULT_DEPTH, min_arm=DEFAULT_MIN_ARM, sort_by='efecto',
+                      mid_p=False):
+    """Guarda subgrupos_tcpr.csv (todos los subgrupos evaluados) y devuelve la tabla"""
+    table = scan_subgroups(df, outcomes, max_depth, min_arm, sort_by=sort_by, mid_p=mid_p)
+    table.to_csv(Path(out_dir) / 'subgrupos_tcpr.csv', index=False)
+    print(f"🔎 {table.attrs.get('subgrupos', 0):,} subgrupos ({table.attrs.get('niveles', 0)} niveles, "
+          f"profundidad ≤{max_depth}) evaluados en {table.attrs.get('tiempo_s', 0):.2f}s")
+    return table
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Búsqueda de subgrupos con efecto heterogéneo de la T-CPR')
+    parser.add_argument('--data', help='CSV de la cohorte (por defecto el del notebook 5)')
+    parser.add_argument('--profundidad', type=int, default=DEFAULT_DEPTH, help='Condiciones máximas por subgrupo')
+    parser.add_argument('--min-arm', type=int, default=DEFAULT_MIN_ARM, help='Casos mínimos en cada brazo')
+    parser.add_argument('--orden', choices=['efecto', 'interaccion', 'p'], default='efecto')
+    parser.add_argument('--top', type=int, default=15, help='Subgrupos a mostrar por outcome')
+    parser.add_argument('--mid-p', action='store_true', help='IC exacto mid-p en lugar de Cornfield/Fisher')
+    parser.add_argument('--out-dir', help='Directorio de salida (por defecto outputs_inferencia)')
+    args = parser.parse_args(argv)
+
+    df = load_cohort(args.data)
+    out_dir = Path(args.out_dir) if args.out_dir else find_root() / 'final_noteboooks' / 'outputs_inferencia'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    table = run_subgroup_scan(df, OUTCOMES, out_dir, args.profundidad, args.min_arm, sort_by=args.orden,
+                              mid_p=args.mid_p)
+    if table.empty:
+        return 1
+    columns = ['subgrupo', 'n_TCPR', 'n_NoT', 'OR', 'LCL95_exacto', 'UCL95_exacto', 'q_BH', 'ratio_OR',
+               'q_interaccion']
+    for outcome, rows in table.groupby('outcome', sort=False):
+        print(f"\n📊 {outcome}: top {args.top} por {args.orden}")
+        print(rows[columns].head(args.top).round(3).to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())